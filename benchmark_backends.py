@@ -0,0 +1,74 @@
+"""Compares the speed of the PDF backends of the Sigma-Aldrich parser, and checks that they parse
+every sheet to the same output. Tables and pictograms are left out, as backends only lay out text.
+
+    python benchmark_backends.py "msds/*.pdf" -n 3
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import sys
+from time import perf_counter
+
+from pdfminer.layout import LAParams
+
+from tungsten.parsers.pdf_backend import BACKENDS, PdfminerBackend
+from tungsten.parsers.supplier.sigma_aldrich.sds_parser import (
+    SigmaAldrichSdsParser
+)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("inputs", nargs="*", default=["msds/*.pdf"],
+                            help="PDF files or glob patterns")
+    arg_parser.add_argument("-n", "--repeat", type=int, default=3,
+                            help="parses per file and backend, the fastest is reported")
+    args = arg_parser.parse_args()
+
+    paths = sorted({path for pattern in args.inputs
+                    for path in glob.glob(pattern, recursive=True)})
+    if not len(paths):
+        arg_parser.error("no PDF files match the inputs")
+
+    parsers: dict[str, SigmaAldrichSdsParser] = {}
+    for name, backend_class in BACKENDS.items():
+        parser = SigmaAldrichSdsParser(backend=backend_class(LAParams(line_margin=0)))
+        parser.injectors.clear()
+        parsers[name] = parser
+
+    totals = dict.fromkeys(parsers, 0.0)
+    mismatches = []
+    print("file".ljust(40) + "".join(name.rjust(12) for name in parsers) + "   output")
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        seconds: dict[str, float] = {}
+        outputs: dict[str, str] = {}
+        for name, parser in parsers.items():
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = perf_counter()
+                sheet = parser.parse_to_ghs_sds(data)
+                best = min(best, perf_counter() - start)
+            seconds[name] = best
+            outputs[name] = sheet.dumps()
+            totals[name] += best
+        identical = all(output == outputs[PdfminerBackend.name] for output in outputs.values())
+        if not identical:
+            mismatches.append(path)
+        print(path[-40:].ljust(40) + "".join(f"{seconds[name]:12.3f}" for name in parsers)
+              + ("   identical" if identical else "   DIFFERENT"))
+
+    print("total".ljust(40) + "".join(f"{totals[name]:12.3f}" for name in parsers))
+    reference = totals[PdfminerBackend.name]
+    for name, total in totals.items():
+        if name != PdfminerBackend.name and total:
+            print(f"{name}: {reference / total:.2f}x the speed of {PdfminerBackend.name}")
+    if len(mismatches):
+        print(f"{len(mismatches)} file(s) parsed differently: {', '.join(mismatches)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
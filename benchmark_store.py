@@ -0,0 +1,54 @@
+"""Measures the ingestion throughput of SdsStore, in sheets per second. The sheets are parsed
+once, then ingested `--copies` times each under distinct hashes into a new database.
+
+    python benchmark_store.py "msds/*.pdf" --copies 100
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+import tempfile
+from time import perf_counter
+
+from tungsten.corpus.store import SdsStore, content_hash
+from tungsten.parsers.supplier.sigma_aldrich.sds_parser import (
+    SigmaAldrichSdsParser
+)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("inputs", nargs="*", default=["msds/*.pdf"],
+                            help="PDF files or glob patterns")
+    arg_parser.add_argument("--copies", type=int, default=100,
+                            help="times each sheet is ingested, under distinct hashes")
+    arg_parser.add_argument("--batch-size", type=int, default=500,
+                            help="sheets per ingestion transaction")
+    args = arg_parser.parse_args()
+
+    paths = sorted({path for pattern in args.inputs
+                    for path in glob.glob(pattern, recursive=True)})
+    if not len(paths):
+        arg_parser.error("no PDF files match the inputs")
+
+    parser = SigmaAldrichSdsParser()
+    sheets = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        sheets.append((content_hash(data), parser.parse_to_ghs_sds(data)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SdsStore(os.path.join(directory, "store.sqlite"))
+        start = perf_counter()
+        count = store.ingest(((f"{sheet_hash}:{copy}", sheet)
+                              for copy in range(args.copies) for sheet_hash, sheet in sheets),
+                             args.batch_size)
+        seconds = perf_counter() - start
+        store.close()
+    print(f"ingested {count} sheets in {seconds:.3f} s: {count / seconds:.0f} sheets/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+from typing import Callable
+
+import pytest
+
+# Sections of a small Sigma-Aldrich style sheet, one page each
+SHEET_PAGES = [
+    ["SECTION 1: Identification of the substance/mixture and of the company",
+     "1.1 Product identifiers",
+     "Product name : Acetone",
+     "Product Number : 179124",
+     "Brand : Sigma-Aldrich",
+     "CAS-No. : 67-64-1"],
+    ["SECTION 2: Hazards identification",
+     "2.1 Classification of the substance or mixture",
+     "Flammable liquids (Category 2), H225",
+     "2.2 GHS Label elements, including precautionary statements",
+     "Signal word Danger"],
+    ["SECTION 3: Composition/information on ingredients",
+     "3.1 Substances",
+     "Formula : C3H6O"],
+    ["SECTION 4: First aid measures",
+     "4.1 Description of first-aid measures",
+     "If inhaled: move to fresh air."],
+]
+
+
+def make_pdf(pages: list[list[str]]) -> bytes:
+    """Returns a PDF with a page per list of lines, in Helvetica from the top left."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        content = b"".join(
+            b"BT /F1 10 Tf 40 %d Td (%s) Tj ET\n"
+            % (780 - 16 * i, line.replace("(", "\\(").replace(")", "\\)").encode())
+            for i, line in enumerate(lines))
+        objects.append(b"<< /Length %d >>stream\n%sendstream" % (len(content), content))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+                       % len(objects))
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" \
+        % (len(objects) + 1, xref)
+    return data
+
+
+@pytest.fixture
+def pdf_builder() -> Callable[[list[list[str]]], bytes]:
+    return make_pdf
+
+
+@pytest.fixture
+def sheet_pages() -> list[list[str]]:
+    return [list(lines) for lines in SHEET_PAGES]
+
+
+@pytest.fixture
+def sheet_pdf() -> bytes:
+    return make_pdf(SHEET_PAGES)
+
+
+@pytest.fixture
+def no_tables(tmp_path, monkeypatch):
+    """Puts a stand-in for tabula-java, which finds no tables, first on the PATH."""
+    java = tmp_path / "bin" / "java"
+    java.parent.mkdir()
+    java.write_text("#!/bin/sh\necho '[]'\n")
+    java.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{java.parent}{os.pathsep}{os.environ['PATH']}")
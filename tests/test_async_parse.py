@@ -0,0 +1,43 @@
+import asyncio
+import os
+
+import pytest
+
+from tungsten import SigmaAldrichSdsParser, TableCache
+
+
+def test_parse_many_async_matches_sync_parses(sheet_pdf, sheet_pages, pdf_builder, no_tables):
+    pdfs = [sheet_pdf]
+    for product_name in ("Ethanol", "Methanol"):
+        sheet_pages[0][2] = f"Product name : {product_name}"
+        pdfs.append(pdf_builder(sheet_pages))
+    parser = SigmaAldrichSdsParser(table_cache=TableCache())
+    sheets = asyncio.run(parser.parse_many_async(pdfs, max_concurrency=2))
+    assert [sheet.dumps() for sheet in sheets] == \
+        [parser.parse_to_ghs_sds(pdf).dumps() for pdf in pdfs]
+
+
+def test_cancelling_kills_tabula(sheet_pdf, tmp_path, monkeypatch):
+    # A tabula-java that records its process id and hangs
+    pid_path = tmp_path / "java.pid"
+    java = tmp_path / "bin" / "java"
+    java.parent.mkdir()
+    java.write_text(f"#!/bin/sh\necho $$ > {pid_path}.tmp\nmv {pid_path}.tmp {pid_path}\n"
+                    f"exec sleep 60\n")
+    java.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{java.parent}{os.pathsep}{os.environ['PATH']}")
+
+    async def cancel_once_started() -> None:
+        parse = asyncio.create_task(SigmaAldrichSdsParser(table_cache=TableCache())
+                                    .parse_to_ghs_sds_async(sheet_pdf))
+        for _ in range(1000):
+            if pid_path.exists():
+                break
+            await asyncio.sleep(0.01)
+        parse.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await parse
+
+    asyncio.run(cancel_once_started())
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_path.read_text()), 0)
@@ -0,0 +1,46 @@
+import threading
+
+from tungsten import SigmaAldrichSdsParser
+from tungsten.batch.pipeline import BatchPipeline
+from tungsten.batch.runner import BatchRunner
+from tungsten.batch.task import BatchTask
+from tungsten.parsers.registry import ParserRegistry
+
+
+def write_sheets(directory, sheet_pages, pdf_builder, count: int) -> list[str]:
+    """Writes `count` sheets of different products, returning their paths."""
+    directory.mkdir()
+    paths = []
+    for i in range(count):
+        sheet_pages[0][3] = f"Product Number : {179124 + i}"
+        path = directory / f"{i}.pdf"
+        path.write_bytes(pdf_builder(sheet_pages))
+        paths.append(str(path))
+    return paths
+
+
+def test_pipeline_writes_the_same_outputs_as_pool(tmp_path, sheet_pages, pdf_builder,
+                                                  no_tables):
+    paths = write_sheets(tmp_path / "in", sheet_pages, pdf_builder, 4)
+    BatchRunner(tmp_path / "pool", workers=2).run(paths)
+    summary = BatchRunner(tmp_path / "pipeline", workers=2, pipeline=True).run(paths)
+    assert len(summary.succeeded) == len(paths)
+    for kind in ("output", "mapped"):
+        outputs = sorted((tmp_path / "pool" / kind).iterdir())
+        assert [path.name for path in outputs] == [f"{i}.pdf.json" for i in range(len(paths))]
+        for path in outputs:
+            assert (tmp_path / "pipeline" / kind / path.name).read_bytes() == path.read_bytes()
+
+
+def test_stopping_early_shuts_stages_down(tmp_path, sheet_pages, pdf_builder, no_tables):
+    paths = write_sheets(tmp_path / "in", sheet_pages, pdf_builder, 8)
+    tasks = [BatchTask(path, str(tmp_path / f"{i}.json"), str(tmp_path / f"{i}.mapped.json"))
+             for i, path in enumerate(paths)]
+    before = set(threading.enumerate())
+    pipeline = BatchPipeline(ParserRegistry(fallback=SigmaAldrichSdsParser), workers=1)
+    results = pipeline.run(tasks)
+    assert next(results).status == "ok"
+    results.close()
+    assert set(threading.enumerate()) - before == set()
+    # A stopped pipeline can run again
+    assert len(list(pipeline.run(tasks))) == len(tasks)
@@ -0,0 +1,60 @@
+import pytest
+
+from tungsten.batch.runner import BatchRunner
+
+
+def test_resume_keeps_output_paths(tmp_path, sheet_pdf, no_tables):
+    inputs = tmp_path / "in"
+    for name, data in (("a/x.pdf", sheet_pdf), ("b/y.pdf", b"not a PDF")):
+        (inputs / name).parent.mkdir(parents=True)
+        (inputs / name).write_bytes(data)
+    paths = [str(inputs / "a/x.pdf"), str(inputs / "b/y.pdf")]
+    output = tmp_path / "out"
+
+    summary = BatchRunner(output, workers=1).run(paths)
+    assert len(summary.succeeded) == 1 and len(summary.failed) == 1
+    # The finished file is left out of the retry, but not out of the root of the outputs
+    (inputs / "b/y.pdf").write_bytes(sheet_pdf)
+    summary = BatchRunner(output, workers=1, retry_errors=True).run(paths)
+    assert len(summary.succeeded) == 1 and summary.skipped == 1
+    assert (output / "output/a/x.pdf.json").exists()
+    assert (output / "output/b/y.pdf.json").exists()
+    assert (output / "mapped/b/y.pdf.json").exists()
+
+
+def test_resume_skips_duplicates_of_finished_files(tmp_path, sheet_pdf, no_tables):
+    paths = [str(tmp_path / "x.pdf"), str(tmp_path / "y.pdf")]
+    for path in paths:
+        with open(path, "wb") as f:
+            f.write(sheet_pdf)
+    output = tmp_path / "out"
+
+    BatchRunner(output, workers=1, near_duplicates="skip").run(paths[:1])
+    summary = BatchRunner(output, workers=1, near_duplicates="skip").run(paths)
+    assert [(result.path, result.status, result.duplicate_of)
+            for result in summary.results] == [(paths[1], "duplicate", paths[0])]
+
+
+@pytest.mark.parametrize("near_duplicates", ["skip", "defer"])
+def test_resume_compares_pending_files_with_finished_originals(
+        tmp_path, sheet_pdf, sheet_pages, pdf_builder, no_tables, near_duplicates):
+    sheet_pages[1][4] = "Signal word Warning"
+    paths = [str(tmp_path / name) for name in ("original.pdf", "near.pdf", "distinct.pdf")]
+    for path, data in zip(paths, (sheet_pdf, pdf_builder(sheet_pages),
+                                  pdf_builder([["SECTION 1: Identification",
+                                                "Product name : Sodium chloride"]]))):
+        with open(path, "wb") as f:
+            f.write(data)
+    output = tmp_path / "out"
+
+    BatchRunner(output, workers=1, near_duplicates=near_duplicates).run(paths[:1])
+    summary = BatchRunner(output, workers=1, near_duplicates=near_duplicates).run(paths)
+    assert summary.skipped == 1
+    if near_duplicates == "skip":
+        assert [(result.path, result.status, result.duplicate_of)
+                for result in summary.results] == \
+            [(paths[1], "duplicate", paths[0]), (paths[2], "ok", None)]
+    else:
+        # Deferred near-duplicates are parsed after the other files
+        assert [(result.path, result.status) for result in summary.results] == \
+            [(paths[2], "ok"), (paths[1], "ok")]
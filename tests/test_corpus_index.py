@@ -0,0 +1,50 @@
+from tungsten.corpus.index import CorpusIndex, Term
+from tungsten.globally_harmonized_system.safety_data_sheet import (
+    GhsSafetyDataSheet,
+    GhsSdsItem,
+    GhsSdsItemType,
+    GhsSdsSection,
+    GhsSdsSectionTitle,
+    GhsSdsSubsection,
+    GhsSdsSubsectionTitle
+)
+from tungsten.parsers.field_parse import SdsQueryFieldName
+
+CAS = SdsQueryFieldName.CAS_NUMBER
+PICTOGRAM = SdsQueryFieldName.PICTOGRAM
+
+
+def identified_sheet(product_number: str, cas_number: str,
+                     pictograms: list[str]) -> GhsSafetyDataSheet:
+    """Returns a sheet holding only its product identifiers and pictograms."""
+    identifiers = GhsSdsSubsection(GhsSdsSubsectionTitle.GHS_PRODUCT_IDENTIFIER, [
+        GhsSdsItem(GhsSdsItemType.FIELD, "Product Number", [f": {product_number}"]),
+        GhsSdsItem(GhsSdsItemType.FIELD, "CAS-No.", [f": {cas_number}"]),
+    ], "1.1 Product identifiers")
+    return GhsSafetyDataSheet("default", {"pictograms": pictograms},
+                              [GhsSdsSection(GhsSdsSectionTitle.IDENTIFICATION, [identifiers])])
+
+
+def test_queries_across_segments_and_reopening(tmp_path):
+    index = CorpusIndex(tmp_path)
+    index.add("acetone", identified_sheet("179124", "67-64-1", ["PICT_GHS02_FLAMMABLE"]))
+    index.add("ethanol", identified_sheet("E7023", "64-17-5", ["PICT_GHS02_FLAMMABLE"]))
+    index.flush()
+    index.add("acetone-2", identified_sheet("650501", " 67-64-1 ", ["PICT_GHS02_FLAMMABLE",
+                                                                    "PICT_GHS07_HARMFUL"]))
+    assert index.search(Term(CAS, "67-64-1")) == ["acetone", "acetone-2"]
+    flammable = Term(PICTOGRAM, "pict_ghs02_flammable")
+    assert index.search(flammable & ~Term(CAS, "67-64-1")) == ["ethanol"]
+    assert index.search(Term(CAS, "64-17-5") | Term(PICTOGRAM, "PICT_GHS07_HARMFUL")) == \
+        ["ethanol", "acetone-2"]
+
+    # Sheets that were not flushed are not persisted
+    assert CorpusIndex(tmp_path).search(flammable) == ["acetone", "ethanol"]
+    index.flush()
+    index.compact()
+    reopened = CorpusIndex(tmp_path)
+    assert len(reopened) == 3
+    assert reopened.search(flammable) == ["acetone", "ethanol", "acetone-2"]
+    assert reopened.search(Term(CAS, "67-64-1")) == ["acetone", "acetone-2"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == \
+        ["manifest.json", "segment-00002.lexicon.json", "segment-00002.postings"]
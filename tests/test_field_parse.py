@@ -0,0 +1,24 @@
+from tungsten import SdsQueryFieldName, SigmaAldrichSdsParser
+from tungsten.batch.task import map_fields
+from tungsten.globally_harmonized_system.safety_data_sheet import (
+    GhsSdsSectionTitle
+)
+from tungsten.parsers.supplier.sigma_aldrich.field_parse import (
+    SigmaAldrichFieldMapper
+)
+
+UNMAPPED = (SdsQueryFieldName.META_VERSION, SdsQueryFieldName.META_REVISION_DATE,
+            SdsQueryFieldName.META_PRINT_DATE)
+
+
+def test_parse_plan_skips_unmapped_fields():
+    plan = SigmaAldrichFieldMapper().parse_plan([*UNMAPPED, SdsQueryFieldName.CAS_NUMBER])
+    assert plan.sections == {GhsSdsSectionTitle.IDENTIFICATION}
+    assert plan.meta_keys == frozenset()
+
+
+def test_parse_unmapped_field(sheet_pdf):
+    parser = SigmaAldrichSdsParser()
+    sheet = parser.parse_to_ghs_sds(sheet_pdf, fields=[SdsQueryFieldName.META_VERSION])
+    assert sheet.sections == []
+    assert map_fields(parser, [SdsQueryFieldName.META_VERSION], {}) == {"META_VERSION": None}
@@ -0,0 +1,51 @@
+from io import BytesIO
+
+import numpy as np
+
+from tungsten.corpus.fingerprint import MinHasher, NearDuplicateIndex
+
+TEXT = "Product name Acetone Product Number 179124 Brand Sigma-Aldrich CAS-No. 67-64-1"
+
+
+def test_signature_without_words(pdf_builder):
+    hasher = MinHasher()
+    assert hasher.signature("") is None
+    assert hasher.signature(" - . ") is None
+    assert hasher.fingerprint(BytesIO(pdf_builder([[]]))) is None
+
+
+def test_signature():
+    hasher = MinHasher()
+    signature = hasher.signature(TEXT)
+    assert signature.dtype == np.uint32 and len(signature) == hasher.num_perm
+    assert np.array_equal(signature, hasher.signature(TEXT.upper()))
+
+
+def test_partition():
+    hasher = MinHasher()
+    other = "Section 2 Hazards identification Flammable liquids Category 2 H225 Signal word Danger"
+    unique, duplicates = NearDuplicateIndex().partition([
+        ("a", hasher.signature(TEXT)), ("b", hasher.signature(other)),
+        ("c", hasher.signature(TEXT + " Acetone")),
+    ])
+    assert unique == ["a", "b"]
+    assert duplicates == {"c": "a"}
+
+
+def test_partition_separates_near_duplicates_from_distinct_sheets(sheet_pdf, sheet_pages,
+                                                                  pdf_builder):
+    hasher = MinHasher()
+    sheet_pages[1][4] = "Signal word Warning"
+    near_duplicate = pdf_builder(sheet_pages)
+    distinct = pdf_builder([["SECTION 1: Identification", "Product name : Sodium chloride",
+                             "Product Number : S9888", "CAS-No. : 7647-14-5"]])
+    index = NearDuplicateIndex()
+    unique, duplicates = index.partition(
+        (key, hasher.fingerprint(BytesIO(pdf)))
+        for key, pdf in (("original", sheet_pdf), ("distinct", distinct),
+                         ("near", near_duplicate)))
+    assert unique == ["original", "distinct"]
+    assert duplicates == {"near": "original"}
+    # Later batches are compared with the sheets of earlier ones
+    assert index.partition([("again", hasher.fingerprint(BytesIO(near_duplicate)))]) == \
+        ([], {"again": "original"})
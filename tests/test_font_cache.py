@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+from pdfminer.layout import LAParams
+from pdfminer.pdftypes import PDFStream
+
+from tungsten import FontCache, SigmaAldrichSdsParser
+from tungsten.parsers.font_cache import font_program_size
+from tungsten.parsers.pdf_backend import PdfminerBackend
+from tungsten.parsers.result_cache import MemoryTier
+
+
+class CountingFontCache(FontCache):
+    hits: int = 0
+
+    def get(self, font_hash):
+        font = super().get(font_hash)
+        self.hits += font is not None
+        return font
+
+
+def parse(pdf: bytes, font_cache: FontCache) -> str:
+    backend = PdfminerBackend(LAParams(line_margin=0), font_cache)
+    return SigmaAldrichSdsParser(backend=backend).parse_to_ghs_sds(pdf).dumps()
+
+
+def test_documents_sharing_a_font_parse_it_once(sheet_pdf, pdf_builder, sheet_pages, no_tables):
+    sheet_pages[0][2] = "Product name : Ethanol"
+    other_pdf = pdf_builder(sheet_pages)
+    cache = CountingFontCache()
+    assert parse(sheet_pdf, cache) == parse(sheet_pdf, FontCache())
+    hits = cache.hits
+    assert parse(other_pdf, cache) == parse(other_pdf, FontCache())
+    assert cache.hits > hits
+    # Both documents use the same Helvetica, without a font program
+    assert len(cache) == 1
+    assert cache.size == 0
+
+
+def test_memory_tier_bounded_by_size():
+    tier = MemoryTier(max_entries=10, max_bytes=10, sizeof=len)
+    tier.put("a", b"1234")
+    tier.put("b", b"1234")
+    tier.get("a")
+    tier.put("c", b"1234")
+    # The least recently used value is evicted
+    assert tier.keys() == ["a", "c"]
+    assert tier.size == 8
+    # A value larger than the bound is not kept
+    tier.put("d", b"12345678901")
+    assert tier.keys() == []
+    assert tier.size == 0
+
+
+def test_font_program_size():
+    descriptor = {"FontName": "Helvetica", "Flags": 32, "FontFile2": PDFStream({}, bytes(100))}
+    assert font_program_size(SimpleNamespace(descriptor=descriptor)) == 100
+    assert font_program_size(SimpleNamespace(descriptor={})) == 0
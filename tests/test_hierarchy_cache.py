@@ -0,0 +1,26 @@
+from tungsten import HierarchyCache, SigmaAldrichSdsParser
+from tungsten.parsers.field_parse import SdsQueryFieldName
+from tungsten.parsers.hierarchy_cache import HierarchyCheckpoint
+
+
+def test_checkpoints_replay_to_the_parsed_sheet(sheet_pdf, tmp_path, no_tables):
+    parser = SigmaAldrichSdsParser(hierarchy_cache=HierarchyCache(path=tmp_path / "cache"))
+    sheet = parser.parse_to_ghs_sds(sheet_pdf)
+    fields = [SdsQueryFieldName.PICTOGRAM]
+    partial = SigmaAldrichSdsParser().parse_to_ghs_sds(sheet_pdf, fields=fields)
+
+    # Read back by a cache of another process
+    [(key, checkpoint)] = HierarchyCache(path=tmp_path / "cache").checkpoints()
+    assert key.startswith("SigmaAldrichSdsParser:")
+    data = checkpoint.to_bytes()
+    unpacked = HierarchyCheckpoint.from_bytes(data)
+    assert unpacked.to_bytes() == data
+    assert unpacked.meta == checkpoint.meta
+    replayer = SigmaAldrichSdsParser()
+    assert replayer.replay_checkpoint(unpacked).dumps() == sheet.dumps()
+    assert replayer.replay_checkpoint(unpacked, fields).dumps() == partial.dumps()
+
+    # Parsing the PDF again starts from the checkpoint
+    timings = {}
+    assert parser.parse_to_ghs_sds(sheet_pdf, timings).dumps() == sheet.dumps()
+    assert list(timings) == ["assemble"]
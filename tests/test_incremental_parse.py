@@ -0,0 +1,54 @@
+import pytest
+
+from tungsten import SigmaAldrichSdsParser
+from tungsten.globally_harmonized_system.safety_data_sheet import (
+    GhsSdsSectionTitle
+)
+from tungsten.parsers.page_cache import PageCache
+from tungsten.parsers.sds_parser import ParseProfile
+
+
+@pytest.mark.parametrize("changed_page", [0, 1, 3])
+def test_reparse_matches_full_parse(sheet_pdf, pdf_builder, sheet_pages, changed_page,
+                                    no_tables):
+    page_cache = PageCache()
+    parser = SigmaAldrichSdsParser(page_cache=page_cache)
+    assert parser.parse_to_ghs_sds(sheet_pdf).dumps() == \
+        SigmaAldrichSdsParser().parse_to_ghs_sds(sheet_pdf).dumps()
+
+    sheet_pages[changed_page].append("Revision Date 2024-01-01")
+    revised = pdf_builder(sheet_pages)
+    assert parser.parse_to_ghs_sds(revised).dumps() == \
+        SigmaAldrichSdsParser().parse_to_ghs_sds(revised).dumps()
+    # Only the changed page was processed again, by layout, tables and pictograms
+    assert len(page_cache) == 3 * (len(sheet_pages) + 1)
+
+
+def test_layout_timeout_keeps_laid_out_pages(pdf_builder, sheet_pages, no_tables):
+    page_cache = PageCache()
+    SigmaAldrichSdsParser(page_cache=page_cache).parse_to_ghs_sds(pdf_builder(sheet_pages))
+
+    # The changed pages are laid out until the budget runs out, always for at least one page
+    for lines in sheet_pages[1:]:
+        lines.append("Revision Date 2024-01-01")
+    parser = SigmaAldrichSdsParser(page_cache=page_cache,
+                                   profile=ParseProfile("test", {"layout": 0.0}))
+    sheet = parser.parse_to_ghs_sds(pdf_builder(sheet_pages))
+    assert [section.title for section in sheet.sections] == \
+        [GhsSdsSectionTitle.IDENTIFICATION, GhsSdsSectionTitle.HAZARDS]
+    assert sheet.meta["degraded"] == {"layout": "truncated"}
+
+
+def test_layout_timeout_leaves_out_pages_after_a_gap(pdf_builder, sheet_pages, no_tables):
+    page_cache = PageCache()
+    SigmaAldrichSdsParser(page_cache=page_cache).parse_to_ghs_sds(pdf_builder(sheet_pages))
+
+    # Page 2 is laid out, page 3 is out of time, and page 4 is cached but follows the gap
+    for lines in sheet_pages[1:3]:
+        lines.append("Revision Date 2024-01-01")
+    parser = SigmaAldrichSdsParser(page_cache=page_cache,
+                                   profile=ParseProfile("test", {"layout": 0.0}))
+    sheet = parser.parse_to_ghs_sds(pdf_builder(sheet_pages))
+    assert [section.title for section in sheet.sections] == \
+        [GhsSdsSectionTitle.IDENTIFICATION, GhsSdsSectionTitle.HAZARDS]
+    assert sheet.meta["degraded"] == {"layout": "truncated"}
@@ -0,0 +1,63 @@
+import os
+import signal
+import time
+
+import pytest
+
+from tungsten.batch.isolation import (
+    IsolatedExecutor,
+    WorkerCrashedError,
+    WorkerTimeoutError
+)
+
+
+def spin(seconds: float) -> int:
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+    return os.getpid()
+
+
+def fail():
+    raise ValueError("Not a PDF")
+
+
+def test_results_and_errors():
+    with IsolatedExecutor(2) as executor:
+        assert len(set(executor.map(spin, [0.0] * 4))) <= 2
+        with pytest.raises(ValueError, match="Not a PDF"):
+            executor.submit(fail).result()
+
+
+def test_wall_time_replaces_worker():
+    with IsolatedExecutor(1, wall_time=0.5) as executor:
+        pid = executor.submit(os.getpid).result()
+        with pytest.raises(WorkerTimeoutError) as error:
+            executor.submit(time.sleep, 30).result()
+        assert error.value.limit == "wall"
+        assert executor.submit(os.getpid).result() != pid
+
+
+def test_cpu_time_replaces_worker():
+    with IsolatedExecutor(1, cpu_time=1) as executor:
+        pid = executor.submit(spin, 0.1).result()
+        with pytest.raises(WorkerTimeoutError) as error:
+            executor.submit(spin, 30).result()
+        assert error.value.limit == "cpu"
+        assert executor.submit(spin, 0.1).result() != pid
+
+
+def test_worker_dying_while_idle_is_replaced():
+    with IsolatedExecutor(1) as executor:
+        pid = executor.submit(os.getpid).result()
+        os.kill(pid, signal.SIGKILL)
+        time.sleep(0.2)
+        with pytest.raises(WorkerCrashedError):
+            executor.submit(os.getpid).result()
+        assert executor.submit(os.getpid).result() != pid
+
+
+def test_initializer_time_is_not_limited():
+    with IsolatedExecutor(1, initializer=time.sleep, initargs=(1.0,),
+                          wall_time=0.5) as executor:
+        assert executor.submit(os.getpid).result() > 0
@@ -0,0 +1,110 @@
+import random
+
+import numpy as np
+import pytest
+
+from tungsten.parsers.parsing_hierarchy import (
+    HierarchyElement,
+    HierarchyNode,
+    HierarchyTree
+)
+
+
+def element(i: int) -> HierarchyElement:
+    return HierarchyElement(1, 0.0, float(i), 10.0, i + 1.0, 0.0, float(i), 10.0, i + 1.0,
+                            element=None, text_content=str(i), class_name="LTTextBoxHorizontal")
+
+
+def random_hierarchy(rng: random.Random, size: int) -> HierarchyNode:
+    root = HierarchyNode(is_root=True)
+    nodes = [root]
+    for i in range(size):
+        node = HierarchyNode(element(i))
+        rng.choice(nodes).add_child(node)
+        nodes.append(node)
+    return root
+
+
+def shape(node: HierarchyNode) -> list:
+    """Returns the hierarchy below a node as nested lists of (text, children)."""
+    return [(child.data.text_content, shape(child)) for child in node.children]
+
+
+def reference_delete(node: HierarchyNode, deleted: set[int]) -> None:
+    node.children = [child for child in node.children if id(child) not in deleted]
+    for child in node.children:
+        reference_delete(child, deleted)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_delete_matches_nodes(seed):
+    rng = random.Random(seed)
+    reference = random_hierarchy(rng, rng.randint(1, 60))
+    tree = HierarchyTree.from_node(reference)
+    # Tree nodes are numbered in the preorder of the hierarchy they are created from
+    nodes = reference.preorder()
+    assert shape(tree.root) == shape(reference)
+
+    for _ in range(3):
+        if len(tree) == 1:
+            break
+        present = tree.preorder().tolist()
+        # Nested and repeated nodes, so subtrees being deleted overlap, and the root
+        deleted = rng.choices(present, k=rng.randint(1, len(present)))
+        tree.delete(deleted)
+        reference_delete(reference, {id(nodes[node]) for node in deleted if node != 0})
+        assert shape(tree.root) == shape(reference)
+        assert tree.preorder().tolist() == [nodes.index(node) for node in reference.preorder()]
+        assert len(tree) == len(reference.preorder())
+
+
+def test_delete_detached_nodes():
+    tree = HierarchyTree()
+    a = tree.add_node(0, element(1))
+    b = tree.add_node(a, element(2))
+    c = tree.add_node(0, element(3))
+    tree.set_children(0, [c])
+    with pytest.raises(ValueError):
+        tree.preorder(a)
+    assert tree.preorder().tolist() == [0, c]
+
+    tree.delete([a, b])
+    assert tree.preorder().tolist() == [0, c]
+    # Detached nodes can be attached again, with their subtree
+    tree.move(a, c)
+    assert tree.preorder().tolist() == [0, c, a, b]
+    tree.delete([c, b])
+    assert tree.preorder().tolist() == [0]
+    assert tree.children(0) == []
+
+
+def test_preorder_after_move():
+    rng = random.Random(1)
+    reference = random_hierarchy(rng, 40)
+    tree = HierarchyTree.from_node(reference)
+    nodes = reference.preorder()
+    for _ in range(30):
+        node = rng.randrange(1, len(nodes))
+        subtree = set(tree.preorder(node).tolist())
+        parent = rng.choice([index for index in range(len(nodes)) if index not in subtree])
+        tree.move(node, parent)
+        old_parent = next(candidate for candidate in nodes
+                          if any(child is nodes[node] for child in candidate.children))
+        old_parent.children = [child for child in old_parent.children if child is not nodes[node]]
+        nodes[parent].add_child(nodes[node])
+        assert shape(tree.root) == shape(reference)
+        assert tree.preorder().tolist() == [nodes.index(node) for node in reference.preorder()]
+        assert tree.preorder(node).tolist() == \
+            [nodes.index(child) for child in nodes[node].preorder()]
+
+
+def test_column_after_adding_nodes():
+    tree = HierarchyTree()
+    a = tree.add_node(0, element(1))
+    values = tree.column("page_y0")
+    assert np.isnan(values[0]) and values[a] == 1.0
+    b = tree.add_node(a, element(5))
+    tree.delete([a])
+    values = tree.column("page_y0")
+    assert len(values) == 3 and values[b] == 5.0
+    assert tree.column("document_y1").tolist()[1:] == [2.0, 6.0]
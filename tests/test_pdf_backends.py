@@ -0,0 +1,57 @@
+import gc
+import io
+
+import pytest
+from pdfminer.layout import LAParams
+
+from tungsten import SigmaAldrichSdsParser
+from tungsten.parsers.pdf_backend import (
+    BACKENDS,
+    NumpyLinesBackend,
+    ParallelBackend,
+    PdfminerBackend
+)
+
+
+def parse(pdf: bytes, backend) -> str:
+    return SigmaAldrichSdsParser(backend=backend).parse_to_ghs_sds(pdf).dumps()
+
+
+@pytest.mark.parametrize("backend_class", list(BACKENDS.values()))
+# Lines of the sheet are closer than a margin of 1.0, which groups them into boxes
+@pytest.mark.parametrize("line_margin", [0, 1.0])
+def test_backends_match_pdfminer(sheet_pdf, no_tables, backend_class, line_margin):
+    assert parse(sheet_pdf, backend_class(LAParams(line_margin=line_margin))) == \
+        parse(sheet_pdf, PdfminerBackend(LAParams(line_margin=line_margin)))
+
+
+def layouts(pdf: bytes, backend) -> list[list[tuple]]:
+    return [[(type(component).__name__, component.bbox, component.get_text())
+             for component in layout.components]
+            for _, layout in backend.iter_page_layouts(io.BytesIO(pdf))]
+
+
+@pytest.mark.parametrize("line_margin", [0, 1.0])
+def test_numpy_lines_backend_groups_lines_like_pdfminer(sheet_pdf, line_margin):
+    assert layouts(sheet_pdf, NumpyLinesBackend(LAParams(line_margin=line_margin))) == \
+        layouts(sheet_pdf, PdfminerBackend(LAParams(line_margin=line_margin)))
+
+
+def test_parallel_backend_matches_pdfminer(sheet_pdf, no_tables):
+    backend = ParallelBackend(PdfminerBackend(LAParams(line_margin=0)), workers=2, min_pages=1,
+                              pages_per_task=1)
+    try:
+        assert parse(sheet_pdf, backend) == \
+            parse(sheet_pdf, PdfminerBackend(LAParams(line_margin=0)))
+    finally:
+        backend.close()
+
+
+def test_parallel_backend_pool_shut_down_when_collected(sheet_pdf, no_tables):
+    backend = ParallelBackend(workers=2, min_pages=1)
+    parse(sheet_pdf, backend)
+    executor = backend.executor
+    del backend
+    gc.collect()
+    with pytest.raises(RuntimeError):
+        executor.submit(abs, -1)
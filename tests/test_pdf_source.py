@@ -0,0 +1,29 @@
+import io
+
+import pytest
+
+from tungsten import SigmaAldrichSdsParser
+from tungsten.parsers import pdf_source
+from tungsten.parsers.pdf_source import PdfSource
+
+
+@pytest.mark.parametrize("mmap_threshold", [pdf_source.MMAP_THRESHOLD, 0])
+def test_sources_of_every_input_kind_agree(sheet_pdf, tmp_path, monkeypatch, no_tables,
+                                           mmap_threshold):
+    monkeypatch.setattr(pdf_source, "MMAP_THRESHOLD", mmap_threshold)
+    path = tmp_path / "sheet.pdf"
+    path.write_bytes(sheet_pdf)
+    expected = SigmaAldrichSdsParser().parse_to_ghs_sds(sheet_pdf).dumps()
+    with open(path, "rb") as f:
+        inputs = {"path": str(path), "bytes": sheet_pdf, "BytesIO": io.BytesIO(sheet_pdf),
+                  "fileno": f}
+        digests = {}
+        for kind, pdf in inputs.items():
+            with PdfSource.open(pdf) as source:
+                assert len(source) == len(sheet_pdf), kind
+                assert source.view().read() == sheet_pdf, kind
+                digests[kind] = source.digest()
+            if hasattr(pdf, "seek"):
+                pdf.seek(0)
+            assert SigmaAldrichSdsParser().parse_to_ghs_sds(pdf).dumps() == expected, kind
+    assert len(set(digests.values())) == 1, digests
@@ -0,0 +1,160 @@
+import io
+import threading
+import zlib
+
+import cv2
+import numpy as np
+import pytest
+from pdfminer.pdftypes import PDFStream
+from PIL import Image
+
+from tungsten import ResourceLimits, SigmaAldrichSdsParser
+from tungsten.globally_harmonized_system.safety_data_sheet import (
+    GhsSdsSectionTitle
+)
+from tungsten.parsers.supplier.sigma_aldrich.pictogram_injector import (
+    SigmaAldrichPictogramInjector
+)
+from tungsten.pictograms.cache import PictogramCache
+from tungsten.pictograms.pictograms import Pictogram, get_pictograms_cv2
+
+# Black, white, red and gray, enough to draw every pictogram
+PALETTE = bytes([0, 0, 0, 255, 255, 255, 255, 0, 0, 128, 128, 128])
+INDEXED = b"[/Indexed /DeviceRGB 3 3 0 R]"
+
+
+def image_pdf(images: list[tuple[bytes, int, int, bytes]]) -> bytes:
+    """Returns a PDF with one page of section 2 showing an 8-bit image per (color space, width,
+    height, samples), whose indexed color spaces share the lookup table of :data:`PALETTE` as
+    object 3."""
+    lookup = zlib.compress(PALETTE)
+    names = b" ".join(b"/Im%d %d 0 R" % (i, 7 + i) for i in range(len(images)))
+    content = b"BT /F1 10 Tf 40 780 Td (SECTION 2: Hazards identification) Tj ET\n" + b"".join(
+        b"q 50 0 0 50 %d 700 cm /Im%d Do Q\n" % (40 + 60 * i, i) for i in range(len(images)))
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [4 0 R] /Count 1 >>",
+               b"<< /Filter /FlateDecode /Length %d >>stream\n%s\nendstream"
+               % (len(lookup), lookup),
+               b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+               b"/Resources << /Font << /F1 6 0 R >> /XObject << %s >> >> /Contents 5 0 R >>"
+               % names,
+               b"<< /Length %d >>stream\n%s\nendstream" % (len(content), content),
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for color_space, width, height, samples in images:
+        data = zlib.compress(samples)
+        objects.append(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+                       b"/BitsPerComponent 8 /ColorSpace %s /Filter /FlateDecode /Length %d >>"
+                       b"stream\n%s\nendstream" % (width, height, color_space, len(data), data))
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" \
+        % (len(objects) + 1, xref)
+    return data
+
+
+def indexed_pictogram(pictogram: Pictogram, size: int = 96) -> tuple[bytes, int, int, bytes]:
+    """Returns the template of a pictogram as an image in the indexed colors of PALETTE."""
+    palette = Image.new("P", (1, 1))
+    palette.putpalette(PALETTE)
+    image = Image.fromarray(cv2.cvtColor(get_pictograms_cv2()[pictogram], cv2.COLOR_BGR2RGB))
+    samples = image.resize((size, size)).quantize(palette=palette, dither=Image.Dither.NONE)
+    return INDEXED, size, size, samples.tobytes()
+
+
+@pytest.fixture
+def pictograms_pdf() -> bytes:
+    return image_pdf([indexed_pictogram(pictogram) for pictogram in Pictogram])
+
+
+def test_images_sharing_a_palette_decode_concurrently(pictograms_pdf):
+    sequential = SigmaAldrichPictogramInjector(PictogramCache(), decode_workers=1)
+    concurrent = SigmaAldrichPictogramInjector(PictogramCache(), decode_workers=4)
+    expected = {1: list(Pictogram)}
+    assert sequential.generate_page_results(io.BytesIO(pictograms_pdf)) == expected
+    assert concurrent.generate_page_results(io.BytesIO(pictograms_pdf)) == expected
+    # Decoding the shared palette leaves the hashes of the images as they were
+    assert len(concurrent.cache) == len(Pictogram)
+    assert concurrent.generate_page_results(io.BytesIO(pictograms_pdf)) == expected
+    assert len(concurrent.cache) == len(Pictogram)
+    concurrent.close()
+
+
+def test_close_stops_decode_threads(pictograms_pdf):
+    def decode_threads() -> set[threading.Thread]:
+        return {thread for thread in threading.enumerate()
+                if thread.name.startswith("tungsten-pictograms")}
+
+    # Threads of injectors other than this one
+    others = decode_threads()
+    injector = SigmaAldrichPictogramInjector(PictogramCache(), decode_workers=4)
+    injector.generate_page_results(io.BytesIO(pictograms_pdf))
+    assert decode_threads() - others
+    injector.close()
+    assert not decode_threads() - others
+    # A closed injector starts its threads again when used
+    injector.cache = PictogramCache()
+    assert injector.generate_page_results(io.BytesIO(pictograms_pdf)) == {1: list(Pictogram)}
+    injector.close()
+    assert not decode_threads() - others
+
+
+def test_images_matching_no_pictogram_are_left_out():
+    noise = np.random.default_rng(0).integers(0, 4, 96 * 96, dtype=np.uint8).tobytes()
+    pdf = image_pdf([(INDEXED, 96, 96, noise), indexed_pictogram(Pictogram.PICT_GHS06_TOXIC),
+                     (b"/DeviceGray", 64, 64, bytes(64 * 64))])
+    injector = SigmaAldrichPictogramInjector(PictogramCache())
+    assert injector.generate_page_results(io.BytesIO(pdf)) == {1: [Pictogram.PICT_GHS06_TOXIC]}
+    assert injector.generate_injections(io.BytesIO(pdf)) == \
+        [{"pictograms": [Pictogram.PICT_GHS06_TOXIC.value]}]
+    # Also when the images are only looked up in the cache
+    assert len(injector.cache) == 3
+    assert injector.generate_page_results(io.BytesIO(pdf)) == {1: [Pictogram.PICT_GHS06_TOXIC]}
+
+
+def test_memory_budget_bounds_decoded_images(pictograms_pdf, no_tables):
+    # Less than any image takes decoded
+    parser = SigmaAldrichSdsParser(pictogram_cache=PictogramCache(),
+                                   limits=ResourceLimits(max_memory_bytes=1000))
+    sheet = parser.parse_to_ghs_sds(pictograms_pdf)
+    assert sheet.meta == {"pictograms": [], "degraded": {"pictograms": "partial"}}
+    assert [section.title for section in sheet.sections] == [GhsSdsSectionTitle.HAZARDS]
+
+
+@pytest.mark.parametrize("mode, bits, channels", [
+    ("L", 8, 1), ("RGB", 8, 3), ("CMYK", 8, 4), ("P", 8, 1), ("1", 1, 1), ("P", 1, 1)])
+def test_decoding_matches_pillow(mode, bits, channels):
+    width, height = 45, 30
+    rng = np.random.default_rng(0)
+    if bits == 1:
+        data = rng.integers(0, 256, (width + 7) // 8 * height, dtype=np.uint8).tobytes()
+    else:
+        data = rng.integers(0, 4 if mode == "P" else 256, width * height * channels,
+                            dtype=np.uint8).tobytes()
+    injector = SigmaAldrichPictogramInjector(PictogramCache())
+    scaled = injector._decode_scaled(PDFStream({}, data), width, height, bits,
+                                     PALETTE if mode == "P" else None)
+    # Scaled into the buffer of the thread rather than a new array
+    assert scaled is injector._matcher_buffer()
+
+    image = Image.frombytes("1" if bits == 1 else mode, (width, height), data)
+    if mode == "P":
+        # 1-bit samples are the palette indices 0 and 1
+        image = Image.frombytes("P", (width, height), np.asarray(image, np.uint8).tobytes())
+        image.putpalette(PALETTE)
+    expected = cv2.resize(cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2BGR),
+                          (150, 150))
+    assert np.array_equal(scaled, expected)
+
+
+def test_eight_bit_samples_are_viewed_in_place():
+    data = bytes(range(256)) * 3
+    samples = SigmaAldrichPictogramInjector._samples(data, 16, 16, 8, indexed=False)
+    assert samples.shape == (16, 16, 3)
+    assert np.shares_memory(samples, np.frombuffer(data, dtype=np.uint8))
+    assert samples.tobytes() == data
@@ -0,0 +1,21 @@
+import pytest
+
+from tungsten import ResourceLimits, SigmaAldrichSdsParser
+from tungsten.parsers.page_cache import PageCache
+
+
+@pytest.mark.parametrize("page_cache", [None, PageCache()], ids=["full", "incremental"])
+def test_first_page_over_limits_gives_an_empty_sheet(sheet_pdf, no_tables, page_cache):
+    parser = SigmaAldrichSdsParser(page_cache=page_cache,
+                                   limits=ResourceLimits(max_layout_elements=1))
+    sheet = parser.parse_to_ghs_sds(sheet_pdf)
+    assert sheet.sections == []
+    assert sheet.meta["degraded"] == {"layout": "truncated"}
+
+
+def test_memory_budget_leaves_out_layout_and_tables(sheet_pdf, no_tables):
+    unlimited = SigmaAldrichSdsParser(limits=ResourceLimits.UNLIMITED).parse_to_ghs_sds(sheet_pdf)
+    sheet = SigmaAldrichSdsParser(limits=ResourceLimits(max_memory_bytes=1)) \
+        .parse_to_ghs_sds(sheet_pdf)
+    assert "degraded" not in sheet.meta
+    assert sheet.dumps() == unlimited.dumps()
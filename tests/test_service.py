@@ -0,0 +1,78 @@
+import asyncio
+import json
+from http import HTTPStatus
+
+import pytest
+
+from tungsten.server.service import HttpError, ParsingService, _read_request
+
+
+def read(request: bytes, max_body_size: int = 1024):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(request)
+        reader.feed_eof()
+        return await _read_request(reader, max_body_size)
+
+    return asyncio.run(run())
+
+
+def test_read_request():
+    assert read(b"POST /parse?sheet=0 HTTP/1.1\r\nContent-Length: 3\r\n\r\nPDF") == \
+        ("POST", "/parse?sheet=0", {"content-length": "3"}, b"PDF")
+
+
+@pytest.mark.parametrize("length, status", [
+    (b"-1", HTTPStatus.BAD_REQUEST),
+    (b"three", HTTPStatus.BAD_REQUEST),
+    (b"2048", HTTPStatus.REQUEST_ENTITY_TOO_LARGE),
+])
+def test_read_request_rejects_content_length(length, status):
+    with pytest.raises(HttpError) as error:
+        read(b"POST /parse HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\nPDF")
+    assert error.value.status == status
+
+
+async def send(port: int, request: bytes) -> tuple[int, dict[str, str], dict]:
+    """Sends a request to the service listening on `port`, returning the status, headers and
+    payload of the response."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").rstrip("\r\n")
+    status_line, *header_lines = head.split("\r\n")
+    headers = {name.lower(): value.strip()
+               for name, _, value in (line.partition(":") for line in header_lines)}
+    payload = json.loads(await reader.readexactly(int(headers["content-length"])))
+    writer.close()
+    return int(status_line.split(" ")[1]), headers, payload
+
+
+def test_service_rejects_requests_beyond_admission():
+    async def run():
+        service = ParsingService(workers=1, queue_size=1)
+        # The only worker is busy, so parse requests wait in the queue
+        service._worker_slots = asyncio.Semaphore(1)
+        await service._worker_slots.acquire()
+        server = await asyncio.start_server(service._handle_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            queued = asyncio.create_task(
+                send(port, b"POST /parse HTTP/1.1\r\nContent-Length: 3\r\n\r\nPDF"))
+            while not service._queued:
+                await asyncio.sleep(0.01)
+            status, _, health = await send(port, b"GET /health HTTP/1.1\r\n\r\n")
+            assert (status, health["parsing"], health["queued"]) == (HTTPStatus.OK, 0, 1)
+
+            status, headers, payload = await send(
+                port, b"POST /parse HTTP/1.1\r\nContent-Length: 3\r\n\r\nPDF")
+            assert status == HTTPStatus.TOO_MANY_REQUESTS
+            assert headers["retry-after"] == "1"
+            assert "busy" in payload["error"]
+
+            status, headers, _ = await send(
+                port, b"POST /parse HTTP/1.1\r\nContent-Length: -1\r\n\r\nPDF")
+            assert status == HTTPStatus.BAD_REQUEST
+            assert headers["connection"] == "close"
+            queued.cancel()
+
+    asyncio.run(run())
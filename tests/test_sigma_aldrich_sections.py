@@ -0,0 +1,53 @@
+from tungsten import SigmaAldrichSdsParser
+from tungsten.globally_harmonized_system.safety_data_sheet import (
+    GhsSdsItemType,
+    GhsSdsSubsectionTitle
+)
+from tungsten.parsers.parsing_hierarchy import HierarchyElement, HierarchyTree
+from tungsten.parsers.supplier.sigma_aldrich.table_injector import TabulaTable
+
+
+def text_element(text: str, y: float, element=None) -> HierarchyElement:
+    return HierarchyElement(1, 40.0, y, 400.0, y + 10.0, 40.0, y, 400.0, y + 10.0,
+                            element=element, text_content=text + "\n",
+                            class_name="LTTextBoxHorizontal")
+
+
+def table(top: float) -> TabulaTable:
+    return TabulaTable({"extraction_method": "stream", "page_number": 1, "top": top,
+                        "bottom": top + 20.0, "left": 40.0, "right": 400.0, "width": 360.0,
+                        "height": 20.0, "data": [[{"top": top, "left": 40.0, "width": 360.0,
+                                                   "height": 10.0, "text": "67-64-1"}]]})
+
+
+def test_tables_under_a_section_are_not_subsections():
+    tree = HierarchyTree()
+    section = tree.add_node(0, text_element(
+        "SECTION 1: Identification of the substance/mixture and of the company", 800.0))
+    tree.add_node(section, text_element("", 790.0, table(50.0)))
+    subsection = tree.add_node(section, text_element("1.1 Product identifiers", 780.0))
+    tree.add_node(subsection, text_element("Product name : Acetone", 770.0))
+    tree.add_node(section, text_element("", 760.0, table(80.0)))
+
+    sections = SigmaAldrichSdsParser().identify_ghs_sections(tree.root.children)
+    subsections = sections[0].subsections
+    assert [subsection.title for subsection in subsections] == \
+        [GhsSdsSubsectionTitle.GHS_PRODUCT_IDENTIFIER]
+    assert [(item.type, item.data["top"] if item.type == GhsSdsItemType.TABLE else item.name)
+            for item in subsections[0].items] == \
+        [(GhsSdsItemType.TABLE, 50.0), (GhsSdsItemType.FIELD, "Product name : Acetone"),
+         (GhsSdsItemType.TABLE, 80.0)]
+
+
+def test_tables_of_a_section_without_subsections_are_kept():
+    tree = HierarchyTree()
+    section = tree.add_node(0, text_element("SECTION 3: Composition/information on ingredients",
+                                            800.0))
+    tree.add_node(section, text_element("", 790.0, table(50.0)))
+
+    sections = SigmaAldrichSdsParser().identify_ghs_sections(tree.root.children)
+    subsections = sections[0].subsections
+    assert [(subsection.title, subsection.raw_title) for subsection in subsections] == \
+        [(GhsSdsSubsectionTitle.COMPOSITION_OTHER, "")]
+    assert [(item.type, item.data["top"]) for item in subsections[0].items] == \
+        [(GhsSdsItemType.TABLE, 50.0)]
@@ -0,0 +1,38 @@
+import io
+import os
+
+from tungsten import TableCache
+from tungsten.parsers.supplier.sigma_aldrich.table_injector import (
+    SigmaAldrichTableInjector
+)
+
+
+def test_pages_seen_before_skip_tabula(sheet_pages, pdf_builder, tmp_path, monkeypatch):
+    # A tabula-java that finds no tables and logs the pages it is run on
+    log = tmp_path / "tabula.log"
+    java = tmp_path / "bin" / "java"
+    java.parent.mkdir()
+    java.write_text(f"#!/bin/sh\nwhile [ \"$1\" != --pages ]; do shift; done\n"
+                    f"echo \"$2\" >> {log}\necho '[]'\n")
+    java.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{java.parent}{os.pathsep}{os.environ['PATH']}")
+
+    def tabula_pages() -> list[str]:
+        return log.read_text().splitlines() if log.exists() else []
+
+    injector = SigmaAldrichTableInjector(TableCache())
+    expected = {page_number: [] for page_number in range(1, len(sheet_pages) + 1)}
+    assert injector.generate_page_results(io.BytesIO(pdf_builder(sheet_pages))) == expected
+    assert tabula_pages() == ["1,2,3,4"]
+    assert len(injector.cache) == len(sheet_pages)
+
+    # Every page hits, also in another injector sharing the cache
+    assert SigmaAldrichTableInjector(injector.cache).generate_page_results(
+        io.BytesIO(pdf_builder(sheet_pages))) == expected
+    assert tabula_pages() == ["1,2,3,4"]
+
+    # Only the changed page misses
+    sheet_pages[2][0] += " (revised)"
+    assert injector.generate_page_results(io.BytesIO(pdf_builder(sheet_pages))) == expected
+    assert tabula_pages() == ["1,2,3,4", "3"]
+    assert len(injector.cache) == len(sheet_pages) + 1
@@ -0,0 +1,87 @@
+import copy
+import random
+
+import pytest
+
+from tungsten.parsers.supplier.sigma_aldrich.table_injector import (
+    ColumnarTabulaTable,
+    TabulaTable
+)
+
+
+def table_json(rows: list[list[tuple[float, float, str]]]) -> dict:
+    """Returns a tabula JSON table of rows of (top, height, text) cells."""
+    return {"extraction_method": "stream", "page_number": 1, "top": 100.0, "bottom": 200.0,
+            "left": 10.0, "right": 110.0, "width": 100.0, "height": 100.0,
+            "data": [[{"top": top, "left": 10.0 + 20.0 * j, "width": 20.0, "height": height,
+                       "text": text} for j, (top, height, text) in enumerate(row)]
+                     for row in rows]}
+
+
+def clean(table, delete_rows: bool = False):
+    table.strip_text()
+    table.merge_rows(12.5)
+    table.extract_remarks()
+    table.pull_down_to_empty()
+    if delete_rows:
+        table.delete_rows_with_empty()
+    return table.to_table() if isinstance(table, ColumnarTabulaTable) else table
+
+
+def state(table: TabulaTable):
+    return ([[(cell.top, cell.left, cell.width, cell.height, cell.text) for cell in row]
+             for row in table.data], table.remarks, table.additional_ops, table.to_dict())
+
+
+def assert_equivalent(json_dict: dict):
+    for delete_rows in (False, True):
+        expected = clean(TabulaTable(copy.deepcopy(json_dict)), delete_rows)
+        actual = clean(ColumnarTabulaTable.from_json(copy.deepcopy(json_dict)), delete_rows)
+        assert state(actual) == state(expected)
+
+
+@pytest.mark.parametrize("rows", [
+    # Remark rows, referring to the row above once earlier remarks are removed
+    [[(100, 10, "Component"), (100, 10, "Value")],
+     [(120, 10, "Acetone"), (120, 10, "5 mg")],
+     [(140, 10, "Remarks"), (140, 10, "note a")],
+     [(160, 10, "Water"), (160, 10, "")],
+     [(180, 10, " Remarks x"), (180, 10, "note b")],
+     [(200, 10, "Remarks"), (200, 10, "note c")]],
+    # Merged groups whose first row has empty cells, which take nothing from the others
+    [[(100, 10, "Component"), (100, 10, "")],
+     [(105, 12, "cont."), (105, 12, "Value")],
+     [(130, 10, ""), (130, 10, "5 mg")],
+     [(138, 9.5, "LD50"), (138, 9.5, "")],
+     [(142, 11, "Oral"), (142, 11, "x")],
+     [(170, 10, ""), (170, 10, "")]],
+    # Fewer than 3 rows, left as they are by pull_down_to_empty
+    [[(100, 10, "Component"), (100, 10, "Value")],
+     [(120, 10, ""), (120, 10, "5 mg")]],
+    [[(100, 10, " Component "), (100, 10, "")],
+     [(105, 10, "Remarks"), (105, 10, "note")],
+     [(130, 10, ""), (130, 10, "5 mg")]],
+    [[(100, 10, "Component")]],
+])
+def test_columnar_cleaning_matches_rows(rows):
+    assert_equivalent(table_json(rows))
+
+
+def test_columnar_cleaning_matches_rows_randomized():
+    rng = random.Random(1)
+    words = ["", "", " ", "a", "b ", " Remarks", "Remarks x", "LD50", "12 mg", "Oral"]
+    for _ in range(500):
+        columns = rng.randint(1, 5)
+        top = 100.0
+        rows = []
+        for _ in range(rng.randint(2, 12)):
+            top += rng.choice([5, 8, 13, 20, 12.5])
+            rows.append([(top + rng.random(), rng.choice([5.0, 9.5, 11.0]), rng.choice(words))
+                         for _ in range(columns)])
+        assert_equivalent(table_json(rows))
+
+
+def test_ragged_rows_are_not_columnar():
+    with pytest.raises(ValueError):
+        ColumnarTabulaTable.from_json(table_json([[(100, 10, "a"), (100, 10, "b")],
+                                                  [(120, 10, "c")]]))
@@ -5,15 +5,28 @@ from tungsten.globally_harmonized_system.safety_data_sheet import (
     GhsSdsJsonEncoder
 )
 from tungsten.parsers.field_parse import SdsQueryFieldName
+from tungsten.parsers.font_cache import FontCache
+from tungsten.parsers.hierarchy_cache import HierarchyCache
+from tungsten.parsers.page_cache import PageCache
+from tungsten.parsers.registry import (
+    ParserRegistry,
+    UnsupportedSupplierError,
+    parse_any
+)
+from tungsten.parsers.sds_parser import ParseProfile, ResourceLimits
 from tungsten.parsers.supplier.sigma_aldrich.field_parse import (
     SigmaAldrichFieldMapper
 )
 from tungsten.parsers.supplier.sigma_aldrich.sds_parser import (
     SigmaAldrichSdsParser
 )
+from tungsten.parsers.supplier.sigma_aldrich.table_injector import TableCache
+from tungsten.pictograms.cache import PictogramCache
 
 os.environ["TABULA_JAR"] = str(
     (Path(__file__).parent.parent / "tabula-1.0.6-SNAPSHOT-jar-with-dependencies.jar").resolve())
 
 __all__ = ("GhsSdsJsonEncoder", "SigmaAldrichSdsParser", "SigmaAldrichFieldMapper",
-           "SdsQueryFieldName")
+           "SdsQueryFieldName", "PageCache", "ParseProfile", "ResourceLimits",
+           "PictogramCache", "TableCache", "FontCache", "HierarchyCache", "ParserRegistry",
+           "UnsupportedSupplierError", "parse_any")
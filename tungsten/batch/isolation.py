@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Optional
+
+try:
+    import resource
+except ImportError:
+    # CPU time limits are only available where the resource module is
+    resource = None
+
+
+class WorkerTimeoutError(Exception):
+    """Raised when a call on an :class:`IsolatedExecutor` exceeds its limit of wall-clock
+    ("wall") or CPU ("cpu") seconds, after the worker running it was killed."""
+    limit: str
+    seconds: float
+
+    def __init__(self, limit: str, seconds: float):
+        kind = "wall-clock" if limit == "wall" else "CPU"
+        super().__init__(f"Exceeded the {kind} time limit of {seconds:g} seconds")
+        self.limit = limit
+        self.seconds = seconds
+
+
+class WorkerCrashedError(Exception):
+    """Raised when the worker running a call on an :class:`IsolatedExecutor` died, e.g. from a
+    segmentation fault or being out of memory."""
+    seconds: float  # Spent on the call before the worker died
+
+    def __init__(self, message: str, seconds: float):
+        super().__init__(message)
+        self.seconds = seconds
+
+
+class _Worker:
+    """A worker process running one call at a time, sent over a pipe, in a process group of its
+    own so it can be killed with its subprocesses."""
+    process: multiprocessing.Process
+    connection: Connection
+    ready: bool  # Whether the worker reported that its initializer finished
+
+    def __init__(self, context: multiprocessing.context.BaseContext,
+                 initializer: Optional[Callable[..., None]], initargs: tuple):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_main,
+                                       args=(child_connection, initializer, initargs),
+                                       name="tungsten-isolated", daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.ready = False
+
+    def run(self, fn: Callable, args: tuple, kwargs: dict, wall_time: Optional[float],
+            cpu_time: Optional[float]) -> Any:
+        if not self.ready:
+            # The initializer of a new worker does not count against its first call
+            try:
+                self.connection.recv()
+            except (EOFError, OSError):
+                raise self._died(0.0, cpu_time) from None
+            self.ready = True
+        start_time = time.perf_counter()
+        try:
+            self.connection.send((fn, args, kwargs, cpu_time))
+            # A worker that died makes the pipe readable as well
+            finished = self.connection.poll(wall_time)
+        except OSError:
+            # The worker died while idle, or was killed by a shutdown of the executor
+            finished = True
+        if not finished:
+            self.kill()
+            raise WorkerTimeoutError("wall", wall_time)
+        try:
+            succeeded, value = self.connection.recv()
+        except (EOFError, OSError):
+            raise self._died(time.perf_counter() - start_time, cpu_time) from None
+        if not succeeded:
+            raise value
+        return value
+
+    def _died(self, seconds: float, cpu_time: Optional[float]) -> Exception:
+        """Returns the error of a call whose worker died, after `seconds` of the call."""
+        self.kill()
+        if self.process.exitcode == -getattr(signal, "SIGXCPU", 0):
+            return WorkerTimeoutError("cpu", cpu_time)
+        return WorkerCrashedError(f"Worker died with exit code {self.process.exitcode}",
+                                  seconds)
+
+    def kill(self) -> None:
+        """Kills the worker and every process it started."""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            # Not yet, or not possibly, the leader of its own group
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def close(self) -> None:
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.connection.close()
+
+
+class IsolatedExecutor(Executor):
+    """Executor running each call in one of `workers` worker processes, like a
+    :class:`ProcessPoolExecutor`, but killing the worker of a call that runs longer than
+    `wall_time` seconds or uses more than `cpu_time` seconds of CPU time. Such a call raises
+    :class:`WorkerTimeoutError`, a call whose worker died raises :class:`WorkerCrashedError`,
+    and the worker is replaced, running `initializer` again, before its next call. The time
+    limits start once the worker's initializer has finished.
+
+    Workers are killed together with the subprocesses they started, such as tabula-java. CPU
+    time is limited with RLIMIT_CPU, which is only available on Unix, and counts the worker's
+    own CPU time; subprocesses inherit the limit for their own CPU time. Each worker is
+    supervised by a thread of this process."""
+    workers: int
+    wall_time: Optional[float]
+    cpu_time: Optional[float]
+    logger: logging.Logger
+
+    def __init__(self, workers: Optional[int] = None,
+                 initializer: Optional[Callable[..., None]] = None, initargs: tuple = (),
+                 wall_time: Optional[float] = None, cpu_time: Optional[float] = None,
+                 mp_context: Optional[multiprocessing.context.BaseContext] = None):
+        if cpu_time is not None and resource is None:
+            raise ValueError("CPU time limits are not supported on this platform")
+        self.workers = workers or os.cpu_count() or 1
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.logger = logging.getLogger(f"tungsten:{self.__class__.__name__}")
+        self._initializer = initializer
+        self._initargs = initargs
+        self._context = mp_context or multiprocessing.get_context()
+        self._supervisors = ThreadPoolExecutor(self.workers,
+                                               thread_name_prefix="tungsten-supervisor")
+        self._local = threading.local()
+        self._live: set[_Worker] = set()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit calls after shutdown")
+            return self._supervisors.submit(self._run, fn, args, kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        """Shuts down the executor. Unless `wait`, workers still running a call are killed,
+        and their calls raise :class:`WorkerCrashedError`."""
+        with self._lock:
+            self._shutdown = True
+        if not wait:
+            self._supervisors.shutdown(wait=False, cancel_futures=cancel_futures)
+            for worker in self._take_workers():
+                worker.kill()
+            return
+        self._supervisors.shutdown(wait=True, cancel_futures=cancel_futures)
+        for worker in self._take_workers():
+            worker.close()
+
+    def _run(self, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        # Each supervising thread has a worker of its own, started when it is first needed
+        worker: Optional[_Worker] = getattr(self._local, "worker", None)
+        if worker is None:
+            if self._shutdown:
+                raise RuntimeError("The executor was shut down")
+            worker = self._local.worker = _Worker(self._context, self._initializer,
+                                                  self._initargs)
+            with self._lock:
+                self._live.add(worker)
+        try:
+            return worker.run(fn, args, kwargs, self.wall_time, self.cpu_time)
+        except (WorkerTimeoutError, WorkerCrashedError) as e:
+            self.logger.warning(f"{e}, replacing worker {worker.process.pid}")
+            self._local.worker = None
+            with self._lock:
+                self._live.discard(worker)
+            raise
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Calls still running when leaving on an exception, e.g. an interrupt, are not waited for
+        self.shutdown(wait=exc_type is None, cancel_futures=True)
+        return False
+
+    def _take_workers(self) -> list[_Worker]:
+        with self._lock:
+            workers = list(self._live)
+            self._live.clear()
+        return workers
+
+
+def _worker_main(connection: Connection, initializer: Optional[Callable[..., None]],
+                 initargs: tuple) -> None:
+    if hasattr(os, "setsid"):
+        # A group of its own, so it is killed with its subprocesses
+        os.setsid()
+    if initializer is not None:
+        initializer(*initargs)
+    connection.send(True)
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        fn, args, kwargs, cpu_time = message
+        if cpu_time is not None:
+            _limit_cpu_time(cpu_time)
+        try:
+            result = (True, fn(*args, **kwargs))
+        except BaseException as e:
+            result = (False, e)
+        try:
+            connection.send(result)
+        except Exception as e:
+            # The result or exception could not be pickled
+            connection.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+def _limit_cpu_time(seconds: float) -> None:
+    """Makes the process receive SIGXCPU, which kills it, once it has used `seconds` more
+    seconds of CPU time."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime + seconds)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from tungsten.batch.task import (
+    BatchResult,
+    BatchTask,
+    map_fields,
+    write_outputs
+)
+from tungsten.globally_harmonized_system.safety_data_sheet import (
+    GhsSafetyDataSheet
+)
+from tungsten.parsers.field_parse import SdsQueryFieldName
+from tungsten.parsers.pdf_source import PdfSource
+from tungsten.parsers.registry import ParserRegistry
+from tungsten.parsers.sds_parser import SdsParser, StagedParse
+
+# Put into the queue of a stage once per worker when no more documents follow
+_DONE = object()
+
+
+class _Document:
+    """A file going through the stages of a :class:`BatchPipeline`."""
+    task: BatchTask
+    seconds: float  # Spent in the stages so far, not waiting in queues
+    error: Optional[str]
+    parser: Optional[SdsParser]
+    parse: Optional[StagedParse]
+    sheet: Optional[GhsSafetyDataSheet]
+    source: Optional[PdfSource]
+
+    def __init__(self, task: BatchTask):
+        self.task = task
+        self.seconds = 0.0
+        self.error = None
+        self.parser = None
+        self.parse = None
+        self.sheet = None
+        self.source = None
+
+    def fail(self, error: Exception) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+        self.release()
+
+    def release(self) -> None:
+        """Releases the PDF, once no stage reads it anymore."""
+        if self.parse is not None:
+            self.parse.close()
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+    def result(self) -> BatchResult:
+        if self.error is not None:
+            return BatchResult(path=self.task.path, status="error", seconds=self.seconds,
+                               error=self.error)
+        return BatchResult(path=self.task.path, status="ok", seconds=self.seconds,
+                           degraded=self.sheet.meta.get("degraded"))
+
+
+class PipelineStage:
+    """A stage of a :class:`BatchPipeline`, run by `workers` threads of its own. Documents wait
+    for the stage in a queue of at most `queue_size`, so a slow stage holds back the stages
+    before it rather than letting documents pile up in memory."""
+    name: str
+    workers: int
+    queue_size: int
+    process: Callable[[_Document], None]
+    _queue: queue.Queue
+    _busy: int
+    _running: int
+
+    def __init__(self, name: str, workers: int, queue_size: int,
+                 process: Callable[[_Document], None]):
+        if workers < 1 or queue_size < 1:
+            raise ValueError(f"Stage {name} needs at least one worker and one queue slot")
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.process = process
+        self._queue = queue.Queue(queue_size)
+        self._busy = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    @property
+    def depth(self) -> int:
+        """Documents waiting for the stage."""
+        return self._queue.qsize()
+
+    @property
+    def busy(self) -> int:
+        """Workers of the stage processing a document."""
+        return self._busy
+
+
+class BatchPipeline:
+    """Parses many files in a pipeline of stages, so reading files, layout analysis, each
+    injector, assembly and writing the results all run at once, on different files. The stages
+    are, in order:
+
+    - "read": reads the file into memory (or maps it) and chooses its parser from the registry
+    - "layout": lays out the text hierarchy
+    - one stage per injector, named after it, such as "tables" and "pictograms", for the
+      injectors of every parser of the registry
+    - "assemble": applies the injections to the hierarchy and creates the sheet
+    - "write": encodes the sheet and mapped fields as JSON, and writes them
+
+    Each stage runs on its own threads, `workers` of them unless `stage_workers` sizes it, and
+    takes files from a bounded queue, of twice its workers unless `queue_sizes` sizes it. Stages
+    that drive subprocesses or native code, such as tabula-java and OpenCV, overlap with the
+    others; give parsers a :class:`ParallelBackend` to spread layout analysis over processes.
+
+    Results are yielded as files finish, not in input order. A file that fails in a stage skips
+    the stages after it and is reported with status "error"."""
+    registry: ParserRegistry
+    fields: tuple[SdsQueryFieldName, ...]
+    stages: list[PipelineStage]
+    logger: logging.Logger
+
+    def __init__(self, registry: ParserRegistry, fields: Iterable[SdsQueryFieldName] = (),
+                 workers: Optional[int] = None, stage_workers: Optional[dict[str, int]] = None,
+                 queue_sizes: Optional[dict[str, int]] = None):
+        self.registry = registry
+        self.fields = tuple(fields)
+        self.logger = logging.getLogger(f"tungsten:{self.__class__.__name__}")
+        injector_names: list[str] = []
+        for parser in registry.parsers():
+            for injector in parser.injectors:
+                if injector.name not in injector_names:
+                    injector_names.append(injector.name)
+        processes: dict[str, Callable[[_Document], None]] = {
+            "read": self._read,
+            "layout": self._layout,
+            **{name: self._injector_stage(name) for name in injector_names},
+            "assemble": self._assemble,
+            "write": self._write,
+        }
+        stage_workers = stage_workers or {}
+        queue_sizes = queue_sizes or {}
+        unknown = (set(stage_workers) | set(queue_sizes)) - set(processes)
+        if len(unknown):
+            raise ValueError(f"Unknown pipeline stages {', '.join(sorted(unknown))}, the stages "
+                             f"are {', '.join(processes)}")
+        workers = workers or os.cpu_count() or 1
+        self.stages = []
+        for name, process in processes.items():
+            stage_size = stage_workers.get(name, workers)
+            self.stages.append(PipelineStage(name, stage_size,
+                                             queue_sizes.get(name, 2 * stage_size), process))
+        self._results: Optional[queue.Queue] = None
+        self._stopping = threading.Event()
+        self._executors: list[ThreadPoolExecutor] = []
+        self._feeder: Optional[threading.Thread] = None
+
+    def queue_depths(self) -> dict[str, int]:
+        """Returns the number of files waiting for each stage, keyed by stage name."""
+        return {stage.name: stage.depth for stage in self.stages}
+
+    def run(self, tasks: Iterable[BatchTask]) -> Iterator[BatchResult]:
+        """Processes the files of `tasks`, yielding the result of each as it finishes. Only one
+        run may be in progress at a time."""
+        if len(self._executors):
+            raise RuntimeError("The pipeline is already running")
+        self._stopping.clear()
+        # Results of a stopped run that were never yielded are left in its own queue
+        self._results = queue.Queue()
+        for i, stage in enumerate(self.stages):
+            executor = ThreadPoolExecutor(stage.workers,
+                                          thread_name_prefix=f"tungsten-{stage.name}")
+            self._executors.append(executor)
+            stage._running = stage.workers
+            next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            for _ in range(stage.workers):
+                executor.submit(self._work, stage, next_stage)
+        self._feeder = threading.Thread(target=self._feed, args=(iter(tasks),),
+                                        name="tungsten-feed", daemon=True)
+        self._feeder.start()
+        results = self._results
+        try:
+            while (result := results.get()) is not _DONE:
+                yield result
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stops a run, waiting for the files already in a stage to leave it. Files that did not
+        reach the last stage are not written."""
+        self._stopping.set()
+        if self._feeder is not None:
+            self._feeder.join()
+            self._feeder = None
+        for executor in self._executors:
+            executor.shutdown(wait=True)
+        self._executors = []
+
+    def _feed(self, tasks: Iterator[BatchTask]) -> None:
+        first = self.stages[0]
+        try:
+            for task in tasks:
+                if self._stopping.is_set():
+                    break
+                first._queue.put(_Document(task))
+        finally:
+            for _ in range(first.workers):
+                first._queue.put(_DONE)
+
+    def _work(self, stage: PipelineStage, next_stage: Optional[PipelineStage]) -> None:
+        while (document := stage._queue.get()) is not _DONE:
+            if document.error is None and not self._stopping.is_set():
+                with stage._lock:
+                    stage._busy += 1
+                start_time = time.perf_counter()
+                try:
+                    stage.process(document)
+                except Exception as e:
+                    self.logger.debug(traceback.format_exc())
+                    document.fail(e)
+                finally:
+                    document.seconds += time.perf_counter() - start_time
+                    with stage._lock:
+                        stage._busy -= 1
+            elif document.error is None:
+                document.fail(RuntimeError("The pipeline was stopped"))
+            if next_stage is None:
+                self._results.put(document.result())
+            else:
+                next_stage._queue.put(document)
+        # The last worker of a stage to finish tells the next stage no more documents follow
+        with stage._lock:
+            stage._running -= 1
+            finished = stage._running == 0
+        if finished:
+            if next_stage is None:
+                self._results.put(_DONE)
+            else:
+                for _ in range(next_stage.workers):
+                    next_stage._queue.put(_DONE)
+
+    def _read(self, document: _Document) -> None:
+        document.source = PdfSource.open(document.task.path)
+        document.parser = self.registry.parser_for(document.source.view())
+        document.parse = StagedParse(document.parser, document.source.view())
+
+    @staticmethod
+    def _layout(document: _Document) -> None:
+        document.parse.layout()
+
+    @staticmethod
+    def _injector_stage(name: str) -> Callable[[_Document], None]:
+        def inject(document: _Document) -> None:
+            for injector in document.parse.pending_injectors:
+                if injector.name == name:
+                    document.parse.inject(injector)
+
+        return inject
+
+    @staticmethod
+    def _assemble(document: _Document) -> None:
+        document.sheet = document.parse.assemble()
+        document.release()
+
+    def _write(self, document: _Document) -> None:
+        encoded: dict[str, Any] = json.loads(document.sheet.dumps())
+        write_outputs(document.task, encoded,
+                      map_fields(document.parser, self.fields, encoded))
+
+    def __enter__(self) -> BatchPipeline:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
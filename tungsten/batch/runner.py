@@ -0,0 +1,471 @@
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import logging
+import os
+import statistics
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import Future, as_completed
+from contextlib import contextmanager
+from dataclasses import asdict
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+from typing import IO, Callable, Iterable, Iterator, Optional
+
+from tungsten.batch.isolation import IsolatedExecutor, WorkerTimeoutError
+from tungsten.batch.pipeline import BatchPipeline
+from tungsten.batch.task import (
+    BatchResult,
+    BatchTask,
+    map_fields,
+    write_outputs
+)
+from tungsten.corpus.fingerprint import MinHasher, NearDuplicateIndex
+from tungsten.parsers.field_parse import SdsQueryFieldName
+from tungsten.parsers.hierarchy_cache import HierarchyCache
+from tungsten.parsers.pdf_source import PdfSource
+from tungsten.parsers.registry import ParserRegistry
+from tungsten.parsers.sds_parser import ParseProfile
+from tungsten.parsers.supplier.sigma_aldrich.sds_parser import (
+    SigmaAldrichSdsParser
+)
+
+DEFAULT_FIELDS = (
+    SdsQueryFieldName.PRODUCT_NAME,
+    SdsQueryFieldName.PRODUCT_NUMBER,
+    SdsQueryFieldName.CAS_NUMBER,
+    SdsQueryFieldName.PRODUCT_BRAND,
+    SdsQueryFieldName.RECOMMENDED_USE_AND_RESTRICTIONS,
+    SdsQueryFieldName.SUPPLIER_ADDRESS,
+    SdsQueryFieldName.SUPPLIER_TELEPHONE,
+    SdsQueryFieldName.SUPPLIER_FAX,
+    SdsQueryFieldName.EMERGENCY_TELEPHONE,
+    SdsQueryFieldName.IDENTIFICATION_OTHER,
+    SdsQueryFieldName.SUBSTANCE_CLASSIFICATION,
+    SdsQueryFieldName.PICTOGRAM,
+    SdsQueryFieldName.SIGNAL_WORD,
+    SdsQueryFieldName.STATEMENTS,
+    SdsQueryFieldName.HNOC_HAZARD,
+)
+
+
+class Checkpoint:
+    """Append-only JSON Lines record of the files a batch has finished, so an interrupted run can
+    resume where it stopped. Every line is flushed as it is written; lines are synced to disk
+    every `sync_interval` records."""
+    path: Path
+    results: dict[str, BatchResult]
+    sync_interval: int
+    _file: IO[str]
+    _unsynced: int
+
+    def __init__(self, path: str | os.PathLike, sync_interval: int = 100):
+        self.path = Path(path)
+        self.sync_interval = sync_interval
+        self.results = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        result = BatchResult(**json.loads(line))
+                    except (ValueError, TypeError):
+                        # The last line may be truncated if the previous run was killed
+                        continue
+                    self.results[result.path] = result
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._unsynced = 0
+
+    def record(self, result: BatchResult) -> None:
+        self.results[result.path] = result
+        self._file.write(json.dumps(asdict(result)) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.sync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self) -> None:
+        self.sync()
+        self._file.close()
+
+
+class BatchSummary:
+    """Throughput and error statistics of a batch run."""
+    results: list[BatchResult]
+    skipped: int  # Files already finished by a previous run
+    elapsed: float
+
+    def __init__(self, results: list[BatchResult], skipped: int, elapsed: float):
+        self.results = results
+        self.skipped = skipped
+        self.elapsed = elapsed
+
+    @property
+    def succeeded(self) -> list[BatchResult]:
+        return [result for result in self.results if result.status == "ok"]
+
+    @property
+    def failed(self) -> list[BatchResult]:
+        return [result for result in self.results if result.status == "error"]
+
+    @property
+    def timed_out(self) -> list[BatchResult]:
+        return [result for result in self.results if result.status == "timeout"]
+
+    def __str__(self):
+        seconds = [result.seconds for result in self.succeeded]
+        duplicates = sum(result.status == "duplicate" for result in self.results)
+        degraded = sum(result.degraded is not None for result in self.succeeded)
+        output = f"Processed {len(self.results)} files in {self.elapsed:.1f} seconds " \
+                 f"({len(self.results) / self.elapsed if self.elapsed else 0:.2f} files/s), " \
+                 f"{self.skipped} already done by a previous run\n" \
+                 f"  ok: {len(self.succeeded)} ({degraded} degraded), " \
+                 f"errors: {len(self.failed)}, timeouts: {len(self.timed_out)}, " \
+                 f"duplicates skipped: {duplicates}\n"
+        if len(seconds):
+            quantiles = statistics.quantiles(seconds, n=20) if len(seconds) > 1 else seconds * 19
+            output += f"  seconds per file: mean {statistics.fmean(seconds):.2f}, " \
+                      f"p50 {statistics.median(seconds):.2f}, p95 {quantiles[18]:.2f}, " \
+                      f"max {max(seconds):.2f}\n"
+        if len(self.failed):
+            output += "  errors by type:\n"
+            error_types = Counter(result.error.split(":", 1)[0] for result in self.failed)
+            for error_type, count in error_types.most_common():
+                example = next(result for result in self.failed
+                               if result.error.split(":", 1)[0] == error_type)
+                output += f"    {error_type}: {count} (e.g. {example.path})\n"
+        if len(self.timed_out):
+            limits = Counter(result.timeout for result in self.timed_out)
+            output += "  timeouts: " + ", ".join(
+                f"{count} {'wall-clock' if limit == 'wall' else 'CPU'}"
+                for limit, count in limits.most_common()) + "\n"
+        return output.rstrip("\n")
+
+
+class BatchRunner:
+    """Parses many files with a pool of worker processes, writing the parsed sheet and mapped
+    fields of each file as JSON, like `test_demo.py` does for a single directory. Every file is
+    parsed by the parser of its supplier, chosen from a :class:`ParserRegistry` by the file's
+    fingerprint; files of no known supplier are parsed as Sigma-Aldrich sheets.
+
+    In `pipeline` mode, files are parsed by a :class:`BatchPipeline` in this process instead,
+    whose stages run `workers` threads each unless sized by `stage_workers`.
+
+    If a `hierarchy_cache_path` is given, the checkpoint of every parse is persisted in a
+    :class:`HierarchyCache` at that path, and files with a checkpoint are replayed from it, so
+    rerunning a batch after changing the rules or field mappings takes a fraction of the
+    time.
+
+    In `isolated` mode, which a `wall_time` or `cpu_time` limit implies, each file is parsed by a
+    worker of an :class:`IsolatedExecutor`, which is killed, along with tabula-java, when the file
+    takes more than `wall_time` seconds or `cpu_time` seconds of CPU time, and then replaced. Such
+    files are reported with status "timeout" rather than holding up the batch."""
+    output_dir: Path
+    workers: int
+    fields: tuple[SdsQueryFieldName, ...]
+    checkpoint_path: Path
+    retry_errors: bool
+    near_duplicates: str  # "parse", "skip" or "defer"
+    profile: ParseProfile
+    pipeline: bool
+    stage_workers: dict[str, int]
+    hierarchy_cache_path: Optional[str]
+    isolated: bool
+    wall_time: Optional[float]
+    cpu_time: Optional[float]
+    logger: logging.Logger
+
+    def __init__(self, output_dir: str | os.PathLike, workers: Optional[int] = None,
+                 fields: Iterable[SdsQueryFieldName] = DEFAULT_FIELDS,
+                 checkpoint_path: Optional[str | os.PathLike] = None, retry_errors: bool = False,
+                 near_duplicates: str = "parse", profile: ParseProfile = ParseProfile.FULL,
+                 pipeline: bool = False, stage_workers: Optional[dict[str, int]] = None,
+                 hierarchy_cache_path: Optional[str | os.PathLike] = None,
+                 isolated: bool = False, wall_time: Optional[float] = None,
+                 cpu_time: Optional[float] = None):
+        self.output_dir = Path(output_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.fields = tuple(fields)
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path is not None \
+            else self.output_dir / "checkpoint.jsonl"
+        self.retry_errors = retry_errors
+        if near_duplicates not in ("parse", "skip", "defer"):
+            raise ValueError(f"Invalid near-duplicate handling {near_duplicates}")
+        self.near_duplicates = near_duplicates
+        self.profile = profile
+        self.pipeline = pipeline
+        self.stage_workers = dict(stage_workers or {})
+        self.hierarchy_cache_path = None if hierarchy_cache_path is None \
+            else os.fspath(hierarchy_cache_path)
+        self.isolated = isolated or wall_time is not None or cpu_time is not None
+        if self.isolated and pipeline:
+            raise ValueError("Files cannot be parsed both in a pipeline and in isolation")
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.logger = logging.getLogger(f"tungsten:{self.__class__.__name__}")
+
+    def run(self, paths: list[str]) -> BatchSummary:
+        start_time = time.perf_counter()
+        checkpoint = Checkpoint(self.checkpoint_path)
+        pending = [path for path in paths if path not in checkpoint.results
+                   or (self.retry_errors
+                       and checkpoint.results[path].status in ("error", "timeout"))]
+        skipped = len(paths) - len(pending)
+        self.logger.info(f"{len(pending)} files to process, {skipped} already done")
+        # Files finished by previous runs are originals that pending files may duplicate
+        finished = [path for path in paths if path in checkpoint.results
+                    and checkpoint.results[path].status != "duplicate" and path not in pending]
+        # Relative to the root of every input, so outputs stay in place when a run resumes
+        root = _common_root(paths)
+
+        results: list[BatchResult] = []
+        try:
+            with self._executor() as (fingerprint, process):
+                for result in self._process(fingerprint, process, pending, finished, root):
+                    checkpoint.record(result)
+                    results.append(result)
+                    if result.status in ("error", "timeout"):
+                        self.logger.warning(f"Failed {result.path}: {result.error}")
+                    if len(results) % 100 == 0:
+                        self.logger.info(f"{len(results)}/{len(pending)} files processed")
+        finally:
+            checkpoint.close()
+        return BatchSummary(results, skipped, time.perf_counter() - start_time)
+
+    @contextmanager
+    def _executor(self) -> Iterator[tuple[Callable[[list[str]], Iterable],
+                                          Callable[[list[BatchTask]], Iterable[BatchResult]]]]:
+        """Yields the functions that fingerprint files and process tasks, with a pool of worker
+        processes, an :class:`IsolatedExecutor` in isolated mode, or a :class:`BatchPipeline` in
+        pipeline mode."""
+        if self.isolated:
+            with IsolatedExecutor(self.workers, initializer=_init_worker,
+                                  initargs=(self.fields, self.profile, self.hierarchy_cache_path),
+                                  wall_time=self.wall_time, cpu_time=self.cpu_time) as executor:
+                yield partial(_isolated_fingerprints, executor), \
+                    partial(_isolated_results, executor)
+        elif self.pipeline:
+            registry = _batch_registry(self.profile, self.hierarchy_cache_path)
+            try:
+                with BatchPipeline(registry, self.fields, self.workers,
+                                   self.stage_workers) as pipeline:
+                    yield partial(map, _fingerprint), pipeline.run
+            finally:
+                registry.close()
+        else:
+            with Pool(self.workers, initializer=_init_worker,
+                      initargs=(self.fields, self.profile, self.hierarchy_cache_path)) as pool:
+                yield partial(pool.imap, _fingerprint, chunksize=16), \
+                    partial(pool.imap_unordered, _process_task)
+
+    def _process(self, fingerprint: Callable[[list[str]], Iterable],
+                 process: Callable[[list[BatchTask]], Iterable[BatchResult]],
+                 paths: list[str], finished: list[str], root: Path) -> Iterator[BatchResult]:
+        deferred: list[str] = []
+        if self.near_duplicates != "parse" and len(paths):
+            index = NearDuplicateIndex()
+            signatures = fingerprint(finished + paths)
+            unique, duplicates = index.partition(
+                (path, signature) for path, signature in zip(finished + paths, signatures)
+                if signature is not None)
+            pending = set(paths)
+            duplicates = {path: original for path, original in duplicates.items()
+                          if path in pending}
+            self.logger.info(f"Found {len(duplicates)} likely near-duplicate files")
+            paths = [path for path in paths if path not in duplicates]
+            if self.near_duplicates == "skip":
+                for path, original in duplicates.items():
+                    yield BatchResult(path=path, status="duplicate", seconds=0.0,
+                                      duplicate_of=original)
+            else:
+                deferred = list(duplicates.keys())
+
+        tasks = [self._task(path, root) for path in paths + deferred]
+        yield from process(tasks)
+
+    def _task(self, path: str, root: Path) -> BatchTask:
+        relative = Path(path).absolute().relative_to(root)
+        return BatchTask(
+            path=path,
+            output_path=str(self.output_dir / "output" / relative) + ".json",
+            mapped_path=str(self.output_dir / "mapped" / relative) + ".json",
+        )
+
+
+def _common_root(paths: list[str]) -> Path:
+    if not len(paths):
+        return Path.cwd()
+    return Path(os.path.commonpath([str(Path(path).absolute().parent) for path in paths]))
+
+
+# Per-process state of pool workers, created once by _init_worker
+_worker_registry: Optional[ParserRegistry] = None
+_worker_fields: tuple[SdsQueryFieldName, ...] = ()
+
+
+def _batch_registry(profile: ParseProfile,
+                    hierarchy_cache_path: Optional[str] = None) -> ParserRegistry:
+    hierarchy_cache = None if hierarchy_cache_path is None \
+        else HierarchyCache(path=hierarchy_cache_path)
+    registry = ParserRegistry(fallback=SigmaAldrichSdsParser)
+    registry.register(SigmaAldrichSdsParser, partial(SigmaAldrichSdsParser, profile=profile,
+                                                     hierarchy_cache=hierarchy_cache))
+    return registry
+
+
+def _init_worker(fields: tuple[SdsQueryFieldName, ...], profile: ParseProfile,
+                 hierarchy_cache_path: Optional[str]) -> None:
+    global _worker_registry, _worker_fields
+    _worker_registry = _batch_registry(profile, hierarchy_cache_path)
+    _worker_fields = fields
+
+
+def _process_task(task: BatchTask) -> BatchResult:
+    start_time = time.perf_counter()
+    try:
+        with PdfSource.open(task.path) as source:
+            parser = _worker_registry.parser_for(source.view())
+            parsed = parser.parse_to_ghs_sds(source.view())
+        encoded = json.loads(parsed.dumps())
+        write_outputs(task, encoded, map_fields(parser, _worker_fields, encoded))
+    except Exception as e:
+        logging.getLogger("tungsten:BatchRunner").debug(traceback.format_exc())
+        return BatchResult(path=task.path, status="error",
+                           seconds=time.perf_counter() - start_time,
+                           error=f"{type(e).__name__}: {e}")
+    return BatchResult(path=task.path, status="ok", seconds=time.perf_counter() - start_time,
+                       degraded=parsed.meta.get("degraded"))
+
+
+def _isolated_fingerprints(executor: IsolatedExecutor, paths: list[str]) -> Iterator:
+    for future in [executor.submit(_fingerprint, path) for path in paths]:
+        try:
+            signature = future.result()
+        except Exception:
+            # Files whose worker timed out or died are left to be reported during the parse
+            signature = None
+        yield signature
+
+
+def _isolated_results(executor: IsolatedExecutor,
+                      tasks: list[BatchTask]) -> Iterator[BatchResult]:
+    futures: dict[Future, BatchTask] = {
+        executor.submit(_process_task, task): task for task in tasks
+    }
+    for future in as_completed(futures):
+        task = futures[future]
+        try:
+            result = future.result()
+        except WorkerTimeoutError as e:
+            result = BatchResult(path=task.path, status="timeout", seconds=e.seconds,
+                                 error=f"{type(e).__name__}: {e}", timeout=e.limit)
+        except Exception as e:
+            # Such as WorkerCrashedError, which ends the file but not the batch
+            result = BatchResult(path=task.path, status="error",
+                                 seconds=getattr(e, "seconds", 0.0),
+                                 error=f"{type(e).__name__}: {e}")
+        yield result
+
+
+def _fingerprint(path: str):
+    try:
+        with open(path, "rb") as f:
+            return MinHasher().fingerprint(f)
+    except Exception:
+        # Unreadable files are left to fail, and be reported, during the parse
+        return None
+
+
+def expand_inputs(patterns: list[str]) -> list[str]:
+    """Expands glob patterns (recursive `**` is supported) into a sorted list of unique files."""
+    paths: set[str] = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        paths.update(match for match in matches if os.path.isfile(match))
+        if not len(matches) and os.path.isfile(pattern):
+            paths.add(pattern)
+    return sorted(paths)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(
+        prog="python -m tungsten",
+        description="Parse safety data sheets in bulk, writing parsed and mapped JSON.")
+    arg_parser.add_argument("inputs", nargs="+", help="input PDF files or glob patterns")
+    arg_parser.add_argument("-o", "--output", required=True, help="output directory")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None,
+                            help="number of worker processes, or threads of each pipeline stage "
+                                 "(default: CPU count)")
+    arg_parser.add_argument("--checkpoint", default=None,
+                            help="checkpoint file (default: OUTPUT/checkpoint.jsonl)")
+    arg_parser.add_argument("--retry-errors", action="store_true",
+                            help="reprocess files that failed in a previous run")
+    arg_parser.add_argument("--near-duplicates", choices=("parse", "skip", "defer"),
+                            default="parse",
+                            help="how to handle likely near-duplicate files (default: parse)")
+    arg_parser.add_argument("--profile", choices=("fast", "balanced", "full"), default="full",
+                            help="time budgets of the parsing stages (default: full, no limits)")
+    arg_parser.add_argument("--pipeline", action="store_true",
+                            help="parse in a pipeline of stages running at once, in one process")
+    arg_parser.add_argument("--stage-workers", action="append", default=[], metavar="STAGE=N",
+                            help="threads of a pipeline stage (default: the number of workers), "
+                                 "e.g. tables=4; may be repeated")
+    arg_parser.add_argument("--hierarchy-cache", default=None, metavar="PATH",
+                            help="SQLite database of parse checkpoints, from which files parsed "
+                                 "before are replayed with the current rules")
+    arg_parser.add_argument("--isolate", action="store_true",
+                            help="parse each file in a worker that is killed and replaced if "
+                                 "the file exceeds a time limit")
+    arg_parser.add_argument("--timeout", type=float, default=None, metavar="SECONDS",
+                            help="wall-clock seconds a file may take, implies --isolate")
+    arg_parser.add_argument("--cpu-timeout", type=float, default=None, metavar="SECONDS",
+                            help="CPU seconds a file may use, implies --isolate")
+    arg_parser.add_argument("-v", "--verbose", action="store_true", help="log debug output")
+    args = arg_parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="[%(asctime)s][%(levelname)s][%(name)s] - %(message)s")
+    # The parsers log every file at INFO level, which drowns out the batch progress
+    if not args.verbose:
+        for name in ("tungsten:SigmaAldrichSdsParser", "tungsten:SigmaAldrichTableInjector",
+                     "tungsten:SigmaAldrichPictogramInjector"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    stage_workers: dict[str, int] = {}
+    for size in args.stage_workers:
+        stage, _, workers = size.partition("=")
+        if not workers.isdigit():
+            arg_parser.error(f"invalid stage size {size}, expected STAGE=N")
+        stage_workers[stage] = int(workers)
+
+    isolated = args.isolate or args.timeout is not None or args.cpu_timeout is not None
+    if isolated and (args.pipeline or len(stage_workers)):
+        arg_parser.error("--isolate, --timeout and --cpu-timeout cannot be used with --pipeline")
+
+    paths = expand_inputs(args.inputs)
+    if not len(paths):
+        arg_parser.error("no input files matched")
+    runner = BatchRunner(args.output, workers=args.workers, checkpoint_path=args.checkpoint,
+                         retry_errors=args.retry_errors, near_duplicates=args.near_duplicates,
+                         profile=getattr(ParseProfile, args.profile.upper()),
+                         pipeline=args.pipeline or bool(stage_workers),
+                         stage_workers=stage_workers,
+                         hierarchy_cache_path=args.hierarchy_cache, isolated=isolated,
+                         wall_time=args.timeout, cpu_time=args.cpu_timeout)
+    try:
+        summary = runner.run(paths)
+    except KeyboardInterrupt:
+        print("Interrupted, rerun the same command to resume.")
+        return 130
+    print(summary)
+    return 1 if len(summary.failed) or len(summary.timed_out) else 0
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from tungsten.parsers.field_parse import SdsQueryFieldName
+from tungsten.parsers.sds_parser import SdsParser
+
+
+@dataclass
+class BatchTask:
+    """A single file of a batch, and where its results are written."""
+    path: str
+    output_path: str  # Parsed sheet JSON
+    mapped_path: str  # Mapped field values JSON
+
+
+@dataclass
+class BatchResult:
+    """Outcome of a single file of a batch, as recorded in the checkpoint."""
+    path: str
+    status: str  # "ok", "error", "timeout" or "duplicate"
+    seconds: float
+    error: Optional[str] = None  # Exception type and message, if status is "error" or "timeout"
+    duplicate_of: Optional[str] = None  # Path of the similar file, if status is "duplicate"
+    degraded: Optional[dict[str, str]] = None  # Stages that ran out of time, if status is "ok"
+    timeout: Optional[str] = None  # Limit exceeded, "wall" or "cpu", if status is "timeout"
+
+
+def map_fields(parser: SdsParser, fields: Iterable[SdsQueryFieldName],
+               encoded: dict) -> dict[str, Any]:
+    """Returns the values of `fields` in a parsed sheet encoded as JSON, keyed by field name,
+    None for fields missing from the sheet. Empty if the parser has no field mapper."""
+    mapped = {}
+    for field in fields if parser.field_mapper is not None else ():
+        try:
+            mapped[field.name] = parser.field_mapper.get_field(field, encoded)
+        except KeyError:
+            mapped[field.name] = None
+    return mapped
+
+
+def write_outputs(task: BatchTask, encoded: dict, mapped: dict[str, Any]) -> None:
+    """Writes the parsed sheet and mapped fields of a file, creating their directories."""
+    for path, data in ((task.output_path, encoded), (task.mapped_path, mapped)):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fw:
+            json.dump(data, fw)
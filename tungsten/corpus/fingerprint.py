@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from collections import defaultdict
+from collections.abc import Hashable, Iterable
+from io import StringIO
+from typing import IO, Optional
+
+import numpy as np
+from pdfminer.converter import TextConverter
+from pdfminer.pdfinterp import PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+
+from tungsten.parsers.font_cache import CachingResourceManager
+
+# Mersenne prime used for the universal hash family of the MinHash permutations
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def extract_leading_text(io: IO[bytes], max_pages: int = 2) -> str:
+    """Returns the raw text of the first `max_pages` pages of a PDF. Layout analysis is skipped,
+    so text is returned in content stream order, which is far cheaper than a full parse."""
+    resource_manager = CachingResourceManager()
+    output = StringIO()
+    device = TextConverter(resource_manager, output, laparams=None)
+    interpreter = PDFPageInterpreter(resource_manager, device)
+    # noinspection PyTypeChecker
+    for page in PDFPage.get_pages(io, maxpages=max_pages):
+        interpreter.process_page(page)
+    device.close()
+    return output.getvalue()
+
+
+class MinHasher:
+    """Computes MinHash signatures of word shingles. Signatures are only comparable if they were
+    computed by hashers with the same `num_perm`, `shingle_size` and `seed`."""
+    num_perm: int
+    shingle_size: int
+    seed: int
+    _a: np.ndarray
+    _b: np.ndarray
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        # Coefficients are kept below 2^31 so (a * x + b) never overflows 64 bits for 32-bit x
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> set[str]:
+        """Returns the set of word shingles of the normalized text."""
+        words = re.findall(r"\w+", text.lower())
+        if len(words) < self.shingle_size:
+            return {" ".join(words)} if len(words) else set()
+        return {" ".join(words[i:i + self.shingle_size])
+                for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """Returns the MinHash signature of a text as an array of `num_perm` unsigned 32-bit
+        integers, or None if the text has no words, since texts without shingles, such as those
+        of scanned sheets, would all have the same signature."""
+        shingles = self.shingles(text)
+        if not len(shingles):
+            return None
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=4).digest(), "little")
+             for shingle in shingles),
+            dtype=np.uint64, count=len(shingles))
+        # One row per permutation, one column per shingle
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def fingerprint(self, io: IO[bytes], max_pages: int = 2) -> Optional[np.ndarray]:
+        """Returns the MinHash signature of the raw text of the first pages of a PDF, or None if
+        they have no text."""
+        return self.signature(extract_leading_text(io, max_pages))
+
+
+def estimate_similarity(signature: np.ndarray, other: np.ndarray) -> float:
+    """Estimates the Jaccard similarity of the shingle sets behind two MinHash signatures."""
+    return float(np.count_nonzero(signature == other)) / len(signature)
+
+
+class NearDuplicateIndex:
+    """Locality-sensitive hashing index of MinHash signatures. Signatures are split into `bands`
+    bands; two sheets become candidates if any band matches exactly, and candidates are confirmed
+    if their estimated similarity reaches `threshold`."""
+    bands: int
+    threshold: float
+    _buckets: list[defaultdict[bytes, list[Hashable]]]
+    _signatures: dict[Hashable, np.ndarray]
+
+    def __init__(self, bands: int = 16, threshold: float = 0.8):
+        self.bands = bands
+        self.threshold = threshold
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+        self._signatures = {}
+
+    def _band_keys(self, signature: np.ndarray) -> list[bytes]:
+        if len(signature) % self.bands != 0:
+            raise ValueError(f"Signature length {len(signature)} is not divisible into "
+                             f"{self.bands} bands.")
+        return [band.tobytes() for band in np.split(signature, self.bands)]
+
+    def add(self, key: Hashable, signature: np.ndarray) -> None:
+        """Adds the signature of a sheet to the index under `key`."""
+        if key in self._signatures:
+            raise KeyError(f"{key} is already in the index.")
+        self._signatures[key] = signature
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            buckets[band_key].append(key)
+
+    def query(self, signature: np.ndarray) -> list[tuple[Hashable, float]]:
+        """Returns the keys of indexed sheets that are likely near-duplicates of the signature,
+        with their estimated similarity, most similar first."""
+        candidates: set[Hashable] = set()
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(buckets.get(band_key, ()))
+        matches = []
+        for candidate in candidates:
+            similarity = estimate_similarity(signature, self._signatures[candidate])
+            if similarity >= self.threshold:
+                matches.append((candidate, similarity))
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches
+
+    def partition(self, signatures: Iterable[tuple[Hashable, np.ndarray]]) -> \
+            tuple[list[Hashable], dict[Hashable, Hashable]]:
+        """Splits a batch into sheets to parse fully and likely duplicates. Returns the keys of
+        sheets that are not near-duplicates of anything seen before (these are added to the
+        index), and a mapping of each remaining key to the most similar previously seen sheet.
+        Duplicates can then skip or defer the expensive stages of the parse."""
+        unique: list[Hashable] = []
+        duplicates: dict[Hashable, Hashable] = {}
+        for key, signature in signatures:
+            matches = self.query(signature)
+            if len(matches):
+                duplicates[key] = matches[0][0]
+            else:
+                self.add(key, signature)
+                unique.append(key)
+        return unique, duplicates
+
+    def __contains__(self, key: Hashable):
+        return key in self._signatures
+
+    def __len__(self):
+        return len(self._signatures)
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import abc
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from tungsten.globally_harmonized_system.safety_data_sheet import (
+    GhsSafetyDataSheet
+)
+from tungsten.parsers.field_parse import FieldMapper, SdsQueryFieldName
+from tungsten.parsers.supplier.sigma_aldrich.field_parse import (
+    SigmaAldrichFieldMapper
+)
+
+INDEXED_FIELDS = (
+    SdsQueryFieldName.CAS_NUMBER,
+    SdsQueryFieldName.PRODUCT_NUMBER,
+    SdsQueryFieldName.SIGNAL_WORD,
+    SdsQueryFieldName.STATEMENTS,
+    SdsQueryFieldName.PICTOGRAM,
+)
+
+_POSTINGS_DTYPE = np.dtype("<u4")
+
+
+def normalize_term(value: str) -> str:
+    """Normalizes a field value so that queries are case and whitespace insensitive."""
+    return " ".join(str(value).split()).upper()
+
+
+class CorpusIndex:
+    """Inverted index over a corpus of parsed sheets, mapping the values of the fields in
+    :data:`INDEXED_FIELDS` to the sheets that contain them.
+
+    Sheets are added to an in-memory buffer, which :meth:`flush` writes to disk as an immutable
+    segment. Segment postings are memory-mapped and read without loading them, so the index can
+    be reopened and queried cheaply. Postings are sorted lists of document ids, and documents are
+    numbered in the order they were added."""
+    path: Path
+    field_mapper: FieldMapper
+    keys: list[str]  # Key of each document, indexed by document id
+    _segments: list[_Segment]
+    _next_segment: int  # Number of the next segment to write, segment names are never reused
+    _buffer: defaultdict[tuple[str, str], list[int]]
+    _buffer_start: int  # Id of the first document in the buffer
+
+    def __init__(self, path: str | os.PathLike, field_mapper: Optional[FieldMapper] = None):
+        self.path = Path(path)
+        self.field_mapper = field_mapper or SigmaAldrichFieldMapper()
+        self.path.mkdir(parents=True, exist_ok=True)
+        manifest_path = self.path / "manifest.json"
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else \
+            {"segments": [], "next_segment": 0, "keys": []}
+        self.keys = manifest["keys"]
+        self._segments = [_Segment(self.path, name) for name in manifest["segments"]]
+        self._next_segment = manifest["next_segment"]
+        self._buffer = defaultdict(list)
+        self._buffer_start = len(self.keys)
+
+    def add(self, key: str, sds: GhsSafetyDataSheet) -> int:
+        """Adds a sheet to the index under `key`, returning its document id. The sheet is
+        searchable immediately, but only persisted by :meth:`flush`."""
+        doc_id = len(self.keys)
+        self.keys.append(key)
+        for field, terms in self.extract_terms(sds).items():
+            for term in terms:
+                self._buffer[(field.name, term)].append(doc_id)
+        return doc_id
+
+    def extract_terms(self, sds: GhsSafetyDataSheet) -> dict[SdsQueryFieldName, set[str]]:
+        """Returns the normalized values of the indexed fields of a sheet."""
+        target = json.loads(sds.dumps())
+        terms: dict[SdsQueryFieldName, set[str]] = {}
+        for field in INDEXED_FIELDS:
+            try:
+                value = self.field_mapper.get_field(field, target)
+            except (KeyError, TypeError):
+                value = None
+            if value is None:
+                continue
+            values = value if isinstance(value, list) else [value]
+            terms[field] = {normalize_term(v) for v in values if str(v).strip() != ""}
+        return terms
+
+    def flush(self) -> None:
+        """Writes buffered sheets to a new segment and updates the manifest."""
+        if not len(self._buffer) and self._buffer_start == len(self.keys):
+            return
+        self._segments.append(_Segment.write(self.path, self._new_segment_name(), self._buffer))
+        self._buffer = defaultdict(list)
+        self._buffer_start = len(self.keys)
+        self._write_manifest()
+
+    def compact(self) -> None:
+        """Merges all segments and the buffer into a single segment."""
+        merged: defaultdict[tuple[str, str], list[int]] = defaultdict(list)
+        for segment in self._segments:
+            for term_key in segment.lexicon:
+                merged[term_key].extend(segment.postings(term_key).tolist())
+        for term_key, doc_ids in self._buffer.items():
+            merged[term_key].extend(doc_ids)
+        old_segments = self._segments
+        self._segments = [_Segment.write(self.path, self._new_segment_name(), merged)]
+        self._buffer = defaultdict(list)
+        self._buffer_start = len(self.keys)
+        self._write_manifest()
+        for segment in old_segments:
+            segment.delete()
+
+    def postings(self, field: SdsQueryFieldName, value: str) -> np.ndarray:
+        """Returns the sorted ids of the documents whose `field` contains `value`."""
+        term_key = (field.name, normalize_term(value))
+        parts = [segment.postings(term_key) for segment in self._segments]
+        parts.append(np.asarray(self._buffer.get(term_key, ()), dtype=_POSTINGS_DTYPE))
+        # Segments hold increasing document ids, so concatenation keeps postings sorted
+        return np.concatenate(parts)
+
+    def search(self, query: Query) -> list[str]:
+        """Returns the keys of the documents matching a boolean query."""
+        return [self.keys[doc_id] for doc_id in query.evaluate(self)]
+
+    def all_documents(self) -> np.ndarray:
+        return np.arange(len(self.keys), dtype=_POSTINGS_DTYPE)
+
+    def _new_segment_name(self) -> str:
+        name = f"segment-{self._next_segment:05d}"
+        self._next_segment += 1
+        return name
+
+    def _write_manifest(self) -> None:
+        manifest_path = self.path / "manifest.json"
+        temp_path = manifest_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps({
+            "segments": [segment.name for segment in self._segments],
+            "next_segment": self._next_segment,
+            "keys": self.keys[:self._buffer_start],
+        }))
+        os.replace(temp_path, manifest_path)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class _Segment:
+    """An immutable on-disk part of a :class:`CorpusIndex`. Postings of all terms are stored
+    back to back in a single file of little-endian 32-bit document ids, and the lexicon maps
+    each term to its offset and length in that file."""
+    path: Path
+    name: str
+    lexicon: dict[tuple[str, str], tuple[int, int]]
+    _postings: Optional[np.memmap]
+
+    def __init__(self, path: Path, name: str):
+        self.path = path
+        self.name = name
+        lexicon = json.loads((path / f"{name}.lexicon.json").read_text())
+        self.lexicon = {(field, term): (offset, length)
+                        for field, terms in lexicon.items()
+                        for term, (offset, length) in terms.items()}
+        postings_path = path / f"{name}.postings"
+        # Memory-mapping an empty file is not possible
+        self._postings = np.memmap(postings_path, dtype=_POSTINGS_DTYPE, mode="r") \
+            if postings_path.stat().st_size else None
+
+    @classmethod
+    def write(cls, path: Path, name: str,
+              postings: dict[tuple[str, str], list[int]]) -> _Segment:
+        lexicon: defaultdict[str, dict[str, tuple[int, int]]] = defaultdict(dict)
+        offset = 0
+        with open(path / f"{name}.postings", "wb") as f:
+            for (field, term), doc_ids in sorted(postings.items()):
+                array = np.asarray(sorted(doc_ids), dtype=_POSTINGS_DTYPE)
+                f.write(array.tobytes())
+                lexicon[field][term] = (offset, len(array))
+                offset += len(array)
+        (path / f"{name}.lexicon.json").write_text(json.dumps(lexicon))
+        return cls(path, name)
+
+    def postings(self, term_key: tuple[str, str]) -> np.ndarray:
+        if term_key not in self.lexicon or self._postings is None:
+            return np.empty(0, dtype=_POSTINGS_DTYPE)
+        offset, length = self.lexicon[term_key]
+        return self._postings[offset:offset + length]
+
+    def delete(self) -> None:
+        self._postings = None
+        (self.path / f"{self.name}.postings").unlink()
+        (self.path / f"{self.name}.lexicon.json").unlink()
+
+
+class Query(metaclass=abc.ABCMeta):
+    """Boolean query over a :class:`CorpusIndex`. Queries combine with `&`, `|` and `~`."""
+
+    @abc.abstractmethod
+    def evaluate(self, index: CorpusIndex) -> np.ndarray:
+        """Returns the sorted ids of the matching documents."""
+        pass
+
+    def __and__(self, other: Query) -> Query:
+        return And(self, other)
+
+    def __or__(self, other: Query) -> Query:
+        return Or(self, other)
+
+    def __invert__(self) -> Query:
+        return Not(self)
+
+
+class Term(Query):
+    """Matches documents whose `field` contains `value`."""
+    field: SdsQueryFieldName
+    value: str
+
+    def __init__(self, field: SdsQueryFieldName, value: str):
+        self.field = field
+        self.value = value
+
+    def evaluate(self, index: CorpusIndex) -> np.ndarray:
+        return index.postings(self.field, self.value)
+
+    def __str__(self):
+        return f"{self.field.name}:{self.value}"
+
+
+class And(Query):
+    queries: tuple[Query, ...]
+
+    def __init__(self, *queries: Query):
+        self.queries = queries
+
+    def evaluate(self, index: CorpusIndex) -> np.ndarray:
+        # Intersect the shortest postings first to keep intermediate results small
+        results = sorted((query.evaluate(index) for query in self.queries), key=len)
+        result = results[0] if len(results) else index.all_documents()
+        for other in results[1:]:
+            result = np.intersect1d(result, other, assume_unique=True)
+        return result
+
+    def __str__(self):
+        return "(" + " AND ".join(str(query) for query in self.queries) + ")"
+
+
+class Or(Query):
+    queries: tuple[Query, ...]
+
+    def __init__(self, *queries: Query):
+        self.queries = queries
+
+    def evaluate(self, index: CorpusIndex) -> np.ndarray:
+        results = [query.evaluate(index) for query in self.queries]
+        return np.unique(np.concatenate(results)) if len(results) else \
+            np.empty(0, dtype=_POSTINGS_DTYPE)
+
+    def __str__(self):
+        return "(" + " OR ".join(str(query) for query in self.queries) + ")"
+
+
+class Not(Query):
+    query: Query
+
+    def __init__(self, query: Query):
+        self.query = query
+
+    def evaluate(self, index: CorpusIndex) -> np.ndarray:
+        return np.setdiff1d(index.all_documents(), self.query.evaluate(index),
+                            assume_unique=True)
+
+    def __str__(self):
+        return f"NOT {self.query}"
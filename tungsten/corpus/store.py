@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+from collections.abc import Iterable
+from itertools import islice
+from typing import Optional
+
+from tungsten.globally_harmonized_system.safety_data_sheet import (
+    GhsSafetyDataSheet,
+    GhsSdsItem,
+    GhsSdsItemType,
+    GhsSdsJsonEncoder,
+    GhsSdsSection,
+    GhsSdsSectionTitle,
+    GhsSdsSubsection,
+    GhsSdsSubsectionTitle
+)
+from tungsten.parsers.field_parse import FieldMapper, SdsQueryFieldName
+from tungsten.parsers.supplier.sigma_aldrich.field_parse import (
+    SigmaAldrichFieldMapper
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    meta TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    sheet_id INTEGER NOT NULL REFERENCES sheets (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subsections (
+    id INTEGER PRIMARY KEY,
+    section_id INTEGER NOT NULL REFERENCES sections (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    raw_title TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    subsection_id INTEGER NOT NULL REFERENCES subsections (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fields (
+    sheet_id INTEGER NOT NULL REFERENCES sheets (id) ON DELETE CASCADE,
+    field TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    value TEXT,
+    PRIMARY KEY (sheet_id, field, position)
+);
+CREATE INDEX IF NOT EXISTS sections_sheet_id ON sections (sheet_id, position);
+CREATE INDEX IF NOT EXISTS subsections_section_id ON subsections (section_id, position);
+CREATE INDEX IF NOT EXISTS items_subsection_id ON items (subsection_id, position);
+CREATE INDEX IF NOT EXISTS fields_field_value ON fields (field, value);
+"""
+
+_UPSERT_SHEET = "INSERT INTO sheets (id, content_hash, name, meta) VALUES (?, ?, ?, ?) " \
+                "ON CONFLICT (content_hash) DO UPDATE SET name = excluded.name, " \
+                "meta = excluded.meta"
+_INSERT_SECTION = "INSERT INTO sections (id, sheet_id, position, title) VALUES (?, ?, ?, ?)"
+_INSERT_SUBSECTION = "INSERT INTO subsections (id, section_id, position, title, raw_title) " \
+                     "VALUES (?, ?, ?, ?, ?)"
+_INSERT_ITEM = "INSERT INTO items (id, subsection_id, position, type, name, data) " \
+               "VALUES (?, ?, ?, ?, ?, ?)"
+_INSERT_FIELD = "INSERT INTO fields (sheet_id, field, position, value) VALUES (?, ?, ?, ?)"
+
+
+class SdsStore:
+    """Persists parsed sheets and their mapped :class:`SdsQueryFieldName` values in a local
+    SQLite database, with normalized tables for sections, subsections and items.
+
+    Sheets are identified by a content hash, usually the hash of the source PDF (see
+    :func:`content_hash`). Ingesting a sheet whose hash is already stored replaces the stored
+    sheet instead of adding a duplicate."""
+    connection: sqlite3.Connection
+    field_mapper: FieldMapper
+    fields: tuple[SdsQueryFieldName, ...]
+
+    def __init__(self, path: str | os.PathLike, field_mapper: Optional[FieldMapper] = None,
+                 fields: Optional[Iterable[SdsQueryFieldName]] = None):
+        # Transactions are managed explicitly, see ingest()
+        self.connection = sqlite3.connect(path, isolation_level=None, cached_statements=64)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(_SCHEMA)
+        self.field_mapper = field_mapper or SigmaAldrichFieldMapper()
+        self.fields = tuple(fields) if fields is not None else tuple(SdsQueryFieldName)
+
+    def ingest(self, sheets: Iterable[tuple[str, GhsSafetyDataSheet]],
+               batch_size: int = 500) -> int:
+        """Stores `(content_hash, sheet)` pairs, committing one transaction per `batch_size`
+        sheets. Returns the number of sheets stored."""
+        count = 0
+        iterator = iter(sheets)
+        while len(batch := list(islice(iterator, batch_size))):
+            self._ingest_batch(batch)
+            count += len(batch)
+        return count
+
+    def _ingest_batch(self, batch: list[tuple[str, GhsSafetyDataSheet]]) -> None:
+        # Later occurrences of a hash win, as they would if ingested one by one
+        by_hash = dict(batch)
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            existing = self._existing_ids(cursor, list(by_hash.keys()))
+            if len(existing):
+                # Children are replaced wholesale, the sheet row itself is upserted below
+                ids = [(sheet_id,) for sheet_id in existing.values()]
+                cursor.executemany("DELETE FROM sections WHERE sheet_id = ?", ids)
+                cursor.executemany("DELETE FROM fields WHERE sheet_id = ?", ids)
+
+            # Ids are assigned here rather than by SQLite so every table can be filled with a
+            # single executemany() call. This is safe as the transaction holds the write lock.
+            next_ids = {table: cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+                        .fetchone()[0] + 1
+                        for table in ("sheets", "sections", "subsections", "items")}
+            sheet_rows, section_rows, subsection_rows, item_rows, field_rows = [], [], [], [], []
+            for sheet_hash, sds in by_hash.items():
+                sheet_id = existing.get(sheet_hash)
+                if sheet_id is None:
+                    sheet_id = next_ids["sheets"]
+                    next_ids["sheets"] += 1
+                encoded = _encode_sheet(sds)
+                sheet_rows.append((sheet_id, sheet_hash, sds.name, json.dumps(encoded["meta"])))
+                for section_position, section in enumerate(encoded["sections"]):
+                    section_id = next_ids["sections"]
+                    next_ids["sections"] += 1
+                    section_rows.append((section_id, sheet_id, section_position,
+                                         section["title"]))
+                    for subsection_position, subsection in enumerate(section["subsections"]):
+                        subsection_id = next_ids["subsections"]
+                        next_ids["subsections"] += 1
+                        subsection_rows.append((subsection_id, section_id, subsection_position,
+                                                subsection["title"], subsection["raw_title"]))
+                        for item_position, item in enumerate(subsection["items"]):
+                            item_rows.append((next_ids["items"], subsection_id, item_position,
+                                              item["type"], item["name"],
+                                              json.dumps(item["data"])))
+                            next_ids["items"] += 1
+                for field in self.fields:
+                    for position, value in enumerate(self._field_values(field, encoded)):
+                        field_rows.append((sheet_id, field.name, position, value))
+
+            cursor.executemany(_UPSERT_SHEET, sheet_rows)
+            cursor.executemany(_INSERT_SECTION, section_rows)
+            cursor.executemany(_INSERT_SUBSECTION, subsection_rows)
+            cursor.executemany(_INSERT_ITEM, item_rows)
+            cursor.executemany(_INSERT_FIELD, field_rows)
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _existing_ids(cursor: sqlite3.Cursor, hashes: list[str]) -> dict[str, int]:
+        existing: dict[str, int] = {}
+        # Stay below SQLite's default limit on the number of host parameters
+        for start in range(0, len(hashes), 900):
+            chunk = hashes[start:start + 900]
+            existing.update((sheet_hash, sheet_id) for sheet_id, sheet_hash in cursor.execute(
+                f"SELECT id, content_hash FROM sheets WHERE content_hash IN "
+                f"({', '.join('?' * len(chunk))})", chunk))
+        return existing
+
+    def _field_values(self, field: SdsQueryFieldName, encoded: dict) -> list[Optional[str]]:
+        """Returns the mapped value of a field as stored rows. Lists of scalars, like statement
+        codes, are stored one row per element so they can be looked up through the index."""
+        try:
+            value = self.field_mapper.get_field(field, encoded)
+        except (KeyError, TypeError):
+            value = None
+        if value is None:
+            return []
+        if isinstance(value, list) and all(isinstance(v, (str, int, float)) for v in value):
+            return [str(v) for v in value]
+        if isinstance(value, (str, int, float)):
+            return [str(value)]
+        return [json.dumps(value, cls=GhsSdsJsonEncoder)]
+
+    def find(self, field: SdsQueryFieldName, value: str) -> list[str]:
+        """Returns the content hashes of the sheets whose mapped `field` has the value."""
+        return [row[0] for row in self.connection.execute(
+            "SELECT DISTINCT sheets.content_hash FROM fields "
+            "JOIN sheets ON sheets.id = fields.sheet_id "
+            "WHERE fields.field = ? AND fields.value = ?", (field.name, value))]
+
+    def get_fields(self, sheet_hash: str) -> dict[SdsQueryFieldName, list[str]]:
+        """Returns the stored field values of a sheet."""
+        fields: dict[SdsQueryFieldName, list[str]] = {}
+        for field, value in self.connection.execute(
+                "SELECT fields.field, fields.value FROM fields "
+                "JOIN sheets ON sheets.id = fields.sheet_id "
+                "WHERE sheets.content_hash = ? ORDER BY fields.field, fields.position",
+                (sheet_hash,)):
+            fields.setdefault(SdsQueryFieldName[field], []).append(value)
+        return fields
+
+    def load(self, sheet_hash: str) -> Optional[GhsSafetyDataSheet]:
+        """Reconstructs a stored sheet, or returns None if no sheet has the content hash."""
+        row = self.connection.execute("SELECT id, name, meta FROM sheets WHERE content_hash = ?",
+                                      (sheet_hash,)).fetchone()
+        if row is None:
+            return None
+        sheet_id, name, meta = row
+        sections: dict[int, GhsSdsSection] = {}
+        subsections: dict[int, GhsSdsSubsection] = {}
+        for section_id, title in self.connection.execute(
+                "SELECT id, title FROM sections WHERE sheet_id = ? ORDER BY position",
+                (sheet_id,)):
+            sections[section_id] = GhsSdsSection(GhsSdsSectionTitle[title], [])
+        for subsection_id, section_id, title, raw_title in self.connection.execute(
+                "SELECT subsections.id, subsections.section_id, subsections.title, "
+                "subsections.raw_title FROM subsections "
+                "JOIN sections ON sections.id = subsections.section_id "
+                "WHERE sections.sheet_id = ? ORDER BY subsections.position", (sheet_id,)):
+            subsection = GhsSdsSubsection(GhsSdsSubsectionTitle[title], [], raw_title)
+            subsections[subsection_id] = subsection
+            sections[section_id].subsections.append(subsection)
+        for subsection_id, item_type, item_name, data in self.connection.execute(
+                "SELECT items.subsection_id, items.type, items.name, items.data FROM items "
+                "JOIN subsections ON subsections.id = items.subsection_id "
+                "JOIN sections ON sections.id = subsections.section_id "
+                "WHERE sections.sheet_id = ? ORDER BY items.position", (sheet_id,)):
+            subsections[subsection_id].items.append(
+                GhsSdsItem(type=GhsSdsItemType[item_type], name=item_name, data=json.loads(data)))
+        return GhsSafetyDataSheet(name=name, meta=json.loads(meta),
+                                  sections=list(sections.values()))
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM sheets").fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def _encode_sheet(sds: GhsSafetyDataSheet) -> dict:
+    """Returns the same structure as `json.loads(sds.dumps())`, which the field mappers operate
+    on, without the deep copies made by :func:`dataclasses.asdict`."""
+    def encode(data: any) -> any:
+        if isinstance(data, list) and all(isinstance(x, str) for x in data):
+            return list(data)
+        return json.loads(json.dumps(data, cls=GhsSdsJsonEncoder))
+
+    return {
+        "name": sds.name,
+        "meta": encode(sds.meta),
+        "sections": [{
+            "title": section.title.name,
+            "subsections": [{
+                "title": subsection.title.name,
+                "items": [{
+                    "type": item.type.name,
+                    "name": item.name,
+                    "data": encode(item.data)
+                } for item in subsection.items],
+                "raw_title": subsection.raw_title
+            } for subsection in section.subsections]
+        } for section in sds.sections]
+    }
+
+
+def content_hash(data: bytes) -> str:
+    """Returns the content hash used to identify a sheet, given the bytes of its source PDF."""
+    return hashlib.sha256(data).hexdigest()
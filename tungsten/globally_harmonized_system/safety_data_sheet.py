@@ -362,6 +362,7 @@ class GhsSdsItemType(Enum):
     LIST = enum.auto()
     FIGURE_HAZARD = enum.auto()
     FIGURE_OTHER = enum.auto()
+    TABLE = enum.auto()
 
 
 def child_string(child_iterable, heading="", indent="| ", direct_child_indent="|-") -> str:
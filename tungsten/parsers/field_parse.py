@@ -2,10 +2,15 @@ from __future__ import annotations
 
 import abc
 import enum
+from collections.abc import Iterable
 from dataclasses import dataclass
 from enum import Enum
 from re import Pattern
-from typing import Callable
+from typing import Callable, Optional
+
+from tungsten.globally_harmonized_system.safety_data_sheet import (
+    GhsSdsSectionTitle
+)
 
 
 class FieldMapper(metaclass=abc.ABCMeta):
@@ -14,6 +19,28 @@ class FieldMapper(metaclass=abc.ABCMeta):
         commands, post_process = mapping
         return self.execute_query(target, commands, post_process)
 
+    def parse_plan(self, fields: Iterable[SdsQueryFieldName]) -> Optional[ParsePlan]:
+        """Returns the parts of a sheet that the mappings of `fields` read from, or None if a
+        mapping reads from somewhere other than a titled section or a meta key."""
+        sections: set[GhsSdsSectionTitle] = set()
+        meta_keys: set[str] = set()
+        for field in fields:
+            try:
+                commands, _ = self.get_field_mappings(field)
+            except KeyError:
+                # A field without a mapping reads nothing, its value is None
+                continue
+            match commands:
+                case [SelectCommand(key="sections"),
+                      SelectCommand(key="title", where_value=str(title)), *_] \
+                        if title in GhsSdsSectionTitle.__members__:
+                    sections.add(GhsSdsSectionTitle[title])
+                case [SelectCommand(key="meta"), SelectCommand(key=str(key)), *_]:
+                    meta_keys.add(key)
+                case _:
+                    return None
+        return ParsePlan(frozenset(sections), frozenset(meta_keys))
+
     @staticmethod
     def execute_query(target: dict, commands: list[SelectCommand], post_process):
         for command in commands:
@@ -29,6 +56,14 @@ class FieldMapper(metaclass=abc.ABCMeta):
         pass
 
 
+@dataclass(frozen=True)
+class ParsePlan:
+    """Parts of a sheet that a set of queried fields is read from, which lets a parser skip the
+    work that produces anything else."""
+    sections: frozenset[GhsSdsSectionTitle]
+    meta_keys: frozenset[str]
+
+
 @dataclass
 class SelectCommand:
     key: str
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from typing import Optional
+
+from pdfminer.pdffont import PDFFont
+from pdfminer.pdfinterp import PDFResourceManager
+from pdfminer.pdftypes import PDFStream
+
+from tungsten.parsers.page_cache import detach_pdf_object, hash_pdf_object
+from tungsten.parsers.result_cache import MemoryTier, TieredCache
+
+
+class FontCache(TieredCache):
+    """Bounded least-recently-used store of pdfminer.six fonts, shared by the documents parsed
+    in a process. Fonts are keyed by a hash of the font dictionary and everything it references
+    (see :func:`hash_pdf_object`), including embedded font programs, encodings and ToUnicode
+    CMaps, so a font embedded by many sheets is only parsed once. Safe to use from multiple
+    threads.
+
+    The cache holds up to `max_entries` fonts, whose embedded font programs, which the fonts
+    keep, take up to `max_bytes` in total. The other data of a font, such as its widths and
+    character maps, is not counted."""
+
+    def __init__(self, max_entries: int = 256, max_bytes: Optional[int] = 64 * 1024 * 1024):
+        super().__init__(MemoryTier(max_entries, max_bytes, font_program_size))
+
+    def get(self, font_hash: str) -> Optional[PDFFont]:
+        """Returns the font with the hash, or None if it is not cached."""
+        return super().get(font_hash)
+
+    def put(self, font_hash: str, font: PDFFont) -> None:
+        """Stores a font, evicting the least recently used fonts if the cache is full."""
+        super().put(font_hash, font)
+
+    @property
+    def size(self) -> int:
+        """Total size of the embedded font programs of the cached fonts."""
+        return self.tiers[0].size
+
+    def __len__(self):
+        return len(self.tiers[0])
+
+
+def font_program_size(font: PDFFont) -> int:
+    """Returns the size of the font programs embedded in the descriptor of a font, as stored in
+    the PDF."""
+    return sum(len(value.rawdata if value.rawdata is not None else value.data or b"")
+               for value in font.descriptor.values() if isinstance(value, PDFStream))
+
+
+class CachingResourceManager(PDFResourceManager):
+    """Resource manager that takes fonts from a :class:`FontCache`, and creates fonts missing
+    from it from a copy of their dictionary that no longer references the document (see
+    :func:`detach_pdf_object`), so cached fonts do not keep the documents they were read from
+    alive."""
+    font_cache: FontCache
+
+    def __init__(self, font_cache: Optional[FontCache] = None):
+        super().__init__(caching=True)
+        self.font_cache = font_cache if font_cache is not None else default_font_cache()
+
+    def get_font(self, objid: object, spec: Mapping[str, object]) -> PDFFont:
+        # Fonts already used by this document are found by object number, without hashing
+        if objid and objid in self._cached_fonts:
+            return self._cached_fonts[objid]
+        font_hash = hash_pdf_object(spec)
+        font = self.font_cache.get(font_hash)
+        if font is None:
+            font = super().get_font(None, detach_pdf_object(spec))
+            self.font_cache.put(font_hash, font)
+        if objid:
+            self._cached_fonts[objid] = font
+        return font
+
+
+_default_cache: Optional[FontCache] = None
+
+
+def default_font_cache() -> FontCache:
+    """Returns the :class:`FontCache` shared by the parses of a process that are not given
+    one."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = FontCache()
+    return _default_cache
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import os
+import pickle
+import zlib
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from pdfminer.layout import LTItem
+
+from tungsten.parsers.parsing_hierarchy import (
+    HierarchyElement,
+    HierarchyTree,
+    HierarchyTreeNode
+)
+from tungsten.parsers.result_cache import MemoryTier, SqliteTier, TieredCache
+
+# Numeric attributes of a HierarchyElement, in the order they are packed
+_COORDINATES = ("page_num", "page_x0", "page_y0", "page_x1", "page_y1",
+                "document_x0", "document_y0", "document_x1", "document_y1")
+
+
+@dataclass(frozen=True)
+class HierarchyCheckpoint:
+    """The state of a parse once the injections are applied to its hierarchy, from which the
+    sheet is created (see :meth:`SdsParser.replay_checkpoint`): the hierarchy, and the meta
+    injections such as the pictograms found."""
+    root: HierarchyTreeNode
+    meta: list[dict]
+
+    def to_bytes(self) -> bytes:
+        """Packs the checkpoint into a compressed array per element attribute. Layout components
+        of pdfminer.six are left out of the elements, only their text, class name and
+        coordinates are kept; other elements, such as tables placed by injectors, are kept."""
+        tree = self.root.tree
+        nodes = tree.preorder(self.root.index)
+        # Parents are packed as positions in the preorder, so detached nodes are left out
+        position = np.full(len(tree.elements), -1, dtype=np.int64)
+        position[nodes] = np.arange(len(nodes))
+        parents = position[np.array(tree.parent, dtype=np.int64)[nodes[1:]]].astype(np.int32)
+        elements = [tree.elements[node] for node in nodes[1:].tolist()]
+        coordinates = np.array([[getattr(element, name) for name in _COORDINATES]
+                                for element in elements], dtype=np.float64)
+        kept = {i: element.element for i, element in enumerate(elements)
+                if element.element is not None and not isinstance(element.element, LTItem)}
+        return zlib.compress(pickle.dumps((
+            parents.tobytes(), coordinates.tobytes(),
+            [element.text_content for element in elements],
+            [element.class_name for element in elements],
+            kept, self.meta,
+        ), protocol=pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> HierarchyCheckpoint:
+        """Unpacks a checkpoint packed by :meth:`to_bytes` into a new tree."""
+        parents, coordinates, texts, class_names, kept, meta = pickle.loads(zlib.decompress(data))
+        parents = np.frombuffer(parents, dtype=np.int32).tolist()
+        coordinates = np.frombuffer(coordinates, dtype=np.float64) \
+            .reshape(-1, len(_COORDINATES)).tolist()
+        tree = HierarchyTree()
+        # Nodes are added in preorder, so a node's parent is always added before it
+        indices = [tree.root.index]
+        for i, (parent, values) in enumerate(zip(parents, coordinates)):
+            element = HierarchyElement(int(values[0]), *values[1:], element=kept.get(i),
+                                       text_content=texts[i], class_name=class_names[i])
+            indices.append(tree.add_node(indices[parent], element))
+        return cls(tree.root, meta)
+
+
+class HierarchyCache(TieredCache):
+    """Bounded least-recently-used store of :class:`HierarchyCheckpoint` objects, keyed by
+    parser and a digest of the PDF (see :meth:`PdfSource.digest`). A parser given the cache
+    creates the sheets of PDFs it parsed before from their checkpoint, with its current rules
+    and field mapper, without layout analysis or injectors. Checkpoints are packed (see
+    :meth:`HierarchyCheckpoint.to_bytes`) in every tier, so a few kilobytes each.
+
+    If a `path` is given, checkpoints are also persisted in a SQLite database, which outlives
+    the process and can be shared between processes, holding up to `max_persisted_entries`
+    checkpoints. Safe to use from multiple threads."""
+
+    def __init__(self, max_entries: int = 256, path: Optional[str | os.PathLike] = None,
+                 max_persisted_entries: int = 65536):
+        super().__init__(MemoryTier(max_entries),
+                         *(() if path is None else (SqliteTier(path, max_persisted_entries),)))
+
+    def get(self, key: str) -> Optional[HierarchyCheckpoint]:
+        """Returns a new copy of the checkpoint, or None if it is not cached."""
+        data = super().get(key)
+        return None if data is None else HierarchyCheckpoint.from_bytes(data)
+
+    def put(self, key: str, checkpoint: HierarchyCheckpoint) -> None:
+        """Stores a checkpoint, evicting the least recently used entries if the cache is
+        full."""
+        super().put(key, checkpoint.to_bytes())
+
+    def checkpoints(self) -> Iterator[tuple[str, HierarchyCheckpoint]]:
+        """Yields every checkpoint of the slowest tier, the database if there is one, with its
+        key, e.g. to replay a new version of the rules over every sheet parsed before."""
+        tier = self.tiers[-1]
+        for key in tier.keys():
+            data = tier.get(key)
+            if data is not None:
+                yield key, HierarchyCheckpoint.from_bytes(data)
+
+    def __len__(self):
+        return len(self.tiers[0])
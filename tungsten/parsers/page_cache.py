@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import IO, Any, Optional
+
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import PDFObjRef, PDFStream
+from pdfminer.psparser import PSKeyword, PSLiteral
+
+
+class PageCache:
+    """Bounded least-recently-used store of per-page parsing results, keyed by the name of the
+    stage that produced them and the content hash of the page (see :func:`hash_pdf_pages`). Safe
+    to use from multiple threads, such as the stages of a :class:`BatchPipeline`."""
+    max_entries: int
+    _entries: OrderedDict[tuple[str, str], Any]
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, stage: str, page_hash: str) -> Optional[Any]:
+        """Returns the cached result of `stage` for the page, or None if there is none."""
+        key = (stage, page_hash)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, stage: str, page_hash: str, result: Any) -> None:
+        """Stores the result of `stage` for the page, evicting the least recently used entries
+        if the cache is full."""
+        key = (stage, page_hash)
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def hash_pdf_pages(io: IO[bytes], max_pages: Optional[int] = None) -> list[str]:
+    """Returns a digest for each page of a PDF, in page order, stopping after `max_pages` pages
+    if given. The digest covers the raw (undecoded) content streams, the resources the page draws
+    from and the page geometry, so two pages with equal digests produce identical parsing results.
+    Object numbers are not part of the digest, so a page keeps its digest when the rest of the
+    document is renumbered."""
+    # noinspection PyTypeChecker
+    document = PDFDocument(PDFParser(io))
+    page_hashes = []
+    for page in PDFPage.create_pages(document):
+        if max_pages is not None and len(page_hashes) >= max_pages:
+            break
+        digest = hashlib.blake2b(digest_size=16)
+        memo: dict[int, Optional[bytes]] = {}
+        for name, value in (("MediaBox", page.mediabox), ("CropBox", page.cropbox),
+                            ("Rotate", page.rotate), ("Contents", page.contents),
+                            ("Resources", page.resources)):
+            digest.update(name.encode())
+            digest.update(_object_digest(value, memo))
+        page_hashes.append(digest.hexdigest())
+    return page_hashes
+
+
+def hash_pdf_object(obj: Any) -> str:
+    """Returns a digest of a PDF object and everything it references, such as an image stream
+    with its raw data and palette. Like page digests, it does not depend on object numbers."""
+    return _object_digest(obj, {}).hex()
+
+
+def detach_pdf_object(obj: Any) -> Any:
+    """Returns a copy of a PDF object with every indirect reference resolved and every encrypted
+    stream decrypted, so it no longer depends on its document: it can be used after the document
+    is closed, and pickled. References to the same object are copied once and stay shared."""
+    return _detached(obj, {})
+
+
+def _detached(obj: Any, memo: dict[int, Any]) -> Any:
+    if isinstance(obj, PDFObjRef):
+        if obj.objid not in memo:
+            resolved = obj.resolve()
+            # Containers are registered before their items are copied, to end cycles
+            if isinstance(resolved, dict):
+                memo[obj.objid] = {}
+                memo[obj.objid].update(_detached(resolved, memo))
+            elif isinstance(resolved, list):
+                memo[obj.objid] = []
+                memo[obj.objid].extend(_detached(resolved, memo))
+            else:
+                memo[obj.objid] = _detached(resolved, memo)
+        return memo[obj.objid]
+    if isinstance(obj, PDFStream):
+        if obj.rawdata is None:
+            # Already decoded
+            stream = PDFStream(_detached(obj.attrs, memo), b"")
+            stream.data, stream.rawdata = obj.data, None
+        elif obj.decipher is not None:
+            stream = PDFStream(_detached(obj.attrs, memo),
+                               obj.decipher(obj.objid, obj.genno, obj.rawdata, obj.attrs))
+        else:
+            stream = PDFStream(_detached(obj.attrs, memo), obj.rawdata)
+        stream.set_objid(obj.objid, obj.genno)
+        return stream
+    if isinstance(obj, dict):
+        return {key: _detached(value, memo) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_detached(item, memo) for item in obj]
+    return obj
+
+
+def _object_digest(obj: Any, memo: dict[int, Optional[bytes]]) -> bytes:
+    """Returns a digest of a PDF object, following indirect references. `memo` holds the digests
+    of already visited indirect objects; a reference that is still being visited (a cycle) is
+    replaced by a fixed marker."""
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in memo:
+            return memo[obj.objid] or b"<cycle>"
+        memo[obj.objid] = None
+        memo[obj.objid] = _object_digest(obj.resolve(), memo)
+        return memo[obj.objid]
+
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(obj, PDFStream):
+        digest.update(b"stream")
+        digest.update(_object_digest(obj.attrs, memo))
+        # Streams that were already decoded elsewhere only keep their decoded data
+        raw = obj.rawdata if obj.rawdata is not None else b"decoded" + (obj.data or b"")
+        digest.update(hashlib.blake2b(raw, digest_size=16).digest())
+    elif isinstance(obj, dict):
+        digest.update(b"dict")
+        for key in sorted(obj.keys(), key=str):
+            digest.update(str(key).encode())
+            digest.update(_object_digest(obj[key], memo))
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b"list")
+        for item in obj:
+            digest.update(_object_digest(item, memo))
+    elif isinstance(obj, PSLiteral):
+        digest.update(b"/" + str(obj.name).encode())
+    elif isinstance(obj, PSKeyword):
+        digest.update(b"kw" + bytes(obj.name))
+    elif isinstance(obj, bytes):
+        digest.update(b"bytes" + obj)
+    else:
+        digest.update(repr(obj).encode())
+    return digest.digest()
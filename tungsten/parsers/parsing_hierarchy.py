@@ -1,5 +1,10 @@
 from __future__ import annotations
 
+from collections.abc import Iterable, Sequence
+from typing import Optional
+
+import numpy as np
+
 
 class HierarchyNode:
     """Represents a node in the hierarchy of ParsingElements,
@@ -18,6 +23,16 @@ class HierarchyNode:
         self.children = []
         self.is_root = is_root
 
+    def preorder(self) -> list[HierarchyNode]:
+        """Returns this node and all nodes below it, in preorder (depth first)."""
+        nodes: list[HierarchyNode] = []
+        stack: list[HierarchyNode] = [self]
+        while len(stack):
+            hand = stack.pop()
+            nodes.append(hand)
+            stack.extend(reversed(hand.children))
+        return nodes
+
     def __str__(self):
         # The general indent to denote child elements
         indent = "| "
@@ -87,3 +102,259 @@ class HierarchyElement:
         # Used during serialization to JSON
         s = f"{self.text_content.strip() if self.text_content.strip() != '' else self.class_name}"
         return s
+
+
+class PageLayout:
+    """The layout components of a single PDF page, as produced by the layout analysis.
+    Components keep page coordinates, document coordinates are assigned once the layouts of all
+    pages are known."""
+    page_length: float
+    components: list[any]
+
+    def __init__(self, page_length: float, components: list[any]):
+        self.page_length = page_length
+        self.components = components
+
+
+class HierarchyTree:
+    """A hierarchy of :class:`HierarchyElement` objects stored in flat arrays rather than as one
+    object per node. Nodes are numbered in the order they are added, node 0 being the root,
+    which holds no element, and keep their number for the life of the tree. Each node has the
+    index of its parent, first child, last child and next sibling, -1 meaning none.
+
+    Traversals use a preorder index of the tree, which is built in O(n) when first needed after
+    the tree changes. With the index, the nodes of any subtree are a slice of the preorder, and
+    removing many subtrees at once takes O(n). :meth:`node` returns a :class:`HierarchyTreeNode`,
+    which gives a node the :class:`HierarchyNode` API."""
+    elements: list[Optional[HierarchyElement]]  # Element of each node
+    parent: list[int]
+    first_child: list[int]
+    last_child: list[int]
+    next_sibling: list[int]
+
+    def __init__(self):
+        self.elements = [None]
+        self.parent = [-1]
+        self.first_child = [-1]
+        self.last_child = [-1]
+        self.next_sibling = [-1]
+        self._columns: dict[str, np.ndarray] = {}
+        self._invalidate()
+
+    @property
+    def root(self) -> HierarchyTreeNode:
+        return HierarchyTreeNode(self, 0)
+
+    def node(self, index: int) -> HierarchyTreeNode:
+        return HierarchyTreeNode(self, index)
+
+    def add_node(self, parent: int, element: HierarchyElement) -> int:
+        """Adds a node holding `element` as the last child of `parent`, and returns it."""
+        index = len(self.elements)
+        self.elements.append(element)
+        self.parent.append(-1)
+        self.first_child.append(-1)
+        self.last_child.append(-1)
+        self.next_sibling.append(-1)
+        self._append_child(parent, index)
+        self._invalidate()
+        return index
+
+    def children(self, node: int) -> list[int]:
+        """Returns the children of a node, in order."""
+        children = []
+        child = self.first_child[node]
+        while child != -1:
+            children.append(child)
+            child = self.next_sibling[child]
+        return children
+
+    def set_children(self, node: int, children: Sequence[int]) -> None:
+        """Makes `children`, with their subtrees, the children of a node, in order. Former
+        children that are left out are detached from the tree. Nodes moved from another parent
+        must also be left out of that parent's children."""
+        self.first_child[node] = -1
+        self.last_child[node] = -1
+        for child in children:
+            self.next_sibling[child] = -1
+            self._append_child(node, child)
+        self._invalidate()
+
+    def move(self, node: int, parent: int) -> None:
+        """Moves a node, with its subtree, to be the last child of `parent`."""
+        old_parent = self.parent[node]
+        if old_parent != -1 and node in self.children(old_parent):
+            self.set_children(old_parent, [child for child in self.children(old_parent)
+                                           if child != node])
+        self.next_sibling[node] = -1
+        self._append_child(parent, node)
+        self._invalidate()
+
+    def preorder(self, node: int = 0) -> np.ndarray:
+        """Returns the nodes of the subtree of a node, starting with the node, in preorder."""
+        self._index()
+        position = self._position[node]
+        if position == -1:
+            raise ValueError(f"Node {node} is not in the tree.")
+        return self._order[position:position + self._size[node]]
+
+    def delete(self, nodes: Iterable[int]) -> None:
+        """Removes nodes, with their subtrees, from the tree, in O(n) for any number of nodes.
+        The root cannot be removed."""
+        self._index()
+        positions = self._position[np.fromiter(nodes, dtype=np.int64)]
+        positions = positions[positions > 0]
+        if not len(positions):
+            return
+        # Subtrees are contiguous ranges of the preorder, a position is removed if any range
+        # covers it
+        covering = np.zeros(len(self._order) + 1, dtype=np.int64)
+        np.add.at(covering, positions, 1)
+        np.add.at(covering, positions + self._size[self._order[positions]], -1)
+        kept = self._order[np.cumsum(covering[:-1]) == 0]
+
+        # Relink the remaining nodes, the children of a node keep their order in the preorder
+        parent = np.array(self.parent, dtype=np.int64)
+        first_child = np.array(self.first_child, dtype=np.int64)
+        last_child = np.array(self.last_child, dtype=np.int64)
+        next_sibling = np.array(self.next_sibling, dtype=np.int64)
+        first_child[self._order] = -1
+        last_child[self._order] = -1
+        next_sibling[self._order] = -1
+        children = kept[1:]
+        if len(children):
+            children = children[np.argsort(parent[children], kind="stable")]
+            parents = parent[children]
+            same_parent = parents[1:] == parents[:-1]
+            next_sibling[children[:-1][same_parent]] = children[1:][same_parent]
+            first = np.concatenate(([True], ~same_parent))
+            last = np.concatenate((~same_parent, [True]))
+            first_child[parents[first]] = children[first]
+            last_child[parents[last]] = children[last]
+        self.first_child = first_child.tolist()
+        self.last_child = last_child.tolist()
+        self.next_sibling = next_sibling.tolist()
+        self._invalidate()
+
+    def column(self, name: str) -> np.ndarray:
+        """Returns an attribute of the element of every node, such as "page_y0", as a float
+        array indexed by node. The root's value is NaN."""
+        # Elements never change, so only the values of nodes added since are read
+        values = self._columns.get(name, np.full(1, np.nan))
+        if len(values) < len(self.elements):
+            values = np.concatenate((values, np.array(
+                [getattr(element, name) for element in self.elements[len(values):]],
+                dtype=np.float64)))
+            self._columns[name] = values
+        return values
+
+    @classmethod
+    def from_node(cls, root: HierarchyNode) -> HierarchyTree:
+        """Returns a tree holding the hierarchy below a :class:`HierarchyNode`."""
+        tree = cls()
+        stack: list[tuple[int, HierarchyNode]] = [(0, child) for child in reversed(root.children)]
+        while len(stack):
+            parent, hand = stack.pop()
+            index = tree.add_node(parent, hand.data)
+            stack.extend((index, child) for child in reversed(hand.children))
+        return tree
+
+    def _append_child(self, parent: int, child: int) -> None:
+        self.parent[child] = parent
+        if self.last_child[parent] == -1:
+            self.first_child[parent] = child
+        else:
+            self.next_sibling[self.last_child[parent]] = child
+        self.last_child[parent] = child
+
+    def _invalidate(self) -> None:
+        self._order: Optional[np.ndarray] = None
+        self._position: Optional[np.ndarray] = None
+        self._size: Optional[np.ndarray] = None
+
+    def _index(self) -> None:
+        """Builds the preorder of the nodes in the tree, the position of each node in it (-1
+        for detached nodes) and the size of each node's subtree."""
+        if self._order is not None:
+            return
+        first_child, next_sibling = self.first_child, self.next_sibling
+        order: list[int] = []
+        stack = [0]
+        while len(stack):
+            node = stack.pop()
+            order.append(node)
+            children = []
+            child = first_child[node]
+            while child != -1:
+                children.append(child)
+                child = next_sibling[child]
+            # Siblings are pushed last first, so they are visited in order
+            stack.extend(reversed(children))
+        size = [1] * len(self.elements)
+        parent = self.parent
+        for node in reversed(order[1:]):
+            size[parent[node]] += size[node]
+        self._order = np.array(order, dtype=np.int64)
+        self._position = np.full(len(self.elements), -1, dtype=np.int64)
+        self._position[self._order] = np.arange(len(order))
+        self._size = np.array(size, dtype=np.int64)
+
+    def __len__(self):
+        """Returns the number of nodes in the tree, including the root."""
+        self._index()
+        return len(self._order)
+
+
+class HierarchyTreeNode(HierarchyNode):
+    """A view of a node of a :class:`HierarchyTree` with the :class:`HierarchyNode` API.
+    `children` is a new list of views on every access, so the tree is changed through
+    :meth:`add_child` and the methods of the tree rather than by modifying the list."""
+    tree: HierarchyTree
+    index: int
+
+    # noinspection PyMissingConstructor
+    def __init__(self, tree: HierarchyTree, index: int):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def data(self) -> Optional[HierarchyElement]:
+        return self.tree.elements[self.index]
+
+    @property
+    def children(self) -> list[HierarchyTreeNode]:
+        return [HierarchyTreeNode(self.tree, child) for child in self.tree.children(self.index)]
+
+    @property
+    def parent(self) -> Optional[HierarchyTreeNode]:
+        parent = self.tree.parent[self.index]
+        return None if parent == -1 else HierarchyTreeNode(self.tree, parent)
+
+    @property
+    def is_root(self) -> bool:
+        return self.index == 0
+
+    def add_child(self, new_child: HierarchyNode):
+        """Moves a node of the same tree below this node, or adds a copy of the hierarchy below
+        any other node."""
+        if new_child.is_root:
+            raise ValueError("The child of a hierarchy node cannot be a root node.")
+        if isinstance(new_child, HierarchyTreeNode) and new_child.tree is self.tree:
+            self.tree.move(new_child.index, self.index)
+            return
+        stack: list[tuple[int, HierarchyNode]] = [(self.index, new_child)]
+        while len(stack):
+            parent, hand = stack.pop()
+            index = self.tree.add_node(parent, hand.data)
+            stack.extend((index, child) for child in reversed(hand.children))
+
+    def preorder(self) -> list[HierarchyTreeNode]:
+        return [HierarchyTreeNode(self.tree, node)
+                for node in self.tree.preorder(self.index).tolist()]
+
+    def __eq__(self, other):
+        return isinstance(other, HierarchyTreeNode) and other.tree is self.tree \
+            and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
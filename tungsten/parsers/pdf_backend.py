@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import abc
+import contextvars
+import math
+import os
+import weakref
+from collections.abc import Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from itertools import count
+from typing import IO, Optional
+
+import numpy as np
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import (
+    LAParams,
+    LTAnno,
+    LTChar,
+    LTComponent,
+    LTContainer,
+    LTImage,
+    LTPage,
+    LTTextBox,
+    LTTextBoxHorizontal,
+    LTTextLineHorizontal
+)
+from pdfminer.pdfinterp import PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+
+from tungsten.parsers.font_cache import CachingResourceManager, FontCache
+from tungsten.parsers.page_cache import detach_pdf_object
+from tungsten.parsers.parsing_hierarchy import PageLayout
+from tungsten.parsers.pdf_source import PdfSource
+from tungsten.parsers.sds_parser import (
+    check_page_limit,
+    check_stage_deadline,
+    reserve_layout_elements,
+    resource_limits,
+    stage_time_remaining
+)
+
+
+class PdfBackend(metaclass=abc.ABCMeta):
+    """Extracts the text layout of PDF pages. Backends produce pdfminer.six layout components
+    (text boxes, figures, curves, ...), so parsers work the same with any of them."""
+    name: str
+
+    @abc.abstractmethod
+    def iter_page_layouts(self, io: IO[bytes], page_numbers: Optional[set[int]] = None) -> \
+            Iterator[tuple[int, PageLayout]]:
+        """Lazily yields the page number and :class:`PageLayout` of the given pages (1-indexed,
+        all pages if None) of a PDF, in page order. Pages are only laid out as they are consumed,
+        and the stage deadline (see :func:`check_stage_deadline`) is checked before laying out
+        every page but the first. Raises :class:`ResourceLimitError` before laying out a page
+        beyond `max_pages`, and when a page takes the layout elements beyond
+        `max_layout_elements`."""
+        pass
+
+
+class PdfminerBackend(PdfBackend):
+    """Lays out pages with the layout analysis of pdfminer.six. Fonts are taken from
+    `font_cache`, the :class:`FontCache` of the process if None, so fonts shared by the
+    documents laid out are only parsed once."""
+    name = "pdfminer"
+    laparams: LAParams
+    font_cache: Optional[FontCache]
+
+    def __init__(self, laparams: Optional[LAParams] = None,
+                 font_cache: Optional[FontCache] = None):
+        self.laparams = laparams or LAParams()
+        self.font_cache = font_cache
+
+    def iter_page_layouts(self, io: IO[bytes], page_numbers: Optional[set[int]] = None) -> \
+            Iterator[tuple[int, PageLayout]]:
+        # pdfminer.six numbers pages from 0, and yields the requested pages in order
+        pdfm_page_numbers = None if page_numbers is None else {n - 1 for n in page_numbers}
+        page_number_iter = count(1) if page_numbers is None else iter(sorted(page_numbers))
+        # Like pdfminer.high_level.extract_pages, but driven page by page
+        resource_manager = CachingResourceManager(self.font_cache)
+        device = PDFPageAggregator(resource_manager, laparams=self._device_laparams())
+        interpreter = PDFPageInterpreter(resource_manager, device)
+        # noinspection PyTypeChecker
+        pages = PDFPage.get_pages(io, pdfm_page_numbers, caching=True)
+        for i, (page_number, page) in enumerate(zip(page_number_iter, pages)):
+            # Layout analysis can stop between pages if it is out of time, but always lays out
+            # at least one page
+            if i > 0:
+                check_stage_deadline()
+            check_page_limit(page_number)
+            interpreter.process_page(page)
+            layout = device.get_result()
+            components = self._components(layout)
+            reserve_layout_elements(len(components))
+            yield page_number, PageLayout(page_length=layout.y1 - layout.y0,
+                                          components=components)
+
+    def _device_laparams(self) -> Optional[LAParams]:
+        """Returns the layout parameters the pdfminer.six device analyzes pages with."""
+        return self.laparams
+
+    def __getstate__(self):
+        # Font caches belong to their process, an unpickled backend uses its process's cache
+        state = self.__dict__.copy()
+        state["font_cache"] = None
+        return state
+
+    def _components(self, page: LTPage) -> list[LTComponent]:
+        """Returns the layout components of a page produced by the device."""
+        return list(page)
+
+
+class NumpyLinesBackend(PdfminerBackend):
+    """Interprets pages with pdfminer.six, but skips its layout analysis and groups characters
+    into lines with vectorized NumPy operations instead. Lines are then grouped into text boxes;
+    where no lines are close enough to share a box, which with `line_margin=0` is nearly always,
+    every line becomes its own box without pdfminer.six's neighbour search.
+
+    The resulting lines and boxes are the same as pdfminer.six's for horizontal text
+    (`detect_vertical` is not supported). Boxes are returned in reading order of their first
+    line rather than by `boxes_flow`, as parsers order components by position anyway."""
+    name = "numpy"
+
+    def __init__(self, laparams: Optional[LAParams] = None,
+                 font_cache: Optional[FontCache] = None):
+        super().__init__(laparams, font_cache)
+        if self.laparams.detect_vertical:
+            raise ValueError(f"{self.__class__.__name__} does not support vertical text.")
+
+    def _device_laparams(self) -> Optional[LAParams]:
+        # Without layout parameters the device leaves pages unanalyzed
+        return None
+
+    def _components(self, page: LTPage) -> list[LTComponent]:
+        chars = [obj for obj in page if isinstance(obj, LTChar)]
+        others = [obj for obj in page if not isinstance(obj, LTChar)]
+        for obj in others:
+            obj.analyze(self.laparams)
+        if not len(chars):
+            return others
+        lines = self._group_chars(chars)
+        empties = [line for line in lines if line.is_empty()]
+        lines = [line for line in lines if not line.is_empty()]
+        for line in empties:
+            line.analyze(self.laparams)
+        boxes = self._group_lines(page, lines)
+        for box in boxes:
+            box.analyze(self.laparams)
+        if self.laparams.boxes_flow is None:
+            boxes.sort(key=lambda box: (1, -box.y0, box.x0))
+        return boxes + others + empties
+
+    def _group_chars(self, chars: list[LTChar]) -> list[LTTextLineHorizontal]:
+        """Groups consecutive characters into lines, like LTLayoutContainer.group_objects."""
+        bounds = np.array([(char.x0, char.y0, char.x1, char.y1, char.width, char.height)
+                           for char in chars], dtype=np.float64)
+        x0, y0, x1, y1, width, height = bounds.T
+        # Horizontal alignment of every character with the one before it
+        px0, py0, px1, py1, pwidth, pheight = x0[:-1], y0[:-1], x1[:-1], y1[:-1], \
+            width[:-1], height[:-1]
+        nx0, ny0, nx1, ny1, nwidth, nheight = x0[1:], y0[1:], x1[1:], y1[1:], \
+            width[1:], height[1:]
+        voverlap = np.minimum(np.abs(py0 - ny1), np.abs(py1 - ny0))
+        hoverlapping = (nx0 <= px1) & (px0 <= nx1)
+        hdistance = np.where(hoverlapping, 0.0,
+                             np.minimum(np.abs(px0 - nx1), np.abs(px1 - nx0)))
+        halign = (ny0 <= py1) & (py0 <= ny1) \
+            & (np.minimum(pheight, nheight) * self.laparams.line_overlap < voverlap) \
+            & (hdistance < np.maximum(pwidth, nwidth) * self.laparams.char_margin)
+        # A word space precedes a character that is far enough from the one before it
+        word_margin = self.laparams.word_margin
+        spaced = (px1 < nx0 - word_margin * np.maximum(nwidth, nheight)) if word_margin \
+            else np.zeros(len(chars) - 1, dtype=bool)
+
+        starts = np.concatenate(([0], np.flatnonzero(~halign) + 1))
+        ends = np.append(starts[1:], len(chars))
+        line_x0 = np.minimum.reduceat(x0, starts)
+        line_y0 = np.minimum.reduceat(y0, starts)
+        line_x1 = np.maximum.reduceat(x1, starts)
+        line_y1 = np.maximum.reduceat(y1, starts)
+        spaced_indices = set((np.flatnonzero(spaced) + 1).tolist())
+
+        lines: list[LTTextLineHorizontal] = []
+        for start, end, bbox in zip(starts.tolist(), ends.tolist(), zip(
+                line_x0.tolist(), line_y0.tolist(), line_x1.tolist(), line_y1.tolist())):
+            line = LTTextLineHorizontal(word_margin)
+            objs: list[LTChar | LTAnno] = [chars[start]]
+            for i in range(start + 1, end):
+                if i in spaced_indices:
+                    objs.append(LTAnno(" "))
+                objs.append(chars[i])
+            line._objs = objs
+            line._x1 = chars[end - 1].x1
+            line.set_bbox(bbox)
+            lines.append(line)
+        return lines
+
+    def _group_lines(self, page: LTPage, lines: list[LTTextLineHorizontal]) -> \
+            list[LTTextBox]:
+        """Groups lines into text boxes, like LTLayoutContainer.group_textlines."""
+        if not len(lines):
+            return []
+        bounds = np.array([line.bbox for line in lines], dtype=np.float64)
+        x0, y0, x1, y1 = (column[:, None] for column in bounds.T)
+        height = y1 - y0
+        # Neighbours as found by LTTextLineHorizontal.find_neighbors, for each row's line
+        d = self.laparams.line_margin * height
+        neighbors = ~((x1.T <= x0) | (x1 <= x0.T) | (y1.T <= y0 - d) | (y1 + d <= y0.T)) \
+            & (np.abs(height.T - height) <= d) \
+            & ((np.abs(x0.T - x0) <= d) | (np.abs(x1.T - x1) <= d)
+               | (np.abs((x0.T + x1.T) / 2 - (x0 + x1) / 2) <= d))
+        np.fill_diagonal(neighbors, False)
+        if neighbors.any():
+            return list(page.group_textlines(self.laparams, lines))
+        boxes: list[LTTextBox] = []
+        for line in lines:
+            box = LTTextBoxHorizontal()
+            box.add(line)
+            boxes.append(box)
+        return boxes
+
+
+class ParallelBackend(PdfBackend):
+    """Lays out the pages of a document in parallel, with another `backend` in a pool of worker
+    processes. The requested pages are split into contiguous ranges of `pages_per_task` pages
+    (twice as many ranges as `workers` if None, so early ranges are sent back while later ones
+    are laid out), each laid out by a worker on its own, and the layouts are yielded in page
+    order as they complete. Page layouts do not depend on each other, so they
+    are the same as those `backend` produces on its own, except that the image streams of figures
+    are copies that no longer reference the document (see :func:`detach_pdf_object`).
+
+    Documents of fewer than `min_pages` requested pages are laid out in the calling process, as
+    starting workers on them costs more than it saves. Workers read a PDF that was opened from a
+    file from the file, and are sent any other PDF. Resource limits and the stage deadline are
+    checked as pages are yielded; ranges that are no longer needed are cancelled, but ranges a
+    worker already started are finished in the background.
+
+    The process pool is started when first needed, unless an `executor` is given, and shut down
+    by :meth:`close`, or once the backend is garbage collected."""
+    name = "parallel"
+    backend: PdfBackend
+    workers: int
+    pages_per_task: Optional[int]
+    min_pages: int
+
+    def __init__(self, backend: Optional[PdfBackend] = None, workers: Optional[int] = None,
+                 pages_per_task: Optional[int] = None, min_pages: int = 8,
+                 executor: Optional[Executor] = None):
+        self.backend = backend or default_backend()
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self.min_pages = min_pages
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._finalizer: Optional[weakref.finalize] = None
+
+    def iter_page_layouts(self, io: IO[bytes], page_numbers: Optional[set[int]] = None) -> \
+            Iterator[tuple[int, PageLayout]]:
+        # Counting pages only reads the page tree
+        io.seek(0)
+        # noinspection PyTypeChecker
+        page_count = sum(1 for _ in PDFPage.get_pages(io))
+        requested = [page_number for page_number in range(1, page_count + 1)
+                     if page_numbers is None or page_number in page_numbers]
+        io.seek(0)
+        if len(requested) < self.min_pages:
+            yield from self.backend.iter_page_layouts(io, page_numbers)
+            return
+        # Pages beyond max_pages are never laid out
+        max_pages = resource_limits().max_pages
+        allowed = [page_number for page_number in requested
+                   if max_pages is None or page_number <= max_pages]
+        pdf = getattr(io, "path", None) or io.read()
+        pages_per_task = self.pages_per_task or math.ceil(len(allowed) / (2 * self.workers))
+        futures: list[Future] = [
+            self.executor.submit(_layout_pages, self.backend, pdf,
+                                 set(allowed[start:start + pages_per_task]))
+            for start in range(0, len(allowed), pages_per_task)]
+        try:
+            yielded = 0
+            for future in futures:
+                # Always lays out at least one page, like other backends
+                try:
+                    layouts = future.result(None if yielded == 0 else stage_time_remaining())
+                except FutureTimeoutError:
+                    layouts = None
+                for page_number, layout in layouts or ():
+                    if yielded > 0:
+                        check_stage_deadline()
+                    reserve_layout_elements(len(layout.components))
+                    yield page_number, layout
+                    yielded += 1
+                if layouts is None:
+                    check_stage_deadline()
+            if len(allowed) < len(requested):
+                check_page_limit(requested[len(allowed)])
+        finally:
+            for future in futures:
+                future.cancel()
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+            # The pool must not keep the backend alive
+            self._finalizer = weakref.finalize(self, self._executor.shutdown,
+                                               cancel_futures=True)
+        return self._executor
+
+    def close(self) -> None:
+        """Shuts down the process pool, unless it was given."""
+        if self._owns_executor and self._executor is not None:
+            self._finalizer()
+            self._finalizer = None
+            self._executor = None
+
+
+def _layout_pages(backend: PdfBackend, pdf: str | bytes, page_numbers: set[int]) -> \
+        list[tuple[int, PageLayout]]:
+    """Lays out pages of a PDF in a worker of a :class:`ParallelBackend`."""
+    # Forked workers inherit the budget and limits of the parse that started them, but those
+    # are applied by the calling process
+    return contextvars.Context().run(_layout_pages_unbounded, backend, pdf, page_numbers)
+
+
+def _layout_pages_unbounded(backend: PdfBackend, pdf: str | bytes, page_numbers: set[int]) -> \
+        list[tuple[int, PageLayout]]:
+    with PdfSource.open(pdf) as source:
+        layouts = list(backend.iter_page_layouts(source.view(), page_numbers))
+        for _, layout in layouts:
+            for component in layout.components:
+                _detach_images(component)
+    return layouts
+
+
+def _detach_images(component: LTComponent) -> None:
+    """Replaces the streams of the images in a layout component by copies that no longer
+    reference their document, so the component can be pickled."""
+    if isinstance(component, LTImage):
+        component.stream = detach_pdf_object(component.stream)
+        component.colorspace = detach_pdf_object(component.colorspace)
+    elif isinstance(component, LTContainer):
+        for child in component:
+            _detach_images(child)
+
+
+_default_backend: Optional[PdfBackend] = None
+
+
+def default_backend() -> PdfBackend:
+    """Returns the shared :class:`PdfminerBackend` used when no backend is given."""
+    global _default_backend
+    if _default_backend is None:
+        # line_margin=0 separates fields
+        # note that we may need to programmatically join together paragraphs later
+        _default_backend = PdfminerBackend(LAParams(line_margin=0))
+    return _default_backend
+
+
+# Backends by name, for command line options
+BACKENDS: dict[str, type[PdfBackend]] = {
+    PdfminerBackend.name: PdfminerBackend,
+    NumpyLinesBackend.name: NumpyLinesBackend,
+}
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import mmap
+import os
+import weakref
+from pathlib import Path
+from typing import IO, Optional, Union
+
+# Anything a PDF can be parsed from
+PdfInput = Union[str, os.PathLike, bytes, bytearray, memoryview, mmap.mmap, IO[bytes]]
+
+# Files at least this large are memory-mapped rather than read into memory
+MMAP_THRESHOLD = 4 * 1024 * 1024
+
+
+class PdfSource:
+    """A PDF held in a single buffer, which every stage of a parse reads through its own
+    :class:`PdfView`. Views share the buffer without copying it, and each has its own position,
+    so stages neither need to rewind a shared stream nor disturb each other when run
+    concurrently. Closing the source closes its views."""
+    path: Optional[str]  # File the PDF was read from, if any
+
+    def __init__(self, buffer: bytes | bytearray | memoryview | mmap.mmap,
+                 path: Optional[str] = None, owned: Optional[mmap.mmap | memoryview] = None):
+        """Wraps `buffer`, which must not be modified while the source is open. An `owned`
+        memory map or exported buffer is closed or released with the source."""
+        self._buffer = memoryview(buffer).cast("B")
+        self.path = path
+        self._owned = owned
+        self._views: weakref.WeakSet[PdfView] = weakref.WeakSet()
+
+    @classmethod
+    def open(cls, pdf: PdfInput) -> PdfSource:
+        """Returns a source over a PDF given as a path, bytes-like object, memory map or binary
+        stream. Files of at least :data:`MMAP_THRESHOLD` bytes, by path or as a file object, are
+        memory-mapped, smaller ones and other streams are read into memory once. Bytes-like
+        objects, the buffer of a :class:`io.BytesIO` and the buffer of a :class:`PdfView` are
+        used as they are."""
+        if isinstance(pdf, PdfView):
+            pdf._check_open()
+            return cls(pdf._buffer, pdf.path)
+        if isinstance(pdf, (str, os.PathLike)):
+            path = os.fspath(pdf)
+            if os.path.getsize(path) < MMAP_THRESHOLD:
+                return cls(Path(path).read_bytes(), path)
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return cls(mapped, path, owned=mapped)
+        if isinstance(pdf, (bytes, bytearray, memoryview, mmap.mmap)):
+            return cls(pdf)
+        if isinstance(pdf, io.BytesIO):
+            # The stream cannot be resized while its buffer is exported
+            exported = pdf.getbuffer()
+            return cls(exported, owned=exported)
+        try:
+            fileno = pdf.fileno()
+        except (AttributeError, OSError):
+            fileno = None
+        if fileno is not None and os.fstat(fileno).st_size >= MMAP_THRESHOLD:
+            # The map holds its own duplicate of the file descriptor
+            mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+            return cls(mapped, owned=mapped)
+        pdf.seek(0)
+        return cls(pdf.read())
+
+    def digest(self) -> str:
+        """Returns a digest of the whole PDF, which identifies it whatever it was read from."""
+        return hashlib.blake2b(self._buffer, digest_size=16).hexdigest()
+
+    def view(self) -> PdfView:
+        """Returns a new stream over the PDF, positioned at its start."""
+        view = PdfView(self._buffer, self.path)
+        self._views.add(view)
+        return view
+
+    def close(self) -> None:
+        for view in list(self._views):
+            view.close()
+        self._buffer.release()
+        if isinstance(self._owned, memoryview):
+            self._owned.release()
+        elif self._owned is not None:
+            try:
+                self._owned.close()
+            except BufferError:
+                # Still read by a stage that outlived the parse, the map closes once collected
+                pass
+
+    def __len__(self):
+        return self._buffer.nbytes
+
+    def __enter__(self) -> PdfSource:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PdfView(io.BufferedIOBase):
+    """A read-only, seekable binary stream over the buffer of a :class:`PdfSource`."""
+    path: Optional[str]  # File the PDF was read from, if any
+
+    def __init__(self, buffer: memoryview, path: Optional[str] = None):
+        super().__init__()
+        # A view of its own, so closing this stream releases only this stream's view
+        self._buffer = buffer[:]
+        self._position = 0
+        self.path = path
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        self._check_open()
+        start = self._position
+        end = self._buffer.nbytes if size is None or size < 0 else start + size
+        data = self._buffer[start:end].tobytes()
+        self._position += len(data)
+        return data
+
+    read1 = read
+
+    def readinto(self, b) -> int:
+        self._check_open()
+        target = memoryview(b).cast("B")
+        data = self._buffer[self._position:self._position + target.nbytes]
+        target[:data.nbytes] = data
+        self._position += data.nbytes
+        return data.nbytes
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._check_open()
+        match whence:
+            case io.SEEK_SET:
+                position = offset
+            case io.SEEK_CUR:
+                position = self._position + offset
+            case io.SEEK_END:
+                position = self._buffer.nbytes + offset
+            case _:
+                raise ValueError(f"Invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+
+    def tell(self) -> int:
+        self._check_open()
+        return self._position
+
+    def close(self) -> None:
+        if not self.closed:
+            self._buffer.release()
+        super().close()
+
+    def _check_open(self) -> None:
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import logging
+import threading
+from collections.abc import Iterable
+from typing import IO, Callable, Optional
+
+from tungsten.globally_harmonized_system.safety_data_sheet import (
+    GhsSafetyDataSheet
+)
+from tungsten.parsers.field_parse import SdsQueryFieldName
+from tungsten.parsers.pdf_source import PdfInput, PdfSource
+from tungsten.parsers.sds_parser import SdsParser
+from tungsten.parsers.supplier.sigma_aldrich.sds_parser import (
+    SigmaAldrichSdsParser
+)
+from tungsten.parsers.supplier_fingerprint import SupplierFingerprint
+
+
+class UnsupportedSupplierError(Exception):
+    """Raised when no registered parser matches the fingerprint of a PDF."""
+    pass
+
+
+class ParserRegistry:
+    """Parsers of the sheets of each supported supplier. The parser of a PDF is chosen by its
+    :class:`SupplierFingerprint`, through :meth:`SdsParser.matches_fingerprint` of each
+    registered parser class in registration order, which reads far less of the PDF than a parse.
+
+    Each parser class is instantiated once, when it is first chosen, and reused for every later
+    PDF of its supplier, along with its caches. If a `fallback` parser class is given, it is
+    registered and parses PDFs that no parser matches, which otherwise
+    raise :class:`UnsupportedSupplierError`."""
+    fallback: Optional[type[SdsParser]]
+    logger: logging.Logger
+    _factories: dict[type[SdsParser], Callable[[], SdsParser]]
+    _parsers: dict[type[SdsParser], SdsParser]
+
+    def __init__(self, fallback: Optional[type[SdsParser]] = None):
+        self.fallback = fallback
+        self.logger = logging.getLogger(f"tungsten:{self.__class__.__name__}")
+        self._factories = {}
+        self._parsers = {}
+        self._lock = threading.Lock()
+        if fallback is not None:
+            self.register(fallback)
+
+    def register(self, parser_class: type[SdsParser],
+                 factory: Optional[Callable[[], SdsParser]] = None) -> None:
+        """Registers a parser class, instantiated by `factory` (without arguments if None) when
+        it is first needed. Registering a class again replaces its factory and instance."""
+        with self._lock:
+            self._factories[parser_class] = factory or parser_class
+            self._parsers.pop(parser_class, None)
+
+    def detect(self, io: IO[bytes]) -> Optional[type[SdsParser]]:
+        """Returns the first registered parser class that matches the fingerprint of a PDF, or
+        None if none does."""
+        fingerprint = SupplierFingerprint(io)
+        for parser_class in list(self._factories):
+            if parser_class.matches_fingerprint(fingerprint):
+                return parser_class
+        return None
+
+    def parser_for(self, io: IO[bytes]) -> SdsParser:
+        """Returns the parser of a PDF, see :meth:`detect`. Raises
+        :class:`UnsupportedSupplierError` if no parser matches and there is no fallback."""
+        parser_class = self.detect(io)
+        if parser_class is None:
+            if self.fallback is None:
+                raise UnsupportedSupplierError("No registered parser matches the PDF.")
+            self.logger.info(f"No registered parser matches the PDF, parsing it with "
+                             f"{self.fallback.__name__}")
+            parser_class = self.fallback
+        return self.parser(parser_class)
+
+    def parser(self, parser_class: type[SdsParser]) -> SdsParser:
+        """Returns the instance of a registered parser class, creating it if needed."""
+        with self._lock:
+            parser = self._parsers.get(parser_class)
+            if parser is None:
+                parser = self._parsers[parser_class] = self._factories[parser_class]()
+            return parser
+
+    def parsers(self) -> list[SdsParser]:
+        """Returns the instances of every registered parser class, in registration order,
+        creating them if needed."""
+        return [self.parser(parser_class) for parser_class in list(self._factories)]
+
+    def parse_any(self, io: PdfInput, timings: Optional[dict[str, float]] = None,
+                  fields: Optional[Iterable[SdsQueryFieldName]] = None) -> GhsSafetyDataSheet:
+        """Parses a PDF of any registered supplier with :meth:`SdsParser.parse_to_ghs_sds`,
+        choosing the parser by :meth:`parser_for`. The PDF is read into memory or mapped once,
+        for both the fingerprint and the parse."""
+        with PdfSource.open(io) as source:
+            parser = self.parser_for(source.view())
+            return parser.parse_to_ghs_sds(source.view(), timings, fields)
+
+    def close(self) -> None:
+        """Closes the parsers created so far, see :meth:`SdsParser.close`."""
+        with self._lock:
+            parsers = list(self._parsers.values())
+        for parser in parsers:
+            parser.close()
+
+    def __contains__(self, parser_class: type[SdsParser]):
+        return parser_class in self._factories
+
+    def __len__(self):
+        return len(self._factories)
+
+
+_default_registry: Optional[ParserRegistry] = None
+
+
+def default_registry() -> ParserRegistry:
+    """Returns the registry of the parsers of every supplier Tungsten supports, used
+    by :func:`parse_any`."""
+    global _default_registry
+    if _default_registry is None:
+        registry = ParserRegistry()
+        registry.register(SigmaAldrichSdsParser)
+        _default_registry = registry
+    return _default_registry
+
+
+def parse_any(io: PdfInput, timings: Optional[dict[str, float]] = None,
+              fields: Optional[Iterable[SdsQueryFieldName]] = None) -> GhsSafetyDataSheet:
+    """Parses a PDF from any supported supplier, see :meth:`ParserRegistry.parse_any`. Raises
+    :class:`UnsupportedSupplierError` if its supplier is not supported."""
+    return default_registry().parse_any(io, timings, fields)
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import abc
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+"""
+
+
+class CacheTier(metaclass=abc.ABCMeta):
+    """A bounded store of results keyed by strings, such as content hashes. Tiers are safe to
+    use from multiple threads."""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the value stored under `key`, or None if there is none."""
+        pass
+
+    @abc.abstractmethod
+    def put(self, key: str, value: Any) -> None:
+        """Stores `value` under `key`, evicting other entries if the tier is full."""
+        pass
+
+    @abc.abstractmethod
+    def keys(self) -> list[str]:
+        """Returns the keys of every stored value."""
+        pass
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        pass
+
+
+class MemoryTier(CacheTier):
+    """Least-recently-used tier holding up to `max_entries` values in memory. If `max_bytes` is
+    given, the values are also bounded by their total size as estimated by `sizeof`, and a value
+    larger than `max_bytes` on its own is not kept. Values are returned as they were stored, not
+    copied."""
+    max_entries: int
+    max_bytes: Optional[int]
+    _entries: OrderedDict[str, Any]
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None):
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("max_bytes requires a sizeof function")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            self._bytes += size - self._sizes.get(key, 0)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries \
+                    or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                evicted, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(evicted)
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    @property
+    def size(self) -> int:
+        """Total estimated size of the values, 0 if `max_bytes` is None."""
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteTier(CacheTier):
+    """Tier persisting up to `max_entries` values in a SQLite database, evicting the least
+    recently used ones. The database outlives the process and can be shared between processes.
+    Values are pickled, so only databases written by trusted processes should be used."""
+    path: str
+    max_entries: int
+
+    def __init__(self, path: str | os.PathLike, max_entries: int = 65536):
+        self.path = os.fspath(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT value FROM entries WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE entries SET used = ? WHERE key = ?", (time.time(), key))
+        return pickle.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, used) VALUES (?, ?, ?)",
+                (key, data, time.time()))
+            connection.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY used DESC "
+                "LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return [row[0] for row in self._connect().execute("SELECT key FROM entries")]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM entries")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not be used across fork(), so a forked process opens its own
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, isolation_level=None, timeout=30,
+                                               check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+            self._connection.executescript(_SCHEMA)
+            self._connection_pid = os.getpid()
+        return self._connection
+
+
+class TieredCache:
+    """A cache made of tiers, fastest first. Lookups go through the tiers in order, and a value
+    found in a slower tier is copied into the faster ones. Values are stored in every tier."""
+    tiers: list[CacheTier]
+
+    def __init__(self, *tiers: CacheTier):
+        self.tiers = list(tiers)
+
+    def get(self, key: str) -> Optional[Any]:
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster_tier in self.tiers[:i]:
+                    faster_tier.put(key, value)
+                return value
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        for tier in self.tiers:
+            tier.put(key, value)
+
+    def clear(self) -> None:
+        """Removes every value, including persisted ones."""
+        for tier in self.tiers:
+            tier.clear()
@@ -1,63 +1,385 @@
 from __future__ import annotations
 
 import abc
+import asyncio
+import contextvars
 import enum
 import logging
+import threading
+import time
 import typing
-from dataclasses import dataclass
+from collections.abc import Awaitable, Iterable, Iterator
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import IO, Optional
+from functools import partial
+from itertools import count
+from typing import IO, Any, Callable, ClassVar, Optional
+
+import numpy as np
 
 from tungsten.globally_harmonized_system.safety_data_sheet import (
     GhsSafetyDataSheet
 )
-from tungsten.parsers.parsing_hierarchy import HierarchyElement, HierarchyNode
+from tungsten.parsers.field_parse import (
+    FieldMapper,
+    ParsePlan,
+    SdsQueryFieldName
+)
+from tungsten.parsers.hierarchy_cache import (
+    HierarchyCache,
+    HierarchyCheckpoint
+)
+from tungsten.parsers.page_cache import PageCache, hash_pdf_pages
+from tungsten.parsers.parsing_hierarchy import (
+    HierarchyElement,
+    HierarchyTree,
+    HierarchyTreeNode
+)
+from tungsten.parsers.pdf_source import PdfInput, PdfSource
+from tungsten.parsers.supplier_fingerprint import SupplierFingerprint
 
 
 class SdsParser(metaclass=abc.ABCMeta):
-    injectors: list[SdsParserInjector] = []
+    injectors: list[SdsParserInjector]
     logger: logging.Logger
+    page_cache: Optional[PageCache]
+    hierarchy_cache: Optional[HierarchyCache]
+    field_mapper: Optional[FieldMapper]  # Mapper whose fields can be requested from a parse
+    profile: ParseProfile
+    limits: ResourceLimits
 
-    def __init__(self):
+    def __init__(self, page_cache: Optional[PageCache] = None,
+                 profile: Optional[ParseProfile] = None, limits: Optional[ResourceLimits] = None,
+                 hierarchy_cache: Optional[HierarchyCache] = None):
+        """If a `page_cache` is given, the parser runs in incremental mode: pages whose content
+        is unchanged since an earlier parse reuse that parse's per-page results. The `profile`
+        sets the time budgets of the stages, without limits (:attr:`ParseProfile.FULL`) by
+        default. `limits` bounds the resources a parse may use, the defaults of
+        :class:`ResourceLimits` if None. If a `hierarchy_cache` is given, PDFs parsed before
+        are only replayed from their checkpoint (see :meth:`replay_checkpoint`)."""
         self.logger = logging.getLogger(f"tungsten:{self.__class__.__name__}")
+        self.injectors = []
+        self.page_cache = page_cache
+        self.hierarchy_cache = hierarchy_cache
+        self.field_mapper = None
+        self.profile = profile or ParseProfile.FULL
+        self.limits = limits or ResourceLimits()
 
-    def parse_to_ghs_sds(self, io: IO[bytes]) -> GhsSafetyDataSheet:
-        """Parses a PDF into a :class:`GhsSafetyDataSheet`."""
-        # Generate text hierarchy
-        hierarchy = self._parse_to_hierarchy(io)
-        # Call injectors and collect injections
-        injections: list[Injection] = []
-        for injector in self.injectors:
-            injections += injector.generate_injections(io)
+    @classmethod
+    def matches_fingerprint(cls, fingerprint: SupplierFingerprint) -> bool:
+        """Returns whether a PDF with the fingerprint is a sheet this parser parses, so it can be
+        chosen for the PDF by a :class:`ParserRegistry`. Parsers should check the cheap features
+        of the fingerprint, the metadata and fonts, before its text."""
+        return False
+
+    def parse_to_ghs_sds(self, io: PdfInput, timings: Optional[dict[str, float]] = None,
+                         fields: Optional[Iterable[SdsQueryFieldName]] = None) -> \
+            GhsSafetyDataSheet:
+        """Parses a PDF into a :class:`GhsSafetyDataSheet`. The PDF may be given as a path,
+        bytes-like object, memory map or binary stream (see :meth:`PdfSource.open`); every stage
+        reads it through its own view of the same buffer. If a `timings` dict is given, the
+        seconds spent in each stage are added to it, keyed by stage name ("layout", the name of
+        each injector and "assemble", plus "hash" in incremental mode).
+
+        If `fields` is given, only the parts of the sheet those fields are read from by
+        :attr:`field_mapper` are parsed: layout analysis stops after the last needed section,
+        injectors that contribute nothing to them are skipped, and other sections are left out
+        of the sheet. Querying any other field of the sheet gives undefined results.
+
+        With a :attr:`hierarchy_cache`, a PDF with a checkpoint is replayed from it, timed as
+        "assemble", and every complete parse that is not degraded stores its checkpoint.
+
+        Stages are limited by the time budgets of :attr:`profile` and the resource limits of
+        :attr:`limits`. An injector that runs out of time contributes no injections, and layout
+        analysis that runs out of time keeps the pages laid out so far. Stages that reach a
+        resource limit leave out the work beyond it. Such stages are recorded in the "degraded"
+        entry of the sheet meta."""
+        degraded: dict[str, str] = {}
+        with PdfSource.open(io) as source, _governed(self.limits, degraded):
+            return self._parse_source(source, timings, fields, degraded)
+
+    def _parse_source(self, source: PdfSource, timings: Optional[dict[str, float]],
+                      fields: Optional[Iterable[SdsQueryFieldName]],
+                      degraded: dict[str, str]) -> GhsSafetyDataSheet:
+        plan = self.parse_plan(fields)
+        checkpoint_key, checkpoint = self._checkpoint(source)
+        if checkpoint is not None:
+            with _timed(timings, "assemble"):
+                return self._sheet_from_hierarchy(checkpoint.root, checkpoint.meta, plan)
+        page_hashes = self._hash_pages(source, timings)
+        hierarchy = self._layout_stage(source, plan, page_hashes, timings, degraded)
+        injections: list[Injection | dict] = []
+        for injector in self._planned_injectors(plan):
+            injections += self._injector_stage(injector, source, page_hashes, timings, degraded)
+        with _timed(timings, "assemble"):
+            return self._assemble_ghs_sds(hierarchy, injections, plan, degraded,
+                                          checkpoint_key if plan is None else None)
+
+    def _checkpoint(self, source: PdfSource) -> \
+            tuple[Optional[str], Optional[HierarchyCheckpoint]]:
+        """Returns the key of a PDF in the :attr:`hierarchy_cache` and its checkpoint, None for
+        either if there is no cache or no checkpoint."""
+        if self.hierarchy_cache is None:
+            return None, None
+        key = f"{self.__class__.__name__}:{source.digest()}"
+        return key, self.hierarchy_cache.get(key)
+
+    def _hash_pages(self, source: PdfSource,
+                    timings: Optional[dict[str, float]]) -> Optional[list[str]]:
+        """Returns the hashes of the pages of a PDF in incremental mode, None otherwise."""
+        if self.page_cache is None:
+            return None
+        with _timed(timings, "hash"):
+            return hash_pdf_pages(source.view())
+
+    def _layout_stage(self, source: PdfSource, plan: Optional[ParsePlan],
+                      page_hashes: Optional[list[str]], timings: Optional[dict[str, float]],
+                      degraded: dict[str, str]) -> HierarchyTreeNode:
+        with _timed(timings, "layout"):
+            if page_hashes is None:
+                # Generate text hierarchy
+                return self._layout_within_budget(
+                    lambda: self._parse_to_hierarchy(source.view(), plan), degraded)
+            # Generate text hierarchy, only laying out pages that changed. Every page is laid out
+            # regardless of the plan, so cached layouts stay usable by any later parse
+            return self._layout_within_budget(
+                lambda: self._leading_pages_to_hierarchy(self._cached_page_results(
+                    "layout", page_hashes,
+                    lambda page_numbers: self._parse_pages(source.view(), page_numbers))),
+                degraded)
+
+    def _leading_pages_to_hierarchy(self, results: dict[int, Any]) -> HierarchyTreeNode:
+        """Assembles the hierarchy of the pages before the first page without a layout, see
+        :func:`_leading_pages`, which is empty if the first page has none."""
+        pages = _leading_pages(results)
+        return self._pages_to_hierarchy(pages) if len(pages) else HierarchyTree().root
+
+    def _injector_stage(self, injector: SdsParserInjector, source: PdfSource,
+                        page_hashes: Optional[list[str]], timings: Optional[dict[str, float]],
+                        degraded: dict[str, str]) -> list[Injection | dict]:
+        with _timed(timings, injector.name):
+            if page_hashes is not None and isinstance(injector, PagedSdsParserInjector):
+                # Only generate the results of pages that changed
+                return self._injections_within_budget(
+                    injector, lambda: injector.injections_from_page_results(
+                        self._cached_page_results(
+                            injector.name, page_hashes,
+                            lambda page_numbers: injector.generate_page_results(
+                                source.view(), page_numbers))),
+                    degraded)
+            return self._injections_within_budget(
+                injector, lambda: injector.generate_injections(source.view()), degraded)
+
+    async def parse_to_ghs_sds_async(
+            self, io: PdfInput, executor: Optional[Executor] = None,
+            fields: Optional[Iterable[SdsQueryFieldName]] = None) -> GhsSafetyDataSheet:
+        """Parses a PDF into a :class:`GhsSafetyDataSheet` without blocking the event loop.
+        CPU-bound stages run on `executor` (the loop's default executor if None), and the
+        hierarchy and injectors run concurrently, each on its own view of the PDF, which may be
+        given as anything :meth:`parse_to_ghs_sds` accepts. Injectors may
+        override :meth:`SdsParserInjector.generate_injections_async`, e.g. to drive subprocesses
+        from the event loop. If cancelled, pending stages are cancelled; stages already running
+        on the executor finish in the background. `fields` and :attr:`profile` limit the parse
+        and :attr:`limits` limit the parse like they do for :meth:`parse_to_ghs_sds`."""
+        loop = asyncio.get_running_loop()
+        if self.page_cache is not None or self.hierarchy_cache is not None:
+            # Incremental mode shares the page cache between stages, and a checkpoint replaces
+            # every stage, so such parses run as a whole
+            return await loop.run_in_executor(
+                executor, lambda: self.parse_to_ghs_sds(io, fields=fields))
+        plan = self.parse_plan(fields)
+        degraded: dict[str, str] = {}
+        source = await loop.run_in_executor(executor, PdfSource.open, io)
+
+        async def generate_injections(injector: SdsParserInjector) -> list[Injection | dict]:
+            # Tasks run in a copy of the current context, so the budget only applies to this one
+            with _budget(self.profile, injector.name):
+                try:
+                    return await injector.generate_injections_async(source.view(), executor)
+                except (StageTimeoutError, ResourceLimitError) as e:
+                    return self._skip_injector(injector, degraded, e)
+
+        try:
+            with _governed(self.limits, degraded):
+                hierarchy, *injector_results = await _gather_or_cancel(
+                    loop.run_in_executor(executor, contextvars.copy_context().run,
+                                         self._layout_within_budget,
+                                         partial(self._parse_to_hierarchy, source.view(), plan),
+                                         degraded),
+                    *(generate_injections(injector)
+                      for injector in self._planned_injectors(plan)))
+        finally:
+            # Stages still running on the executor after a cancellation fail on the closed view
+            source.close()
+        injections: list[Injection | dict] = []
+        for injector_injections in injector_results:
+            injections += injector_injections
+        return await loop.run_in_executor(
+            executor, self._assemble_ghs_sds, hierarchy, injections, plan, degraded)
+
+    async def parse_many_async(self, ios: Iterable[PdfInput], max_concurrency: int = 8,
+                               executor: Optional[Executor] = None,
+                               fields: Optional[Iterable[SdsQueryFieldName]] = None) -> \
+            list[GhsSafetyDataSheet]:
+        """Parses many PDFs with :meth:`parse_to_ghs_sds_async`, with at most
+        `max_concurrency` documents in flight at once. Results are in input order."""
+        semaphore = asyncio.Semaphore(max_concurrency)
+        fields = None if fields is None else tuple(fields)
+
+        async def parse(io: PdfInput) -> GhsSafetyDataSheet:
+            async with semaphore:
+                return await self.parse_to_ghs_sds_async(io, executor, fields)
+
+        return await _gather_or_cancel(*(parse(io) for io in ios))
+
+    def parse_plan(self, fields: Optional[Iterable[SdsQueryFieldName]]) -> Optional[ParsePlan]:
+        """Returns the plan of a parse for `fields`, or None if everything must be parsed."""
+        if fields is None or self.field_mapper is None:
+            return None
+        return self.field_mapper.parse_plan(fields)
+
+    def _layout_within_budget(self, parse: Callable[[], HierarchyTreeNode],
+                              degraded: dict[str, str]) -> HierarchyTreeNode:
+        """Runs layout analysis within its budget, falling back to the partial hierarchy of a
+        layout that ran out of time or reached a resource limit, or to an empty hierarchy if not
+        even the first page was laid out."""
+        with _budget(self.profile, "layout"):
+            try:
+                return parse()
+            except (StageTimeoutError, ResourceLimitError) as e:
+                self.logger.warning(f"{e}, keeping the pages laid out so far")
+                degraded["layout"] = "truncated"
+                return e.partial if e.partial is not None else HierarchyTree().root
+
+    def _injections_within_budget(self, injector: SdsParserInjector,
+                                  generate: Callable[[], list[Injection | dict]],
+                                  degraded: dict[str, str]) -> list[Injection | dict]:
+        with _budget(self.profile, injector.name):
+            try:
+                return generate()
+            except (StageTimeoutError, ResourceLimitError) as e:
+                return self._skip_injector(injector, degraded, e)
+
+    def _skip_injector(self, injector: SdsParserInjector, degraded: dict[str, str],
+                       error: Exception) -> list[Injection | dict]:
+        self.logger.warning(f"{error}, skipping the injections of stage {injector.name}")
+        degraded[injector.name] = "skipped"
+        return []
+
+    def _planned_injectors(self, plan: Optional[ParsePlan]) -> list[SdsParserInjector]:
+        if plan is None:
+            return self.injectors
+        return [injector for injector in self.injectors if injector.is_needed(plan)]
+
+    def _assemble_ghs_sds(self, hierarchy: HierarchyTreeNode,
+                          injections: list[Injection | dict],
+                          plan: Optional[ParsePlan] = None,
+                          degraded: Optional[dict[str, str]] = None,
+                          checkpoint_key: Optional[str] = None) -> GhsSafetyDataSheet:
+        """Applies the collected injections to the hierarchy and creates the sheet. If a
+        `checkpoint_key` is given and no stage was degraded, the checkpoint of the parse is
+        stored in the :attr:`hierarchy_cache` under it."""
         # Inject collected injections into the text hierarchy
         self._process_injections(
             list(filter(lambda x: isinstance(x, Injection), injections)), hierarchy)
+        metas = [typing.cast(dict, meta) for meta in injections if isinstance(meta, dict)]
+        if checkpoint_key is not None and not degraded:
+            self.hierarchy_cache.put(checkpoint_key, HierarchyCheckpoint(hierarchy, metas))
+        return self._sheet_from_hierarchy(hierarchy, metas, plan, degraded)
+
+    def replay_checkpoint(self, checkpoint: HierarchyCheckpoint,
+                          fields: Optional[Iterable[SdsQueryFieldName]] = None) -> \
+            GhsSafetyDataSheet:
+        """Creates the sheet of a parse from its checkpoint, with the current rules of the
+        parser, without reading the PDF. `fields` limits the sections of the sheet like it
+        does for :meth:`parse_to_ghs_sds`."""
+        return self._sheet_from_hierarchy(checkpoint.root, checkpoint.meta,
+                                          self.parse_plan(fields))
+
+    def _sheet_from_hierarchy(self, hierarchy: HierarchyTreeNode, metas: list[dict],
+                              plan: Optional[ParsePlan] = None,
+                              degraded: Optional[dict[str, str]] = None) -> GhsSafetyDataSheet:
         # Create GHS SDS document from result
         ghs_sds = self._hierarchy_to_ghs_sds(hierarchy)
         # Modify GHS with meta injections
-        for meta in filter(lambda x: isinstance(x, dict), injections):
-            ghs_sds.meta.update(typing.cast(dict, meta))
+        for meta in metas:
+            ghs_sds.meta.update(meta)
+        if plan is not None:
+            ghs_sds.sections = [section for section in ghs_sds.sections
+                                if section.title in plan.sections]
+        if degraded:
+            # Stage names mapped to "skipped", "truncated" or "partial"
+            ghs_sds.meta["degraded"] = dict(degraded)
 
         return ghs_sds
 
     @abc.abstractmethod
-    def _parse_to_hierarchy(self, io: IO[bytes]) -> HierarchyNode:
-        """Parses a PDF into an internal hierarchy. Used for subsequent steps."""
+    def _parse_to_hierarchy(self, io: IO[bytes], plan: Optional[ParsePlan] = None) -> \
+            HierarchyTreeNode:
+        """Parses a PDF into an internal hierarchy, returning the root of a
+        :class:`HierarchyTree`. Used for subsequent steps. If a `plan` is given, only its
+        sections need to be in the hierarchy."""
         pass
 
     @abc.abstractmethod
-    def _hierarchy_to_ghs_sds(self, root: HierarchyNode) -> GhsSafetyDataSheet:
+    def _hierarchy_to_ghs_sds(self, root: HierarchyTreeNode) -> GhsSafetyDataSheet:
         pass
 
+    def _parse_pages(self, io: IO[bytes], page_numbers: Optional[set[int]] = None) -> \
+            dict[int, Any]:
+        """Parses the layout of the given pages (1-indexed, all pages if None) of a PDF
+        independently of each other. Required for incremental mode."""
+        raise NotImplementedError(f"{self.__class__.__name__} does not support incremental mode.")
+
+    def _pages_to_hierarchy(self, pages: list[Any]) -> HierarchyTreeNode:
+        """Assembles the results of :meth:`_parse_pages` for every page of a PDF, in page order,
+        into an internal hierarchy. Required for incremental mode."""
+        raise NotImplementedError(f"{self.__class__.__name__} does not support incremental mode.")
+
+    def _cached_page_results(self, stage: str, page_hashes: list[str],
+                             generate: Callable[[set[int]], dict[int, Any]]) -> dict[int, Any]:
+        """Returns per-page results of a stage for every page, in page order. Results are taken
+        from the page cache where possible, `generate` is only called for the remaining pages."""
+        results: dict[int, Any] = {}
+        missing: set[int] = set()
+        for page_number, page_hash in enumerate(page_hashes, start=1):
+            cached = self.page_cache.get(stage, page_hash)
+            if cached is None:
+                missing.add(page_number)
+            else:
+                results[page_number] = cached
+        if len(missing):
+            for page_number, result in generate(missing).items():
+                self.page_cache.put(stage, page_hashes[page_number - 1], result)
+                results[page_number] = result
+        self.logger.info(f"Stage {stage}: reused {len(page_hashes) - len(missing)} of "
+                         f"{len(page_hashes)} pages")
+        return dict(sorted(results.items()))
+
     def register_injector(self, injector: SdsParserInjector) -> None:
         """Registers an injector class for use in the parsing pipeline."""
         self.injectors.append(injector)
 
-    def _process_injections(self, injections: list[Injection | dict], root: HierarchyNode) -> None:
+    def close(self) -> None:
+        """Releases the resources the injectors hold between parses. The parser can still be
+        used afterwards, starting them again."""
+        for injector in self.injectors:
+            injector.close()
+
+    def __enter__(self) -> SdsParser:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _process_injections(self, injections: list[Injection | dict],
+                            root: HierarchyTreeNode) -> None:
         """Operates on a hierarchy with gathered injections."""
+        tree = root.tree
         # First step is to delete original text elements to match the specific overwrite condition
-        # This feels like a LeetCode problem, I wonder if there's a better way to do this?
-        # Currently runs O(N*M), N = # of HierarchyNode objects, M = # of InjectionBox objects
         bounds: list[tuple[InjectionBox, InjectionOverwriteBoundaryMode, HierarchyElement]] = []
 
         for injection in injections:
@@ -71,76 +393,408 @@ class SdsParser(metaclass=abc.ABCMeta):
         # +--------------+
         # x1 > x0, y1 > y0, as page coordinates start from the bottom left (see PDF User Space)
 
-        # Mark all children that should be deleted
-        stack: list[HierarchyNode] = [root]  # Stack used for tree traversal
-        while len(stack) != 0:
-            hand = stack.pop()
-
-            for (box, mode, payload) in bounds:
-                box: InjectionBox
-                if box.type == CoordinateType.DOCUMENT:
+        # Mark all children that should be deleted, testing each box against every node at once
+        nodes = tree.preorder(root.index)[1:]
+        page_num = tree.column("page_num")[nodes]
+        page_x0 = tree.column("page_x0")[nodes]
+        page_y0 = tree.column("page_y0")[nodes]
+        page_x1 = tree.column("page_x1")[nodes]
+        page_y1 = tree.column("page_y1")[nodes]
+        to_delete = np.zeros(len(nodes), dtype=bool)
+        for (box, mode, payload) in bounds:
+            box: InjectionBox
+            if box.type == CoordinateType.DOCUMENT:
+                raise NotImplementedError
+            match mode:
+                case InjectionOverwriteBoundaryMode.NO_ACTION:
+                    pass
+                case InjectionOverwriteBoundaryMode.INTERSECTS:
+                    rightest_left = np.maximum(page_x0, box.x0)
+                    leftest_right = np.minimum(page_x1, box.x1)
+                    topest_bottom = np.maximum(page_y0, box.y0)
+                    bottomest_top = np.minimum(page_y1, box.y1)
+                    to_delete |= (leftest_right >= rightest_left) \
+                        & (bottomest_top >= topest_bottom) & (page_num == box.page_num)
+                case InjectionOverwriteBoundaryMode.CONTAINS:
                     raise NotImplementedError
-                if hand.data is None:
-                    break
-                rightest_left = max(hand.data.page_x0, box.x0)
-                leftest_right = min(hand.data.page_x1, box.x1)
-                topest_bottom = max(hand.data.page_y0, box.y0)
-                bottomest_top = min(hand.data.page_y1, box.y1)
-                match mode:
-                    case InjectionOverwriteBoundaryMode.NO_ACTION:
-                        pass
-                    case InjectionOverwriteBoundaryMode.INTERSECTS:
-                        if leftest_right >= rightest_left and bottomest_top >= topest_bottom and \
-                                hand.data.page_num == box.page_num:
-                            hand.data.set_delete()
-                    case InjectionOverwriteBoundaryMode.CONTAINS:
-                        raise NotImplementedError
-
-            for child in hand.children:
-                stack.append(child)
 
         # Remove tagged children
-        stack.append(root)
-        while len(stack) != 0:
-            hand = stack.pop()
-            i: int = 0
-            while i < len(hand.children):
-                if hand.children[i].data.to_delete:
-                    hand.children.pop(i)
-                else:
-                    stack.append(hand.children[i])
-                    i += 1
+        tree.delete(nodes[to_delete].tolist())
 
         # Second step is to place the injected element into an appropriate location
         for injection in injections:
             # take first box TODO check if highest box
             box = injection.boxes[0]
-            exit_flag = False
+            page_num = tree.column("page_num")
+            page_y0 = tree.column("page_y0")
             # Iterate backwards through each section
-            for i in range(len(root.children) - 1, 0, -1):
-                if exit_flag:
+            for section in reversed(tree.children(root.index)[1:]):
+                nodes = tree.preorder(section)
+                above = nodes[(box.y1 <= page_y0[nodes]) & (page_num[nodes] == box.page_num)]
+                if len(above):
+                    # The last element above the box, in preorder
+                    tree.add_node(int(above[-1]), injection.payload)
                     break
-                stack = [root.children[i]]
-                order = []
-                while len(stack) != 0:
-                    hand = stack.pop()
-                    order.append(hand)
-                    for child in reversed(hand.children):
-                        stack.append(child)
-                order.reverse()
-                for element in order:
-                    if box.y1 <= element.data.page_y0 \
-                            and box.page_num == element.data.page_num:
-                        element.add_child(HierarchyNode(injection.payload))
-                        exit_flag = True
-                        break
+
+
+class StagedParse:
+    """A parse of a single PDF by :meth:`SdsParser.parse_to_ghs_sds`, split into its stages so
+    they can be run one at a time by different threads, such as the stages of a batch pipeline.
+    :meth:`layout` and :meth:`inject` may run in any order, but not concurrently;
+    :meth:`assemble` runs the injectors that did not run and creates the sheet.
+
+    Every stage runs in the context of the parse, so the budgets of :attr:`SdsParser.profile`
+    and the limits of :attr:`SdsParser.limits` apply as they do to a whole parse. The PDF is
+    read into memory or mapped when the parse is created, and released when it is closed. If
+    the parser's :attr:`SdsParser.hierarchy_cache` has a checkpoint of the PDF, no injector is
+    pending, :meth:`layout` does nothing and :meth:`assemble` replays the checkpoint."""
+    parser: SdsParser
+    plan: Optional[ParsePlan]
+    degraded: dict[str, str]
+    timings: Optional[dict[str, float]]
+    hierarchy: Optional[HierarchyTreeNode]
+    injections: list[Injection | dict]
+    _pending: list[SdsParserInjector]
+
+    def __init__(self, parser: SdsParser, io: PdfInput,
+                 fields: Optional[Iterable[SdsQueryFieldName]] = None,
+                 timings: Optional[dict[str, float]] = None):
+        """See :meth:`SdsParser.parse_to_ghs_sds` for `io`, `fields` and `timings`."""
+        self.parser = parser
+        self.plan = parser.parse_plan(fields)
+        self.degraded = {}
+        self.timings = timings
+        self.hierarchy = None
+        self.injections = []
+        self._pending = list(parser._planned_injectors(self.plan))
+        self._context = contextvars.copy_context()
+        self._context.run(_resource_usage.set, _ResourceUsage(parser.limits, self.degraded))
+        self._source = PdfSource.open(io)
+        self._checkpoint_key, self._checkpoint = parser._checkpoint(self._source)
+        if self._checkpoint is not None:
+            self.hierarchy = self._checkpoint.root
+            self._pending = []
+            self._page_hashes = None
+        else:
+            self._page_hashes = self._context.run(parser._hash_pages, self._source, timings)
+
+    @property
+    def pending_injectors(self) -> list[SdsParserInjector]:
+        """The planned injectors that have not run yet, in registration order."""
+        return list(self._pending)
+
+    def layout(self) -> None:
+        """Lays out the PDF into :attr:`hierarchy`."""
+        if self._checkpoint is not None:
+            return
+        self.hierarchy = self._context.run(self.parser._layout_stage, self._source, self.plan,
+                                           self._page_hashes, self.timings, self.degraded)
+
+    def inject(self, injector: SdsParserInjector) -> None:
+        """Runs one of the :attr:`pending_injectors`, adding its results to :attr:`injections`."""
+        self._pending.remove(injector)
+        self.injections += self._context.run(self.parser._injector_stage, injector,
+                                             self._source, self._page_hashes, self.timings,
+                                             self.degraded)
+
+    def assemble(self) -> GhsSafetyDataSheet:
+        """Runs the stages that did not run and returns the parsed sheet."""
+        if self._checkpoint is not None:
+            with _timed(self.timings, "assemble"):
+                return self.parser._sheet_from_hierarchy(self._checkpoint.root,
+                                                         self._checkpoint.meta, self.plan)
+        if self.hierarchy is None:
+            self.layout()
+        for injector in self.pending_injectors:
+            self.inject(injector)
+        with _timed(self.timings, "assemble"):
+            return self._context.run(self.parser._assemble_ghs_sds, self.hierarchy,
+                                     self.injections, self.plan, self.degraded,
+                                     self._checkpoint_key if self.plan is None else None)
+
+    def close(self) -> None:
+        self._source.close()
+
+    def __enter__(self) -> StagedParse:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 
 class SdsParserInjector(metaclass=abc.ABCMeta):
+    @property
+    def name(self) -> str:
+        """Name of the stage, used in stage timings."""
+        return self.__class__.__name__
+
+    def is_needed(self, plan: ParsePlan) -> bool:
+        """Returns whether the injections may affect the parts of a sheet in `plan`. Injectors
+        that are not needed are skipped."""
+        return True
+
     @abc.abstractmethod
     def generate_injections(self, io: IO[bytes]) -> list[Injection | dict]:
         pass
 
+    def close(self) -> None:
+        """Releases the resources the injector holds between parses, such as worker threads."""
+
+    async def generate_injections_async(self, io: IO[bytes],
+                                        executor: Optional[Executor] = None) -> \
+            list[Injection | dict]:
+        """Asynchronous counterpart of :meth:`generate_injections`, which by default runs it on
+        `executor`."""
+        # Executors do not carry over context variables, which hold the stage time budget
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, contextvars.copy_context().run, self.generate_injections, io)
+
+
+class PagedSdsParserInjector(SdsParserInjector, metaclass=abc.ABCMeta):
+    """An injector whose work can be split into independent per-page results, which lets
+    incremental mode reuse the results of unchanged pages."""
+    name: str  # Name of the stage, also used as part of page cache keys
+
+    def generate_injections(self, io: IO[bytes]) -> list[Injection | dict]:
+        return self.injections_from_page_results(self.generate_page_results(io))
+
+    @abc.abstractmethod
+    def generate_page_results(self, io: IO[bytes], page_numbers: Optional[set[int]] = None) -> \
+            dict[int, Any]:
+        """Returns intermediate results for the given pages (1-indexed, all pages if None),
+        keyed by page number. Results must not depend on the other pages of the PDF."""
+        pass
+
+    @abc.abstractmethod
+    def injections_from_page_results(self, page_results: dict[int, Any]) -> \
+            list[Injection | dict]:
+        """Combines the results of :meth:`generate_page_results` for every page, in page
+        order, into injections."""
+        pass
+
+
+@dataclass(frozen=True)
+class ParseProfile:
+    """Time budgets, in seconds, of the stages of a parse, keyed by stage name ("layout" or the
+    name of an injector). Stages without a budget are not limited.
+
+    Budgets are cooperative: long-running stages call :func:`check_stage_deadline` at points
+    where they can stop, and bound their subprocesses by :func:`stage_time_remaining`. A stage
+    may therefore overrun its budget by the time between two such points."""
+    name: str
+    budgets: dict[str, float] = field(default_factory=dict)
+
+    FAST: ClassVar[ParseProfile]
+    BALANCED: ClassVar[ParseProfile]
+    FULL: ClassVar[ParseProfile]
+
+
+ParseProfile.FAST = ParseProfile("fast", {"layout": 10.0, "tables": 5.0, "pictograms": 2.0})
+ParseProfile.BALANCED = ParseProfile(
+    "balanced", {"layout": 30.0, "tables": 20.0, "pictograms": 10.0})
+ParseProfile.FULL = ParseProfile("full")
+
+
+class StageTimeoutError(Exception):
+    """Raised when a stage exceeds its time budget. A stage that can still produce a useful
+    result, such as a layout of the first pages, attaches it as `partial`."""
+    stage: str
+    partial: Any
+
+    def __init__(self, stage: str, partial: Any = None):
+        super().__init__(f"Stage {stage} exceeded its time budget")
+        self.stage = stage
+        self.partial = partial
+
+
+# Name and monotonic deadline of the budget of the stage that is running
+_stage_budget: ContextVar[Optional[tuple[str, float]]] = ContextVar(
+    "tungsten_stage_budget", default=None)
+
+
+def _leading_pages(results: dict[int, Any]) -> list[Any]:
+    """Returns the results of the pages before the first page without one, in page order.
+    Pages are assembled by their position, so the pages after a gap, such as the cached pages
+    after a layout that stopped early, are left out."""
+    pages = []
+    for page_number in count(1):
+        if page_number not in results:
+            return pages
+        pages.append(results[page_number])
+
+
+def check_stage_deadline() -> None:
+    """Raises :class:`StageTimeoutError` if the running stage has exceeded its time budget."""
+    budget = _stage_budget.get()
+    if budget is not None and time.monotonic() > budget[1]:
+        raise StageTimeoutError(budget[0])
+
+
+def stage_time_remaining() -> Optional[float]:
+    """Returns the seconds left in the time budget of the running stage, or None if it has no
+    budget. Never negative."""
+    budget = _stage_budget.get()
+    return None if budget is None else max(budget[1] - time.monotonic(), 0.0)
+
+
+@contextmanager
+def _budget(profile: ParseProfile, stage: str) -> Iterator[None]:
+    """Applies the budget of `stage` in `profile` to the block."""
+    seconds = profile.budgets.get(stage)
+    token = _stage_budget.set(None if seconds is None else (stage, time.monotonic() + seconds))
+    try:
+        yield
+    finally:
+        _stage_budget.reset(token)
+
+
+@dataclass(frozen=True)
+class ResourceLimits:
+    """Limits on the resources of a single parse, None meaning unlimited. Stages check them from
+    the PDF dictionaries before decoding what they describe, and leave out the work beyond a
+    limit rather than running out of memory:
+
+    - `max_pages`: pages that are laid out or searched for tables and pictograms
+    - `max_image_pixels`, `max_image_bytes`: size of an image, in pixels and decoded bytes;
+      larger images are not decoded
+    - `max_layout_elements`: layout components of all pages laid out
+    - `max_memory_bytes`: estimated memory of the images that a parse holds decoded at once
+      while matching pictograms; layout analysis and table extraction are not counted against
+      it, but are bounded by `max_pages` and `max_layout_elements`"""
+    max_pages: Optional[int] = 1000
+    max_image_pixels: Optional[int] = 50_000_000
+    max_image_bytes: Optional[int] = 256 * 1024 * 1024
+    max_layout_elements: Optional[int] = 1_000_000
+    max_memory_bytes: Optional[int] = 1024 * 1024 * 1024
+
+    UNLIMITED: ClassVar[ResourceLimits]
+
+
+ResourceLimits.UNLIMITED = ResourceLimits(None, None, None, None, None)
+
+
+class ResourceLimitError(Exception):
+    """Raised when a stage reaches one of the :class:`ResourceLimits`. Like
+    :class:`StageTimeoutError`, a stage that can still produce a useful result attaches it as
+    `partial`."""
+    limit: str
+    partial: Any
+
+    def __init__(self, limit: str, message: str, partial: Any = None):
+        super().__init__(message)
+        self.limit = limit
+        self.partial = partial
+
+
+class _ResourceUsage:
+    """Resources used by the stages of a parse so far, shared between concurrent stages."""
+    limits: ResourceLimits
+    degraded: dict[str, str]
+    memory_bytes: int
+    layout_elements: int
+
+    def __init__(self, limits: ResourceLimits, degraded: dict[str, str]):
+        self.limits = limits
+        self.degraded = degraded
+        self.memory_bytes = 0
+        self.layout_elements = 0
+        self.lock = threading.Lock()
+
+
+# Resource usage of the parse that is running
+_resource_usage: ContextVar[Optional[_ResourceUsage]] = ContextVar(
+    "tungsten_resource_usage", default=None)
+
+
+def resource_limits() -> ResourceLimits:
+    """Returns the resource limits of the running parse."""
+    usage = _resource_usage.get()
+    return ResourceLimits.UNLIMITED if usage is None else usage.limits
+
+
+def record_degraded(stage: str, how: str) -> None:
+    """Records in the sheet meta that `stage` left out some of its work ("partial") or stopped
+    early ("truncated") to stay within the resource limits."""
+    usage = _resource_usage.get()
+    if usage is not None:
+        usage.degraded.setdefault(stage, how)
+
+
+def check_page_limit(page_number: int) -> None:
+    """Raises :class:`ResourceLimitError` if the page (1-indexed) is beyond `max_pages`."""
+    max_pages = resource_limits().max_pages
+    if max_pages is not None and page_number > max_pages:
+        raise ResourceLimitError("max_pages",
+                                 f"Page {page_number} exceeds max_pages ({max_pages})")
+
+
+def check_image_limits(width: int, height: int, components: int, bits: int) -> int:
+    """Returns the decoded size in bytes of an image of these dimensions, color components and
+    bits per component, raising :class:`ResourceLimitError` if it exceeds `max_image_pixels` or
+    `max_image_bytes`."""
+    limits = resource_limits()
+    pixels = width * height
+    if limits.max_image_pixels is not None and pixels > limits.max_image_pixels:
+        raise ResourceLimitError("max_image_pixels",
+                                 f"Image of {pixels} pixels exceeds max_image_pixels "
+                                 f"({limits.max_image_pixels})")
+    size = -(-width * components * bits // 8) * height
+    if limits.max_image_bytes is not None and size > limits.max_image_bytes:
+        raise ResourceLimitError("max_image_bytes",
+                                 f"Image of {size} bytes exceeds max_image_bytes "
+                                 f"({limits.max_image_bytes})")
+    return size
+
+
+def reserve_layout_elements(count: int) -> None:
+    """Counts `count` more layout components of the document, raising
+    :class:`ResourceLimitError`, without counting them, if that exceeds `max_layout_elements`."""
+    usage = _resource_usage.get()
+    if usage is None:
+        return
+    with usage.lock:
+        total = usage.layout_elements + count
+        if usage.limits.max_layout_elements is not None \
+                and total > usage.limits.max_layout_elements:
+            raise ResourceLimitError("max_layout_elements",
+                                     f"{total} layout elements exceed max_layout_elements "
+                                     f"({usage.limits.max_layout_elements})")
+        usage.layout_elements = total
+
+
+def reserve_memory(size: int) -> None:
+    """Accounts for `size` more bytes held by the parse, raising :class:`ResourceLimitError`,
+    without accounting for them, if that exceeds `max_memory_bytes`. Reserved memory is given
+    back with :func:`release_memory`."""
+    usage = _resource_usage.get()
+    if usage is None:
+        return
+    with usage.lock:
+        total = usage.memory_bytes + size
+        if usage.limits.max_memory_bytes is not None and total > usage.limits.max_memory_bytes:
+            raise ResourceLimitError("max_memory_bytes",
+                                     f"{total} bytes of decoded data exceed max_memory_bytes "
+                                     f"({usage.limits.max_memory_bytes})")
+        usage.memory_bytes = total
+
+
+def release_memory(size: int) -> None:
+    """Gives back memory reserved with :func:`reserve_memory`."""
+    usage = _resource_usage.get()
+    if usage is not None:
+        with usage.lock:
+            usage.memory_bytes -= size
+
+
+@contextmanager
+def _governed(limits: ResourceLimits, degraded: dict[str, str]) -> Iterator[None]:
+    """Applies `limits` to the parse in the block, recording degraded stages in `degraded`."""
+    token = _resource_usage.set(_ResourceUsage(limits, degraded))
+    try:
+        yield
+    finally:
+        _resource_usage.reset(token)
+
 
 @dataclass
 class Injection:
@@ -182,3 +836,26 @@ class InjectionOverwriteBoundaryMode(Enum):
     NO_ACTION = enum.auto()
     INTERSECTS = enum.auto()
     CONTAINS = enum.auto()
+
+
+@contextmanager
+def _timed(timings: Optional[dict[str, float]], stage: str) -> Iterator[None]:
+    """Adds the seconds spent in the block to `timings[stage]`, unless `timings` is None."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start_time
+
+
+async def _gather_or_cancel(*aws: Awaitable) -> list:
+    """Like :func:`asyncio.gather`, but cancels the remaining awaitables as soon as one fails or
+    the gathering task itself is cancelled."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
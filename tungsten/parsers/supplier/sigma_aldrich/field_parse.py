@@ -1,4 +1,5 @@
 import re
+from functools import cached_property
 from typing import Callable
 
 from tungsten.parsers.field_parse import (
@@ -10,6 +11,11 @@ from tungsten.parsers.field_parse import (
 
 class SigmaAldrichFieldMapper(FieldMapper):
     def get_field_mappings(self, field: SdsQueryFieldName) -> tuple[list[SelectCommand], Callable]:
+        return self.field_mappings[field]
+
+    @cached_property
+    def field_mappings(self) -> dict[SdsQueryFieldName, tuple[list[SelectCommand], Callable]]:
+        """Mappings of every supported field, built once per mapper."""
         return {
             # SdsQueryFieldName.META_VERSION: [],
             # SdsQueryFieldName.META_REVISION_DATE: [],
@@ -155,4 +161,4 @@ class SigmaAldrichFieldMapper(FieldMapper):
                 SelectCommand(key="title", where_value="OTHER_HAZARDS"),
                 SelectCommand(key="items"),
             ], lambda x: x)
-        }[field]
+        }
@@ -1,12 +1,21 @@
+import contextvars
+import copy
+import hashlib
 import logging
+import os
+import threading
 import typing
+import zlib
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import IO, Optional
 
 import cv2
 import numpy as np
 from pdfminer.converter import PDFPageAggregator
 from pdfminer.pdfdocument import PDFDocument
-from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfinterp import PDFPageInterpreter
 from pdfminer.pdfpage import PDFPage
 from pdfminer.pdfparser import PDFParser
 from pdfminer.pdftypes import (
@@ -20,47 +29,132 @@ from pdfminer.pdftypes import (
     LITERALS_LZW_DECODE,
     LITERALS_RUNLENGTH_DECODE,
     PDFObjRef,
-    PDFStream
+    PDFStream,
+    resolve1
 )
-from pdfminer.psparser import PSLiteralTable
-from PIL import Image
+from pdfminer.psparser import PSLiteral, PSLiteralTable
 
-from tungsten.parsers.sds_parser import SdsParserInjector
+from tungsten.parsers.field_parse import ParsePlan
+from tungsten.parsers.font_cache import CachingResourceManager
+from tungsten.parsers.page_cache import hash_pdf_object
+from tungsten.parsers.sds_parser import (
+    PagedSdsParserInjector,
+    ResourceLimitError,
+    check_image_limits,
+    check_page_limit,
+    check_stage_deadline,
+    record_degraded,
+    release_memory,
+    reserve_memory,
+    resource_limits
+)
+from tungsten.pictograms.cache import (
+    PictogramCache,
+    Recognition,
+    default_pictogram_cache
+)
 from tungsten.pictograms.pictograms import Pictogram, get_pictograms_cv2
 
-PillowMode = typing.Literal[
-    "1", "CMYK", "F", "HSV", "I", "L", "LAB", "P", "RGB", "RGBA", "RGBX", "YCbCr"]
+# Filters pdfminer.six decodes into image samples
+_SAMPLE_FILTERS = (*LITERALS_FLATE_DECODE, *LITERALS_LZW_DECODE, *LITERALS_ASCII85_DECODE,
+                   *LITERALS_ASCIIHEX_DECODE, *LITERALS_RUNLENGTH_DECODE)
+_UNSUPPORTED_FILTERS = (*LITERALS_CCITTFAX_DECODE, *LITERALS_JBIG2_DECODE, *LITERALS_JPX_DECODE)
+
 
+@dataclass(frozen=True)
+class _ImageJob:
+    """An image XObject to decode and match, with everything needed from its document read
+    beforehand, as documents cannot be read from multiple threads."""
+    obj: PDFStream
+    name: str
+    page_number: int
+    width: int
+    height: int
+    bits: int
+    palette: Optional[bytes]  # Lookup table of indexed color
+    reserved: int  # Bytes of memory held while decoding and matching
 
-class SigmaAldrichPictogramInjector(SdsParserInjector):
+
+class SigmaAldrichPictogramInjector(PagedSdsParserInjector):
+    name = "pictograms"
+    CONFIDENCE_THRESHOLD = 0.9
     logger: logging.Logger
     pictograms: dict[Pictogram, np.ndarray]
+    cache: PictogramCache
+    decode_workers: int
 
-    def __init__(self):
+    def __init__(self, cache: Optional[PictogramCache] = None,
+                 decode_workers: Optional[int] = None):
+        """Recognitions are cached in `cache`, the process-wide
+        :func:`default_pictogram_cache` if None. Images are decoded and matched by up to
+        `decode_workers` threads, as many as there are CPUs if None."""
         self.logger = logging.getLogger(f"tungsten:{self.__class__.__name__}")
+        self.decode_workers = decode_workers or os.cpu_count() or 1
+        self._decode_executor: Optional[ThreadPoolExecutor] = None
+        self._matcher_buffers = threading.local()
         self.pictograms = get_pictograms_cv2()
         self.pictograms_scaled = {k: cv2.resize(v, (150, 150)) for k, v in self.pictograms.items()}
+        self.cache = cache if cache is not None else default_pictogram_cache()
+        # Cached recognitions only hold for the same templates and threshold
+        digest = hashlib.blake2b(digest_size=8)
+        for pictogram, template in self.pictograms_scaled.items():
+            digest.update(pictogram.value.encode())
+            digest.update(template.tobytes())
+        digest.update(str(self.CONFIDENCE_THRESHOLD).encode())
+        self._recognizer_hash = digest.hexdigest()
+
+    def is_needed(self, plan: ParsePlan) -> bool:
+        # Pictograms are only injected into the meta of the sheet
+        return "pictograms" in plan.meta_keys
 
-    def generate_injections(self, io: IO[bytes]) -> list[dict]:
+    def generate_page_results(self, io: IO[bytes], page_numbers: Optional[set[int]] = None) -> \
+            dict[int, list[Pictogram]]:
+        """Returns the pictogram matches of the square images on each page, in resource order,
+        leaving out images that match no pictogram.
+        Images recognized before, in any document, are looked up in :attr:`cache` instead of
+        being decoded and matched again. The other images are first collected from every page,
+        then decoded and matched concurrently, as zlib and OpenCV release the GIL."""
         self.logger.info("Received request to generate pictogram injections")
-        images = self._extract_images(io)
+        # noinspection PyTypeChecker
+        document = PDFDocument(PDFParser(io))
+
+        # Recognitions of each page in resource order, or hashes of images still to recognize
+        page_entries: dict[int, list[Recognition | str]] = {}
+        jobs: dict[str, _ImageJob] = {}
+        for page_number, images in self._iter_page_images(document, page_numbers):
+            page_entries[page_number] = []
+            for obj_name, obj in images:
+                check_stage_deadline()
+                entry = self._lookup(obj, obj_name, page_number, jobs)
+                if entry is not None:
+                    page_entries[page_number].append(entry)
+        recognitions = self._recognize_all(jobs)
 
+        page_matches: dict[int, list[Pictogram]] = {}
+        for page_number, entries in page_entries.items():
+            page_matches[page_number] = []
+            for entry in entries:
+                recognition = recognitions.get(entry) if isinstance(entry, str) else entry
+                if recognition is not None and recognition.pictogram is not None:
+                    # Image.fromarray(
+                    #     cv2.putText(cv2.cvtColor(image, cv2.COLOR_BGR2RGB),
+                    #                 str(match.value)[11:], (0, 140), cv2.FONT_HERSHEY_PLAIN, 1,
+                    #                 (0, 0, 255), 2)).show()
+                    page_matches[page_number].append(recognition.pictogram)
+        return page_matches
+
+    def injections_from_page_results(
+            self, page_results: dict[int, list[Pictogram]]) -> list[dict]:
         matches = set()
-        for image in images:
-            if 0.8 < image.shape[0] / image.shape[1] < 1.2:
-                match = self._match(image)
-                # Image.fromarray(
-                #     cv2.putText(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), str(match.value)[11:],
-                #                 (0, 140), cv2.FONT_HERSHEY_PLAIN, 1, (0, 0, 255), 2)).show()
+        for page_matches in page_results.values():
+            for match in page_matches:
                 matches.add(match)
         return [{"pictograms": [match.value for match in matches]}]
 
-    def _match(self, image: np.ndarray) -> Optional[Pictogram]:
-        """Return pictogram enum match of image if it exceeds the confidence threshold"""
-        CONFIDENCE_THRESHOLD = 0.9
-
-        # Create features for test image
-        scaled = cv2.resize(image, (150, 150))
+    def _match(self, scaled: np.ndarray) -> Optional[Pictogram]:
+        """Return pictogram enum match of a scaled image if it exceeds the confidence
+        threshold"""
+        CONFIDENCE_THRESHOLD = self.CONFIDENCE_THRESHOLD
 
         similarities: dict[Pictogram, float] = {}
         pict_keys = self.pictograms.keys()
@@ -81,32 +175,38 @@ class SigmaAldrichPictogramInjector(SdsParserInjector):
 
         return choice
 
-    def _extract_images(self, io: IO[bytes]) -> list[np.ndarray]:
-        """Returns a list of BGR OpenCV images from PDF"""
+    def _iter_page_images(self, document: PDFDocument, page_numbers: Optional[set[int]]) -> \
+            Iterator[tuple[int, list[tuple[str, PDFStream]]]]:
+        """Yields the page number and image XObjects, with their resource names, of the given
+        pages (1-indexed, all pages if None) of a PDF. Pages beyond `max_pages` are not
+        searched."""
         # Because the pdfminer.six[image] utilities of images are inadequate
         # There needs to be a custom loading mechanism for PDF images
         self.logger.debug("Importing images...")
 
         # Create relevant pdfminer tools
-        # noinspection PyTypeChecker
-        parser = PDFParser(io)
-        document = PDFDocument(parser)
-        resource_manager = PDFResourceManager()
+        resource_manager = CachingResourceManager()
         device = PDFPageAggregator(resource_manager)
         interpreter = PDFPageInterpreter(resource_manager, device)
 
-        images = []
-
         # Need to grab XObjects from each page to find all image embeddings
         for i, page in enumerate(PDFPage.create_pages(document)):
+            if page_numbers is not None and i + 1 not in page_numbers:
+                continue
+            check_stage_deadline()
+            try:
+                check_page_limit(i + 1)
+            except ResourceLimitError as e:
+                self.logger.warning(f"{e}, skipping the remaining pages")
+                record_degraded(self.name, "truncated")
+                return
             self.logger.debug(f"Getting images from page {i + 1}...")
             interpreter.process_page(page)
+            images: list[tuple[str, PDFStream]] = []
 
             # Get XObject resource for page
             x_object = typing.cast(dict, page.resources.get("XObject"))
-            if not x_object:
-                continue
-            for obj_name in x_object.keys():
+            for obj_name in x_object.keys() if x_object else ():
                 # Get all PDFObjRefs in the XObject (could possibly be a PDFStream for an image)
                 obj_ref = x_object[obj_name]
                 if not isinstance(obj_ref, PDFObjRef):
@@ -117,85 +217,259 @@ class SigmaAldrichPictogramInjector(SdsParserInjector):
                 if not isinstance(obj, PDFStream) or obj.get_any(
                         ("Subtype",)) != PSLiteralTable.intern("Image"):
                     continue
-                # Retrieve raw image byte data
-                raw_data = obj.get_data()
-
-                # Retrieve metadata necessary to load image
-                width = obj.get_any(("W", "Width"))
-                height = obj.get_any(("H", "Height"))
-                bits = obj.get_any(("BPC", "BitsPerComponent"), 1)
-                channels = len(raw_data) / width / height / (bits / 8)
-
-                # Detect if image uses indexed color
-                palette = None
-                color_space = obj.get_any(("ColorSpace",))
-                if color_space and PSLiteralTable.intern("Indexed") in color_space:
-                    # If indexed, the image data itself is not enough to load the image properly
-                    # There needs to be a palette loaded
-                    # The palette is another PDFStream byte stream referenced by PDFObjRef
-                    palette_obj_ref = next(
-                        (e for e in color_space if isinstance(e, PDFObjRef)), None)
-                    assert palette_obj_ref
-                    # Load the palette
-                    palette_stream = document.getobj(palette_obj_ref.objid)
-                    assert isinstance(palette_stream, PDFStream)
-                    palette = palette_stream.get_data()
-
-                # Depending on the number of bits and channels, Pillow/PIL byte image loader modes
-                mode: PillowMode
-                match (bits, channels):
-                    case (1, _):
-                        mode = "1"
-                    case (8, 1):
-                        # 8-Bit pixel encoding are either grayscale (L) or indexed (P)
-                        if not palette:
-                            mode = "L"
-                        else:
-                            mode = "P"
-                    case (8, 3):
-                        mode = "RGB"
-                    case (8, 4):
-                        mode = "CMYK"
-                    case _:
-                        raise NotImplementedError(
-                            f"Mode for {bits} bits and {channels} channels is not implemented.")
-
-                image_pil: Image
-                # Get the type of PDF image filter https://en.wikipedia.org/wiki/PDF#Raster_images
-                filters = obj.get_filters()
-                assert len(filters) == 1
-                filter = filters[0][0]
-                # Process image filter
-                self.logger.debug(f"Reading image in mode {mode} with filter {filter}...")
-                if filter in LITERALS_FLATE_DECODE:
-                    image_pil = Image.frombytes(
-                        mode=mode,
-                        size=(width, height),
-                        data=raw_data,
-                        decoder_name="raw"
-                    )
-                elif filter in tuple(x for y in [LITERALS_LZW_DECODE,
-                                                 LITERALS_ASCII85_DECODE,
-                                                 LITERALS_ASCIIHEX_DECODE,
-                                                 LITERALS_RUNLENGTH_DECODE,
-                                                 LITERALS_CCITTFAX_DECODE,
-                                                 LITERALS_DCT_DECODE,
-                                                 LITERALS_JBIG2_DECODE,
-                                                 LITERALS_JPX_DECODE] for x in y):
-                    raise NotImplementedError(
-                        "Only supports FlateDecode (zlib) image filter for now")
-                else:
-                    raise ValueError("Invalid PDF Image Filter")
-
-                # If image was loaded in 8-bit palette mode, apply the palette
-                if mode == "P" and palette:
-                    image_pil.putpalette(palette)
-
-                # Convert Pillow/PIL image to OpenCV image
-                # noinspection PyTypeChecker
-                image_arr = np.asarray(image_pil.convert("RGB"))
-                image_cv2 = cv2.cvtColor(image_arr, cv2.COLOR_RGB2BGR)
-                if image_cv2 is not None:
-                    images.append(image_cv2)
-
-        return images
+                images.append((obj_name, obj))
+            yield i + 1, images
+
+    def _lookup(self, obj: PDFStream, obj_name: str, page_number: int,
+                jobs: dict[str, _ImageJob]) -> Optional[Recognition | str]:
+        """Returns the cached recognition of an image XObject, or None if the image is not
+        square, or is left out to stay within the resource limits. Otherwise adds a job to
+        recognize the image to `jobs` and returns its key, the hash of the image."""
+        # Retrieve metadata necessary to load image
+        width = obj.get_any(("W", "Width"))
+        height = obj.get_any(("H", "Height"))
+        bits = obj.get_any(("BPC", "BitsPerComponent"), 1)
+        # Pictograms are square
+        if not 0.8 < height / width < 1.2:
+            return None
+
+        image_hash = f"{self._recognizer_hash}:{hash_pdf_object(obj)}"
+        if image_hash in jobs:
+            return image_hash
+        recognition = self.cache.get(image_hash)
+        if recognition is not None:
+            return recognition
+
+        # Check the size of the image from its dictionary before decoding it. The decoded data
+        # is held until the image is converted, the converted image until matched
+        try:
+            decoded_size = check_image_limits(width, height, self._color_components(obj), bits)
+            self._check_inflated_size(obj)
+        except ResourceLimitError as e:
+            self.logger.warning(f"{e}, skipping image {obj_name} on page {page_number}")
+            record_degraded(self.name, "partial")
+            return None
+        jobs[image_hash] = _ImageJob(obj, obj_name, page_number, width, height, bits,
+                                     self._palette(obj),
+                                     decoded_size + width * height * 3)
+        return image_hash
+
+    def _recognize_all(self, jobs: dict[str, _ImageJob]) -> dict[str, Optional[Recognition]]:
+        """Runs the recognition jobs, concurrently if there are several, and returns their
+        recognitions by key. Recognitions are cached in the order of the jobs."""
+        recognitions: dict[str, Optional[Recognition]] = {}
+        if self.decode_workers == 1 or len(jobs) <= 1:
+            for image_hash, job in jobs.items():
+                recognitions[image_hash] = self._recognize(job)
+        else:
+            # Jobs run in copies of the current context, for the stage deadline and resource
+            # limits of the parse
+            futures: dict[str, Future] = {
+                image_hash: self.decode_executor.submit(contextvars.copy_context().run,
+                                                        self._recognize, job)
+                for image_hash, job in jobs.items()}
+            try:
+                for image_hash, future in futures.items():
+                    recognitions[image_hash] = future.result()
+            finally:
+                for future in futures.values():
+                    future.cancel()
+        for image_hash, recognition in recognitions.items():
+            if recognition is not None:
+                self.cache.put(image_hash, recognition)
+        return recognitions
+
+    def _recognize(self, job: _ImageJob) -> Optional[Recognition]:
+        """Decodes and matches the image of a job, or returns None if that would take the memory
+        held by the parse beyond its limit."""
+        check_stage_deadline()
+        try:
+            reserve_memory(job.reserved)
+        except ResourceLimitError as e:
+            self.logger.warning(f"{e}, skipping image {job.name} on page {job.page_number}")
+            record_degraded(self.name, "partial")
+            return None
+        try:
+            return Recognition(self._match(self._decode_scaled(
+                job.obj, job.width, job.height, job.bits, job.palette)))
+        finally:
+            release_memory(job.reserved)
+
+    @property
+    def decode_executor(self) -> ThreadPoolExecutor:
+        """The threads that decode and match images, started when first needed and stopped by
+        :meth:`close`."""
+        if self._decode_executor is None:
+            self._decode_executor = ThreadPoolExecutor(self.decode_workers,
+                                                       thread_name_prefix="tungsten-pictograms")
+        return self._decode_executor
+
+    def close(self) -> None:
+        """Stops the decoding threads. They are started again if the injector is used again."""
+        if self._decode_executor is not None:
+            self._decode_executor.shutdown(cancel_futures=True)
+            self._decode_executor = None
+
+    @staticmethod
+    def _color_components(obj: PDFStream) -> int:
+        """Returns the number of color components per pixel of an image XObject, from its
+        dictionary."""
+        if obj.get_any(("IM", "ImageMask")):
+            return 1
+        color_space = resolve1(obj.get_any(("CS", "ColorSpace")))
+        family, params = (resolve1(color_space[0]), color_space[1:]) \
+            if isinstance(color_space, list) and len(color_space) else (color_space, [])
+        match family.name if isinstance(family, PSLiteral) else None:
+            case "DeviceGray" | "G" | "CalGray" | "Indexed" | "I" | "Separation":
+                return 1
+            case "DeviceRGB" | "RGB" | "CalRGB" | "Lab":
+                return 3
+            case "DeviceCMYK" | "CMYK":
+                return 4
+            case "ICCBased" if len(params):
+                profile = resolve1(params[0])
+                if isinstance(profile, PDFStream):
+                    return int(profile.get_any(("N",), 4))
+            case "DeviceN" if len(params):
+                names = resolve1(params[0])
+                if isinstance(names, list):
+                    return len(names)
+        # Anything else is bounded by the largest common color space
+        return 4
+
+    @staticmethod
+    def _check_inflated_size(obj: PDFStream) -> None:
+        """Raises :class:`ResourceLimitError` if a FlateDecode stream inflates to more than
+        `max_image_bytes`, whatever its dictionary declares, without inflating it any further."""
+        limit = resource_limits().max_image_bytes
+        filters = obj.get_filters()
+        if limit is None or obj.rawdata is None or len(filters) != 1 \
+                or filters[0][0] not in LITERALS_FLATE_DECODE:
+            return
+        # Deflate compresses by a factor of at most 1032, smaller streams cannot exceed the limit
+        if len(obj.rawdata) * 1032 <= limit:
+            return
+        data = obj.rawdata
+        if obj.decipher:
+            data = obj.decipher(obj.objid, obj.genno, data, obj.attrs)
+        try:
+            inflated = zlib.decompressobj().decompress(data, limit + 1)
+        except zlib.error:
+            # Left to the decoder, which recovers what it can of corrupted streams
+            return
+        if len(inflated) > limit:
+            raise ResourceLimitError("max_image_bytes",
+                                     f"Image stream inflates beyond max_image_bytes ({limit})")
+
+    @staticmethod
+    def _palette(obj: PDFStream) -> Optional[bytes]:
+        """Returns the lookup table of an image XObject in indexed color, or None if the image
+        is not in indexed color. A lookup table stream is decoded here, as streams shared by
+        several images cannot be decoded from multiple threads, and from a copy, as decoding
+        changes the hash of a stream (see :func:`hash_pdf_object`)."""
+        # An indexed color space is an array [/Indexed base hival lookup]
+        color_space = resolve1(obj.get_any(("CS", "ColorSpace")))
+        if not isinstance(color_space, list) or len(color_space) < 4:
+            return None
+        family = resolve1(color_space[0])
+        if not isinstance(family, PSLiteral) or family.name not in ("Indexed", "I"):
+            return None
+        lookup = resolve1(color_space[3])
+        if not isinstance(lookup, (PDFStream, bytes)):
+            raise ValueError("Invalid lookup table of indexed color space")
+        return copy.copy(lookup).get_data() if isinstance(lookup, PDFStream) else lookup
+
+    def _decode_scaled(self, obj: PDFStream, width: int, height: int, bits: int,
+                       palette: Optional[bytes] = None) -> np.ndarray:
+        """Decodes an image XObject, with the palette of an image in indexed color, and scales
+        it into the matcher buffer of the thread (see :meth:`_matcher_buffer`), which is
+        returned. Decoded samples are viewed in place, only indexed, CMYK and JPEG images are
+        converted to BGR at full size. Only reads streams already read from the document, so
+        images can be decoded from multiple threads."""
+        # pdfminer.six decodes every filter but JPEG and a few rarely used ones
+        data = obj.get_data()
+        filters = [f for f, _ in obj.get_filters()]
+        scaled = self._matcher_buffer()
+        self.logger.debug(f"Reading image of {bits} bits with filters {filters}...")
+        if len(filters) and filters[-1] in LITERALS_DCT_DECODE:
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError("Invalid JPEG image data")
+            return cv2.resize(image, (150, 150), dst=scaled)
+        for filter in filters:
+            if filter in _UNSUPPORTED_FILTERS:
+                raise NotImplementedError(f"Image filter {filter} is not supported")
+            if filter not in _SAMPLE_FILTERS:
+                raise ValueError("Invalid PDF Image Filter")
+
+        samples = self._samples(data, width, height, bits, indexed=palette is not None)
+        if palette is not None:
+            table = self._palette_table(palette)
+            return cv2.resize(np.take(table, samples[..., 0], axis=0), (150, 150), dst=scaled)
+        match samples.shape[2]:
+            case 1:
+                # Gray is the same in every channel, so it is scaled before it is expanded
+                return cv2.cvtColor(cv2.resize(samples[..., 0], (150, 150)),
+                                    cv2.COLOR_GRAY2BGR, dst=scaled)
+            case 3:
+                # Scaling works on each channel alike, so channels are swapped once scaled
+                cv2.resize(samples, (150, 150), dst=scaled)
+                return cv2.cvtColor(scaled, cv2.COLOR_RGB2BGR, dst=scaled)
+            case 4:
+                return cv2.resize(_cmyk_to_bgr(samples), (150, 150), dst=scaled)
+            case channels:
+                raise NotImplementedError(
+                    f"Mode for {bits} bits and {channels} channels is not implemented.")
+
+    @staticmethod
+    def _samples(data: bytes, width: int, height: int, bits: int, indexed: bool) -> np.ndarray:
+        """Returns the samples of a decoded image as a `height` x `width` x channels array,
+        viewing 8-bit samples without copying them. 1-bit samples are unpacked into palette
+        indices if `indexed`, and into black and white otherwise."""
+        match bits:
+            case 8:
+                channels = len(data) // (width * height)
+                if channels < 1:
+                    raise ValueError("Not enough image data")
+                return np.frombuffer(data, dtype=np.uint8, count=width * height * channels) \
+                    .reshape(height, width, channels)
+            case 1:
+                # Rows start on byte boundaries
+                row_bytes = (width + 7) // 8
+                if len(data) < row_bytes * height:
+                    raise ValueError("Not enough image data")
+                packed = np.frombuffer(data, dtype=np.uint8, count=row_bytes * height)
+                samples = np.unpackbits(packed.reshape(height, row_bytes), axis=1)[:, :width]
+                return (samples if indexed else samples * np.uint8(255))[..., None]
+            case _:
+                raise NotImplementedError(f"Mode for {bits} bits is not implemented.")
+
+    @staticmethod
+    def _palette_table(lookup: bytes) -> np.ndarray:
+        """Returns a 256-entry table of the BGR colors of the palette indices of an indexed
+        color space, whose base color space is taken to be RGB. Entries beyond the palette are
+        black."""
+        count = min(len(lookup) // 3, 256)
+        table = np.zeros((256, 3), dtype=np.uint8)
+        table[:count] = np.frombuffer(lookup, dtype=np.uint8, count=count * 3) \
+            .reshape(count, 3)[:, ::-1]
+        return table
+
+    def _matcher_buffer(self) -> np.ndarray:
+        """Returns the buffer of the thread that images are scaled into for matching, a 150x150
+        BGR image that is reused by every image the thread decodes."""
+        buffer = getattr(self._matcher_buffers, "scaled", None)
+        if buffer is None:
+            buffer = self._matcher_buffers.scaled = np.empty((150, 150, 3), dtype=np.uint8)
+        return buffer
+
+
+def _cmyk_to_bgr(cmyk: np.ndarray) -> np.ndarray:
+    """Converts CMYK samples in the last axis into BGR, like Pillow does."""
+    not_black = 255 - cmyk[..., 3].astype(np.uint16)
+    bgr = np.empty(cmyk.shape[:-1] + (3,), dtype=np.uint8)
+    for i, component in enumerate((2, 1, 0)):
+        # Rounded component * not_black / 255, which fits in 16 bits
+        product = cmyk[..., component] * not_black + 128
+        bgr[..., i] = not_black - (((product >> 8) + product) >> 8)
+    return bgr
@@ -1,10 +1,10 @@
 from __future__ import annotations
 
+from collections.abc import Iterator
 from io import IOBase
-from typing import IO
+from typing import IO, Optional
 
-import pdfminer.high_level as pdfm
-from pdfminer.layout import LAParams, LTText
+from pdfminer.layout import LTText
 
 from tungsten.globally_harmonized_system.safety_data_sheet import (
     GhsSafetyDataSheet,
@@ -14,8 +14,28 @@ from tungsten.globally_harmonized_system.safety_data_sheet import (
     GhsSdsSectionTitle,
     GhsSdsSubsection
 )
-from tungsten.parsers.parsing_hierarchy import HierarchyElement, HierarchyNode
-from tungsten.parsers.sds_parser import SdsParser
+from tungsten.parsers.field_parse import ParsePlan
+from tungsten.parsers.hierarchy_cache import HierarchyCache
+from tungsten.parsers.page_cache import PageCache
+from tungsten.parsers.parsing_hierarchy import (
+    HierarchyElement,
+    HierarchyNode,
+    HierarchyTree,
+    HierarchyTreeNode,
+    PageLayout
+)
+from tungsten.parsers.pdf_backend import PdfBackend, default_backend
+from tungsten.parsers.sds_parser import (
+    ParseProfile,
+    ResourceLimitError,
+    ResourceLimits,
+    SdsParser,
+    StageTimeoutError,
+    record_degraded
+)
+from tungsten.parsers.supplier.sigma_aldrich.field_parse import (
+    SigmaAldrichFieldMapper
+)
 from tungsten.parsers.supplier.sigma_aldrich.pictogram_injector import (
     SigmaAldrichPictogramInjector
 )
@@ -23,27 +43,95 @@ from tungsten.parsers.supplier.sigma_aldrich.safety_data_sheet_rules import (
     SigmaAldrichGhsSdsRules
 )
 from tungsten.parsers.supplier.sigma_aldrich.table_injector import (
-    SigmaAldrichTableInjector
+    SigmaAldrichTableInjector,
+    TableCache,
+    TabulaTable
 )
+from tungsten.parsers.supplier_fingerprint import SupplierFingerprint
+from tungsten.pictograms.cache import PictogramCache
 
 
 class SigmaAldrichSdsParser(SdsParser):
     sds_rules: SigmaAldrichGhsSdsRules
+    backend: PdfBackend
+
+    # Names of the supplier found in the metadata or on the first page of its sheets
+    SUPPLIER_MARKERS = ("sigma-aldrich", "sigmaaldrich", "milliporesigma")
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, page_cache: Optional[PageCache] = None,
+                 profile: Optional[ParseProfile] = None, backend: Optional[PdfBackend] = None,
+                 limits: Optional[ResourceLimits] = None,
+                 pictogram_cache: Optional[PictogramCache] = None,
+                 table_cache: Optional[TableCache] = None,
+                 hierarchy_cache: Optional[HierarchyCache] = None):
+        super().__init__(page_cache=page_cache, profile=profile, limits=limits,
+                         hierarchy_cache=hierarchy_cache)
         self.sds_rules = SigmaAldrichGhsSdsRules()
-        self.register_injector(SigmaAldrichTableInjector())
-        self.register_injector(SigmaAldrichPictogramInjector())
+        self.backend = backend or default_backend()
+        self.field_mapper = SigmaAldrichFieldMapper()
+        self.register_injector(SigmaAldrichTableInjector(table_cache))
+        self.register_injector(SigmaAldrichPictogramInjector(pictogram_cache))
 
-    def _parse_to_hierarchy(self, io: IO[bytes]) -> HierarchyNode:
-        # noinspection PyTypeChecker
-        parsing_elements = self.import_parsing_elements(io)
+    @classmethod
+    def matches_fingerprint(cls, fingerprint: SupplierFingerprint) -> bool:
+        return fingerprint.mentions(*cls.SUPPLIER_MARKERS)
+
+    def _parse_to_hierarchy(self, io: IO[bytes], plan: Optional[ParsePlan] = None) -> \
+            HierarchyTreeNode:
+        if plan is not None and not len(plan.sections):
+            return HierarchyTree().root
+        layouts: list[PageLayout] = []
+        try:
+            # noinspection PyTypeChecker
+            for layout in self.iter_planned_layouts(io, plan):
+                layouts.append(layout)
+        except (StageTimeoutError, ResourceLimitError) as e:
+            # Out of time or resources, the pages laid out so far still make a usable hierarchy
+            if len(layouts):
+                e.partial = self._pages_to_hierarchy(layouts)
+            raise
+        return self._pages_to_hierarchy(layouts)
+
+    def _parse_pages(self, io: IO[bytes], page_numbers: Optional[set[int]] = None) -> \
+            dict[int, PageLayout]:
+        layouts: dict[int, PageLayout] = {}
+        try:
+            # noinspection PyTypeChecker
+            for page_number, layout in self.iter_page_layouts(io, page_numbers, self.backend):
+                layouts[page_number] = layout
+        except (StageTimeoutError, ResourceLimitError) as e:
+            # The pages laid out so far are complete, and can be cached like any other
+            self.logger.warning(f"{e}, keeping the pages laid out so far")
+            record_degraded("layout", "truncated")
+        return layouts
+
+    def _pages_to_hierarchy(self, pages: list[PageLayout]) -> HierarchyTreeNode:
+        parsing_elements = self.assemble_parsing_elements(pages)
         hierarchy = self.generate_initial_hierarchy(parsing_elements)
         section_node = self.generate_section_hierarchy(hierarchy)
         return section_node
 
-    def _hierarchy_to_ghs_sds(self, root: HierarchyNode) -> GhsSafetyDataSheet:
+    def iter_planned_layouts(self, io: IOBase, plan: Optional[ParsePlan] = None) -> \
+            Iterator[PageLayout]:
+        """Lazily yields the :class:`PageLayout` of every page of the PDF, or if a `plan` is
+        given, of the pages up to and including the page on which the section following the last
+        section in `plan` starts. Sections appear in order, so the remaining pages hold none of
+        the planned sections."""
+        last_section = None if plan is None else max(section.value for section in plan.sections)
+        for _, layout in self.iter_page_layouts(io, backend=self.backend):
+            yield layout
+            if last_section is None:
+                continue
+            for component in layout.components:
+                if not isinstance(component, LTText):
+                    continue
+                text = component.get_text()
+                if self.sds_rules.is_section(text):
+                    section_title = self.sds_rules.discriminate_section(text)
+                    if section_title is not None and section_title.value > last_section:
+                        return
+
+    def _hierarchy_to_ghs_sds(self, root: HierarchyTreeNode) -> GhsSafetyDataSheet:
         ghs_sds = GhsSafetyDataSheet(
             name="default",  # TODO figure out what to do with names
             meta={},
@@ -51,20 +139,25 @@ class SigmaAldrichSdsParser(SdsParser):
         )
         return ghs_sds
 
-    def generate_section_hierarchy(self, hierarchy: HierarchyNode) -> HierarchyNode:
+    def generate_section_hierarchy(self, hierarchy: HierarchyTreeNode) -> HierarchyTreeNode:
         """In a Sigma-Aldrich SDS, the sections are at the same x-level as the subsections.
         It's useful to have subsection nodes underneath the section nodes, so this method fulfills
-        this purpose."""
+        this purpose. The tree is regrouped in place, elements before the first section are
+        left out."""
         # We assume that the GHS SDS sections are children of the root node.
         # This may node always be the case. TODO implement level search of GHS SDS sections
-        sds_root_node = HierarchyNode(is_root=True)
-        for child in hierarchy.children:
-            if self.sds_rules.is_section(child.data.text_content):
-                sds_root_node.add_child(child)
+        tree = hierarchy.tree
+        section_children: dict[int, list[int]] = {}
+        for child in tree.children(hierarchy.index):
+            if self.sds_rules.is_section(tree.elements[child].text_content):
+                section_children[child] = tree.children(child)
             else:
-                if len(sds_root_node.children):
-                    sds_root_node.children[-1].add_child(child)
-        return sds_root_node
+                if len(section_children):
+                    section_children[next(reversed(section_children))].append(child)
+        tree.set_children(hierarchy.index, list(section_children))
+        for section, children in section_children.items():
+            tree.set_children(section, children)
+        return hierarchy
 
     def identify_ghs_sections(self, sds_children: list[HierarchyNode]) -> list[GhsSdsSection]:
         """Applies the rules specified in :class:`SigmaAldrichGhsSdsRules` to create list of
@@ -93,55 +186,90 @@ class SigmaAldrichSdsParser(SdsParser):
         # TODO detect/assume section type more thoroughly.
         # Currently, it is assumed that all items are LIST
         ghs_subsections: list[GhsSdsSubsection] = []
+        # Tables placed directly under the section, before its first subsection
+        leading_tables: list[GhsSdsItem] = []
         for child in section_children:
+            if isinstance(child.data.element, TabulaTable):
+                # A table is not a subsection, it belongs to the subsection before it
+                item = self.table_item(child.parent, child)
+                if len(ghs_subsections):
+                    ghs_subsections[-1].items.append(item)
+                else:
+                    leading_tables.append(item)
+                continue
             subsection_title = self.sds_rules \
                 .discriminate_subsection(child.data.text_content, context)
-            ghs_subsections.append(GhsSdsSubsection(
-                subsection_title,
-                [GhsSdsItem(
+            items: list[GhsSdsItem] = []
+            for subchild in child.children:
+                if isinstance(subchild.data.element, TabulaTable):
+                    items.append(self.table_item(child, subchild))
+                    continue
+                items.append(GhsSdsItem(
                     type=GhsSdsItemType.FIELD,
                     name=str(subchild.data),
-                    data=self.flatten_to_children_str(subchild)) for subchild in child.children],
+                    data=self.flatten_to_children_str(subchild)))
+                # Tables within the field follow it as items of their own
+                items.extend(self.table_item(parent, node)
+                             for parent, node in self.find_table_nodes(subchild))
+            if not len(ghs_subsections):
+                items[:0] = leading_tables
+            ghs_subsections.append(GhsSdsSubsection(
+                subsection_title,
+                items,
                 child.data.text_content
             ))
+        if not len(ghs_subsections) and len(leading_tables):
+            # Tables of a section without subsections are kept in an untitled one
+            ghs_subsections.append(GhsSdsSubsection(
+                self.sds_rules.get_subsection_discriminator()[context].default,
+                leading_tables,
+                ""
+            ))
         return ghs_subsections
 
-    def flatten_to_children_str(self, head: HierarchyNode) -> list[str]:
-        """Flattens an entire tree of HierarchyNodes to a list of strings (DFS)"""
-        names: list[str] = []
-        stack: list[HierarchyNode] = head.children
-        stack.reverse()
-        while len(stack):
-            # Pop
-            hand = stack.pop()
+    @staticmethod
+    def table_item(parent: HierarchyNode, node: HierarchyNode) -> GhsSdsItem:
+        """Returns the item of a table node, named after the element the table was placed
+        under."""
+        return GhsSdsItem(
+            type=GhsSdsItemType.TABLE,
+            name=parent.data.text_content.strip(),
+            data=node.data.element.to_dict())
 
-            # Process
-            names.append(str(hand.data))
+    @staticmethod
+    def find_table_nodes(head: HierarchyTreeNode) -> \
+            list[tuple[HierarchyTreeNode, HierarchyTreeNode]]:
+        """Returns the table nodes below a node with their parents, in the order of
+        :meth:`flatten_to_children_str`."""
+        return [(node.parent, node) for node in head.preorder()[1:]
+                if isinstance(node.data.element, TabulaTable)]
 
-            # Push
-            stack.extend(child for child in reversed(hand.children))
-        return names
+    def flatten_to_children_str(self, head: HierarchyNode) -> list[str]:
+        """Flattens an entire tree of HierarchyNodes to a list of strings (DFS). Tables are left
+        out, see :meth:`find_table_nodes`."""
+        return [str(node.data) for node in head.preorder()[1:]
+                if not isinstance(node.data.element, TabulaTable)]
 
     def generate_initial_hierarchy(self,
-                                   parsing_elements: list[HierarchyElement]) -> HierarchyNode:
-        """Returns a HierarchyNode representing the initial text parse pass hierarchy based on x
+                                   parsing_elements: list[HierarchyElement]) -> \
+            HierarchyTreeNode:
+        """Returns the root of a HierarchyTree representing the initial text parse pass
+        hierarchy based on x
         Currently, this function does not catch these edge cases:
          - An element will be further to the left than the first element,
          this triggers a stack underflow"""
 
         # Data Structures
-        hierarchy = HierarchyNode(
-            is_root=True)  # root node. the tree represents the parsing hierarchy
-        node_stack = []  # stack of dictionaries, used to remember higher level dictionaries
+        hierarchy = HierarchyTree()  # the tree represents the parsing hierarchy
+        node_stack: list[int] = []  # stack of nodes, used to remember higher level nodes
         x_stack = []  # stack of x coordinates
 
         # Push root node to stack
-        node_stack.append(hierarchy)
+        node_stack.append(hierarchy.root.index)
 
         # Push initial node to datastructures
         held_element = parsing_elements.pop()
-        new_node = HierarchyNode(held_element)
-        hierarchy.add_child(new_node)
+        new_node = hierarchy.add_node(hierarchy.root.index, held_element)
         x_stack.append(held_element.page_x0)
         node_stack.append(new_node)
 
@@ -163,8 +291,7 @@ class SigmaAldrichSdsParser(SdsParser):
                 x_stack.append(held_x)
 
                 # Add new node as a child
-                new_node = HierarchyNode(held_element)
-                held_node.add_child(new_node)
+                new_node = hierarchy.add_node(held_node, held_element)
                 node_stack.append(new_node)
                 # Push new x level, which is further to the right
                 x_stack.append(held_element.page_x0)
@@ -175,8 +302,7 @@ class SigmaAldrichSdsParser(SdsParser):
                 x_stack.append(held_x)
 
                 # Add new node at the same level
-                new_node = HierarchyNode(held_element)
-                node_stack[-1].add_child(new_node)
+                new_node = hierarchy.add_node(node_stack[-1], held_element)
                 node_stack.append(new_node)
             # If the element is further to the left,
             # then we just hold off on doing anything
@@ -187,7 +313,7 @@ class SigmaAldrichSdsParser(SdsParser):
             else:
                 raise Exception
 
-        return hierarchy
+        return hierarchy.root
 
     @staticmethod
     def should_skip_element(element: HierarchyElement) -> bool:
@@ -201,20 +327,43 @@ class SigmaAldrichSdsParser(SdsParser):
         return should_skip
 
     @staticmethod
-    def import_parsing_elements(io: IOBase) -> list[HierarchyElement]:
+    def import_parsing_elements(io: IOBase, backend: Optional[PdfBackend] = None) -> \
+            list[HierarchyElement]:
         """Given an IOBase, returns a list of :class:`ParsingElement` objects that represent
         elements within the PDF of the Sigma-Aldrich SDS."""
-        # Use pdfminer.six to parse out pdf components, to then convert and add to a list
+        layouts = SigmaAldrichSdsParser.import_page_layouts(io, backend=backend)
+        return SigmaAldrichSdsParser.assemble_parsing_elements(list(layouts.values()))
+
+    @staticmethod
+    def import_page_layouts(io: IOBase, page_numbers: Optional[set[int]] = None,
+                            backend: Optional[PdfBackend] = None) -> dict[int, PageLayout]:
+        """Given an IOBase, returns the :class:`PageLayout` of the given pages (1-indexed, all
+        pages if None) of the PDF of the Sigma-Aldrich SDS, keyed by page number."""
+        return dict(SigmaAldrichSdsParser.iter_page_layouts(io, page_numbers, backend))
+
+    @staticmethod
+    def iter_page_layouts(io: IOBase, page_numbers: Optional[set[int]] = None,
+                          backend: Optional[PdfBackend] = None) -> \
+            Iterator[tuple[int, PageLayout]]:
+        """Lazily yields the page number and :class:`PageLayout` of the given pages (1-indexed,
+        all pages if None) of the PDF of the Sigma-Aldrich SDS, in page order, laid out by
+        `backend` (see :func:`default_backend` if None). Pages are only laid out as they are
+        consumed."""
+        # noinspection PyTypeChecker
+        return (backend or default_backend()).iter_page_layouts(io, page_numbers)
+
+    @staticmethod
+    def assemble_parsing_elements(layouts: list[PageLayout]) -> list[HierarchyElement]:
+        """Given the :class:`PageLayout` of every page in order, returns a list of
+        :class:`ParsingElement` objects in document coordinates."""
         parsing_elements = []
         # Amount to add to ensure y values for subsequent pages are increasingly larger
         page_y_offset = 0
         # Keep track of page number
         page_number = 1
-        # set line_margin=0 to separate fields
-        # note that we may need to programmatically join together paragraphs later
-        for page in pdfm.extract_pages(io, laparams=LAParams(line_margin=0)):
-            page_length = page.y1 - page.y0
-            for component in page:
+        for layout in layouts:
+            page_length = layout.page_length
+            for component in layout.components:
                 parsing_elements.append(HierarchyElement(
                     page_num=page_number,
                     page_x0=component.x0,
@@ -1,63 +1,285 @@
 from __future__ import annotations
 
+import asyncio
+import contextvars
+import copy
+import hashlib
+import json
 import logging as logging
+import os
+import subprocess
 import time
+from concurrent.futures import Executor
 from dataclasses import dataclass
-from typing import IO
+from typing import IO, Optional
 
+import numpy as np
 import tabula
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
+from tabula.file_util import localize_file
+from tabula.util import TabulaOption
 
+from tungsten.globally_harmonized_system.safety_data_sheet import (
+    GhsSdsSectionTitle
+)
+from tungsten.parsers.field_parse import ParsePlan
+from tungsten.parsers.page_cache import hash_pdf_pages
 from tungsten.parsers.parsing_hierarchy import HierarchyElement
+from tungsten.parsers.pdf_source import PdfView
+from tungsten.parsers.result_cache import MemoryTier, SqliteTier, TieredCache
 from tungsten.parsers.sds_parser import (
     CoordinateType,
     Injection,
     InjectionBox,
     InjectionOverwriteBoundaryMode,
-    SdsParserInjector
+    PagedSdsParserInjector,
+    StageTimeoutError,
+    record_degraded,
+    resource_limits,
+    stage_time_remaining
 )
 
 
-class SigmaAldrichTableInjector(SdsParserInjector):
+class SigmaAldrichTableInjector(PagedSdsParserInjector):
+    name = "tables"
+    # Sections of Sigma-Aldrich sheets that never hold tables, their fields are laid out as
+    # label and value lines
+    TABLE_FREE_SECTIONS = frozenset({
+        GhsSdsSectionTitle.IDENTIFICATION,
+        GhsSdsSectionTitle.HAZARDS,
+    })
+    # Tables seem to have dividers between rows when line spacing >12.5 pt.
+    ROW_MERGE_THRESHOLD = 12.5
     logger: logging.Logger
+    cache: TableCache
 
-    def __init__(self):
+    def __init__(self, cache: Optional[TableCache] = None):
+        """Cleaned tables are cached by page in `cache`, the process-wide
+        :func:`default_table_cache` if None."""
         self.logger = logging.getLogger(f"tungsten:{self.__class__.__name__}")
+        self.cache = cache if cache is not None else default_table_cache()
+        # Cached tables only hold for the same tabula-java build, options and cleaning
+        # noinspection PyProtectedMember
+        self._extraction_hash = hashlib.blake2b(json.dumps([
+            os.path.basename(tabula.io._jar_path()),
+            self._tabula_options(None).build_option_list(),
+            self.ROW_MERGE_THRESHOLD,
+        ]).encode(), digest_size=8).hexdigest()
+
+    def is_needed(self, plan: ParsePlan) -> bool:
+        return not plan.sections <= self.TABLE_FREE_SECTIONS
 
-    def generate_injections(self, io: IO[bytes]) -> list[Injection]:
+    def generate_page_results(self, io: IO[bytes], page_numbers: Optional[set[int]] = None) -> \
+            dict[int, list[TabulaTable]]:
+        """Returns the cleaned tables found on each page. Tables of pages extracted before, in
+        any document, are taken from :attr:`cache`, tabula-java only runs for the other pages."""
         start_time = time.perf_counter()
         self.logger.info("Received request to generate table injections")
 
-        # noinspection PyTypeChecker
-        json_list: list[dict] = tabula.read_pdf(
-            io,
-            "json",
-            multiple_tables=True,
-            pages="all",
+        page_numbers = self._pages_within_limit(io, page_numbers)
+        if page_numbers is not None and not len(page_numbers):
+            return {}
+        page_tables, missing = self._cached_page_tables(io, page_numbers)
+        if not len(missing):
+            return page_tables
+        path, temporary = self._local_path(io)
+        try:
+            # Equivalent to tabula.read_pdf, which cannot bound the time tabula-java takes
+            result = subprocess.run(self._tabula_args(path, set(missing)),
+                                    stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, timeout=stage_time_remaining(),
+                                    check=True)
+        except subprocess.TimeoutExpired:
+            # subprocess.run kills tabula-java before raising
+            raise StageTimeoutError(self.name)
+        finally:
+            if temporary:
+                os.unlink(path)
+        return self._cache_page_tables(page_tables, missing, self._clean_tables(
+            self._parse_tabula_output(result.stdout, result.stderr), set(missing), start_time))
+
+    async def generate_injections_async(self, io: IO[bytes],
+                                        executor: Optional[Executor] = None) -> list[Injection]:
+        """Runs tabula-java as a subprocess driven by the event loop, rather than blocking a
+        thread for the duration of the extraction. The subprocess is killed on cancellation."""
+        start_time = time.perf_counter()
+        self.logger.info("Received request to generate table injections")
+        loop = asyncio.get_running_loop()
+        page_numbers = await loop.run_in_executor(
+            executor, contextvars.copy_context().run, self._pages_within_limit, io, None)
+        if page_numbers is not None and not len(page_numbers):
+            return []
+        page_tables, missing = await loop.run_in_executor(
+            executor, contextvars.copy_context().run, self._cached_page_tables, io, page_numbers)
+        if not len(missing):
+            return self.injections_from_page_results(page_tables)
+        path, temporary = await loop.run_in_executor(executor, self._local_path, io)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self._tabula_args(path, set(missing)),
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE)
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(),
+                                                        stage_time_remaining())
+            except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+                process.kill()
+                await process.wait()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise StageTimeoutError(self.name)
+                raise
+        finally:
+            if temporary:
+                os.unlink(path)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, process.args, stdout, stderr)
+        return self.injections_from_page_results(self._cache_page_tables(
+            page_tables, missing,
+            self._clean_tables(self._parse_tabula_output(stdout, stderr), set(missing),
+                               start_time)))
+
+    def _parse_tabula_output(self, stdout: bytes, stderr: bytes) -> list[dict]:
+        if stderr:
+            self.logger.warning(f"Got stderr: {stderr.decode('utf-8')}")
+        return json.loads(stdout.decode("utf-8")) if len(stdout) else []
+
+    def _pages_within_limit(self, io: IO[bytes], page_numbers: Optional[set[int]]) -> \
+            Optional[set[int]]:
+        """Returns the given pages (1-indexed, all pages if None) that are within `max_pages`,
+        None meaning all pages."""
+        max_pages = resource_limits().max_pages
+        if max_pages is None:
+            return page_numbers
+        if page_numbers is None:
+            # The page count is read from the page tree, before tabula-java parses any page
+            try:
+                # noinspection PyTypeChecker
+                document = PDFDocument(PDFParser(io))
+                page_count = int(resolve1(resolve1(document.catalog["Pages"])["Count"]))
+            except (KeyError, TypeError, ValueError):
+                return None
+            if page_count <= max_pages:
+                return None
+            page_numbers = set(range(1, page_count + 1))
+        within = {page_number for page_number in page_numbers if page_number <= max_pages}
+        if len(within) < len(page_numbers):
+            self.logger.warning(f"Skipping the tables of pages beyond max_pages ({max_pages})")
+            record_degraded(self.name, "truncated")
+        return within
+
+    def _cached_page_tables(self, io: IO[bytes], page_numbers: Optional[set[int]]) -> \
+            tuple[dict[int, list[TabulaTable]], dict[int, str]]:
+        """Returns the cached tables of the given pages (1-indexed, all pages within `max_pages`
+        if None), and the cache keys of the pages whose tables are not cached."""
+        page_hashes = hash_pdf_pages(io, resource_limits().max_pages if page_numbers is None
+                                     else max(page_numbers))
+        page_tables: dict[int, list[TabulaTable]] = {}
+        missing: dict[int, str] = {}
+        for page_number, page_hash in enumerate(page_hashes, start=1):
+            if page_numbers is not None and page_number not in page_numbers:
+                continue
+            key = f"{self._extraction_hash}:{page_hash}"
+            tables = self.cache.get(key)
+            if tables is None:
+                missing[page_number] = key
+            else:
+                page_tables[page_number] = tables
+        self.logger.info(f"Reused the tables of {len(page_tables)} of "
+                         f"{len(page_tables) + len(missing)} pages")
+        return page_tables, missing
+
+    def _cache_page_tables(self, page_tables: dict[int, list[TabulaTable]],
+                           missing: dict[int, str],
+                           extracted: dict[int, list[TabulaTable]]) -> \
+            dict[int, list[TabulaTable]]:
+        """Caches the tables extracted for the pages that were missing from the cache, and
+        returns them with the cached tables, in page order."""
+        for page_number, tables in extracted.items():
+            if page_number in missing:
+                self.cache.put(missing[page_number], tables)
+        return dict(sorted((page_tables | extracted).items()))
+
+    @staticmethod
+    def _local_path(io: IO[bytes]) -> tuple[str, bool]:
+        """Returns the path of a file holding the PDF, for tabula-java, and whether it is a
+        temporary file. Views of a PDF read from a file use that file, other streams are written
+        to a temporary file."""
+        if isinstance(io, PdfView) and io.path is not None:
+            return io.path, False
+        return localize_file(io)
+
+    @staticmethod
+    def _tabula_options(page_numbers: Optional[set[int]]) -> TabulaOption:
+        """Returns the options Tungsten uses with :func:`tabula.read_pdf`, for extracting the
+        tables of the given pages (1-indexed, all pages if None)."""
+        return TabulaOption(
+            pages="all" if page_numbers is None else sorted(page_numbers),
             guess=True,
             stream=True,
-            silent=False
+            silent=False,
+            format="JSON",
+            multiple_tables=False
         )
+
+    @classmethod
+    def _tabula_args(cls, path: str, page_numbers: Optional[set[int]]) -> list[str]:
+        """Returns the tabula-java command line for extracting the tables of the given pages
+        (1-indexed, all pages if None)."""
+        # noinspection PyProtectedMember
+        return ["java", "-Dfile.encoding=UTF8", "-jar", tabula.io._jar_path()] + \
+            cls._tabula_options(page_numbers).build_option_list() + [path]
+
+    def _clean_tables(self, json_list: list[dict], page_numbers: Optional[set[int]],
+                      start_time: float) -> dict[int, list[TabulaTable]]:
+        """Cleans the tables of tabula's JSON output and groups them by page."""
         tables: list[TabulaTable] = []
         for json_dict in json_list:
-            tabula_table = TabulaTable(json_dict)
-            if len(tabula_table.data) > 1:
-                tables.append(tabula_table)
-        for table in tables:
-            self.logger.debug(f"Found: {table}")
+            if len(json_dict["data"]) <= 1:
+                continue
+            try:
+                table = ColumnarTabulaTable.from_json(json_dict)
+            except ValueError:
+                # Tables with ragged rows are cleaned row by row
+                table = TabulaTable(json_dict)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"Found: {table}")
             # Strip all cells, just in case
             table.strip_text()
-            # Tables seem to have dividers between rows when line spacing >12.5 pt.
-            table.merge_rows(line_threshold=12.5)
+            table.merge_rows(line_threshold=self.ROW_MERGE_THRESHOLD)
             # Extract remarks to not mess with other tabled data
             table.extract_remarks()
             # Assume that empty cells are references to above cells
             table.pull_down_to_empty()
             # Remove rows with remaining empty cells
             # table.delete_rows_with_empty()
-            self.logger.debug(f"Cleaned: {table}")
+            if isinstance(table, ColumnarTabulaTable):
+                table = table.to_table()
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"Cleaned: {table}")
+            tables.append(table)
         self.logger.info(f"Found {len(tables)} tables in "
                          f"{time.perf_counter() - start_time} seconds.")
 
+        page_tables: dict[int, list[TabulaTable]] = {
+            page_number: [] for page_number in page_numbers or ()}
+        for table in tables:
+            page_tables.setdefault(table.page_number, []).append(table)
+        return page_tables
+
+    def injections_from_page_results(self, page_results: dict[int, list[TabulaTable]]) -> \
+            list[Injection]:
+        tables: list[TabulaTable] = []
+        for page_number, page_tables in page_results.items():
+            for table in page_tables:
+                # Tables reused from a page that has since moved within the document
+                if table.page_number != page_number:
+                    table = copy.copy(table)
+                    table.page_number = page_number
+                tables.append(table)
+
         i: int = 0
         while i < len(tables):
             if self.reject_table(tables[i]):
@@ -93,7 +315,8 @@ class SigmaAldrichTableInjector(SdsParserInjector):
                     document_y1=table.page_number * hardcoded_page_len_ltr + table.top,
                     class_name=TabulaTable.__name__,
                     element=table,
-                    text_content=str(table)
+                    # Tables are output as structured items rather than text
+                    text_content=""
                 )
             ))
 
@@ -109,6 +332,41 @@ class SigmaAldrichTableInjector(SdsParserInjector):
             return True
 
 
+class TableCache(TieredCache):
+    """Bounded least-recently-used store of the cleaned tables of pages, keyed by the content
+    hash of the page (see :func:`hash_pdf_pages`) and the extraction options, so pages seen
+    before, such as reprinted or boilerplate pages, are not passed to tabula-java again.
+
+    If a `path` is given, tables are also persisted in a SQLite database, which outlives the
+    process and can be shared between processes. The database holds the tables of up to
+    `max_persisted_entries` pages, evicting the least recently used ones. Safe to use from
+    multiple threads."""
+
+    def __init__(self, max_entries: int = 1024, path: Optional[str | os.PathLike] = None,
+                 max_persisted_entries: int = 65536):
+        super().__init__(MemoryTier(max_entries),
+                         *(() if path is None else (SqliteTier(path, max_persisted_entries),)))
+
+    def get(self, key: str) -> Optional[list[TabulaTable]]:
+        """Returns the tables of the page, or None if they are not cached."""
+        return super().get(key)
+
+    def __len__(self):
+        return len(self.tiers[0])
+
+
+_default_cache: Optional[TableCache] = None
+
+
+def default_table_cache() -> TableCache:
+    """Returns the in-memory :class:`TableCache` shared by the injectors of a process that are
+    not given one."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = TableCache()
+    return _default_cache
+
+
 @dataclass
 class TabulaTable:
     """Represents an auto-detected table by Tabula in a PDF."""
@@ -140,6 +398,22 @@ class TabulaTable:
         self.remarks = {}
         self.additional_ops = []
 
+    def to_dict(self) -> dict:
+        """Returns the table as output in a :class:`GhsSdsItem`: its geometry, the text of its
+        cells by row and column, and its remarks with the row they refer to."""
+        return {
+            "extraction_method": self.extraction_method,
+            "page_number": self.page_number,
+            "top": self.top,
+            "bottom": self.bottom,
+            "left": self.left,
+            "right": self.right,
+            "width": self.width,
+            "height": self.height,
+            "rows": [[cell.text for cell in row] for row in self.data],
+            "remarks": [{"row": row, "text": text} for row, text in sorted(self.remarks.items())],
+        }
+
     def strip_text(self):
         """Strips whitespace from the text of each cell."""
         for row in self.data:
@@ -253,3 +527,136 @@ class TabulaTableCell:
 
     def __str__(self):
         return self.text
+
+
+_strip = np.frompyfunc(str.strip, 1, 1)
+_has_remark = np.frompyfunc(lambda text: "Remarks" in text, 1, 1)
+
+
+class ColumnarTabulaTable:
+    """A :class:`TabulaTable` held column-wise: the geometry of its cells in float arrays and
+    their text in an object array, each indexed by row and column. Cleaning operations are the
+    same as :class:`TabulaTable`'s, but work on whole arrays at once rather than popping rows
+    one at a time, which is quadratic in the number of rows.
+
+    Only tables whose rows all have the same number of cells, as tabula-java produces them,
+    can be held column-wise."""
+    attributes: dict  # Table attributes of the tabula JSON, all but "data"
+    top: np.ndarray  # Distance of top of cells from top of page, in points
+    left: np.ndarray  # Distance of left of cells from left of page, in points
+    width: np.ndarray  # Width of cells, in points
+    height: np.ndarray  # Height of cells, in points
+    text: np.ndarray  # Text in cells
+    remarks: dict[int, str]  # Dictionary of "Remarks" rows and a reference to the row # above
+    additional_ops: list[str]  # Log of additional post-processing operations after Tabula export
+
+    def __init__(self, attributes: dict, top: np.ndarray, left: np.ndarray, width: np.ndarray,
+                 height: np.ndarray, text: np.ndarray):
+        self.attributes = attributes
+        self.top = top
+        self.left = left
+        self.width = width
+        self.height = height
+        self.text = text
+        self.remarks = {}
+        self.additional_ops = []
+
+    @classmethod
+    def from_json(cls, json_dict: dict) -> ColumnarTabulaTable:
+        """Returns the table of a tabula JSON table. Raises ValueError if its rows do not all
+        have the same number of cells."""
+        rows = json_dict["data"]
+        column_count = len(rows[0]) if len(rows) else 0
+        if any(len(row) != column_count for row in rows):
+            raise ValueError("Rows of the table have different numbers of cells.")
+        shape = (len(rows), column_count)
+        cells = [cell for row in rows for cell in row]
+        geometry = np.array([(cell["top"], cell["left"], cell["width"], cell["height"])
+                             for cell in cells], dtype=np.float64).reshape(shape + (4,))
+        text = np.empty(len(cells), dtype=object)
+        text[:] = [cell["text"] for cell in cells]
+        return cls({key: value for key, value in json_dict.items() if key != "data"},
+                   *np.moveaxis(geometry, -1, 0).copy(), text.reshape(shape))
+
+    def to_json(self) -> dict:
+        """Returns the table as a tabula JSON table."""
+        return self.attributes | {"data": [
+            [{"top": top, "left": left, "width": width, "height": height, "text": text}
+             for top, left, width, height, text in zip(*row)]
+            for row in zip(self.top.tolist(), self.left.tolist(), self.width.tolist(),
+                           self.height.tolist(), self.text.tolist())]}
+
+    def __str__(self):
+        return str(self.to_table())
+
+    def to_table(self) -> TabulaTable:
+        """Returns the table as a :class:`TabulaTable`, with its remarks and operation log."""
+        table = TabulaTable(self.to_json())
+        table.remarks = dict(self.remarks)
+        table.additional_ops = list(self.additional_ops)
+        return table
+
+    def strip_text(self):
+        """Strips whitespace from the text of each cell."""
+        self.text = _strip(self.text)
+        self.additional_ops.append("strip_text")
+
+    def merge_rows(self, line_threshold: float = 12.5):
+        """Merges rows that are within line_threshold points of each other."""
+        row_top = self.top.max(axis=1)
+        row_height = self.height.max(axis=1)
+        # Every row within line_threshold points of the row before it joins that row's group
+        merged = np.concatenate(([False], np.diff(row_top) < line_threshold))
+        starts = np.flatnonzero(~merged)
+        # Non-empty cells of the first row of a group take the text and height of the others
+        text = np.where(merged[:, None], " " + self.text, self.text)
+        height = np.where(merged[:, None], row_height[:, None], self.height)
+        head_empty = self.text[starts] == ""
+        self.text = np.where(head_empty, self.text[starts], np.add.reduceat(text, starts))
+        self.height = np.where(head_empty, self.height[starts],
+                               np.add.reduceat(height, starts, axis=0))
+        self.top = self.top[starts]
+        self.left = self.left[starts]
+        self.width = self.width[starts]
+        self.additional_ops.append("merge_rows")
+
+    def extract_remarks(self):
+        """Removes rows containing remarks and places then into the remarks dictionary"""
+        has_remark = _has_remark(self.text).astype(bool)
+        has_remark[:1] = False
+        is_remark = has_remark.any(axis=1)
+        # Remarks refer to the row above them once earlier remark rows are removed
+        references = np.arange(len(is_remark)) - np.cumsum(is_remark)
+        for i in np.flatnonzero(is_remark).tolist():
+            j = int(np.argmax(has_remark[i]))
+            self.remarks[int(references[i])] = " ".join(self.text[i, j + 1:].tolist())
+        self._keep_rows(~is_remark)
+
+    def pull_down_to_empty(self):
+        """Pulls down the value of the cell above if the current cell is empty. Does not pull down
+        the first row after headers (to not pull down headers)."""
+        if len(self.text) < 3:
+            return
+        rows = np.arange(len(self.text))[:, None]
+        # Each cell from the second row on takes the text of the last non-empty cell above it,
+        # up to the second row
+        source = np.where((self.text != "") | (rows == 1), rows, 0)
+        source[1:] = np.maximum.accumulate(source[1:], axis=0)
+        source[0] = 0
+        self.text = np.take_along_axis(self.text, source, axis=0)
+        self.additional_ops.append("pull_down_to_empty")
+
+    def delete_rows_with_empty(self):
+        """Deletes rows with empty cells. Should usually be applied after pull_down_to_empty."""
+        self._keep_rows(~(self.text == "").any(axis=1))
+        self.additional_ops.append("delete_rows_with_empty")
+
+    def _keep_rows(self, mask: np.ndarray):
+        self.top = self.top[mask]
+        self.left = self.left[mask]
+        self.width = self.width[mask]
+        self.height = self.height[mask]
+        self.text = self.text[mask]
+
+    def __len__(self):
+        return len(self.text)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from io import StringIO
+from typing import IO, Optional
+
+from pdfminer.converter import TextConverter
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
+from pdfminer.psparser import PSLiteral
+from pdfminer.utils import decode_text
+
+from tungsten.parsers.font_cache import CachingResourceManager
+
+
+class SupplierFingerprint:
+    """Features of a PDF that identify the supplier of the sheet, read without laying out any
+    page: the document information dictionary, and the fonts and raw text of the first page.
+
+    Only the cross-reference table, the information dictionary and the first page's resources
+    are read when the fingerprint is made. The text of the first page is extracted when it is
+    first accessed, from the PDF the fingerprint was made from, which must stay open until then.
+    """
+    metadata: dict[str, str]  # Information dictionary entries, such as "Producer" and "Title"
+    fonts: frozenset[str]  # Base fonts of the first page, without subset prefixes
+    _page: Optional[PDFPage]
+    _first_page_text: Optional[str]
+
+    def __init__(self, io: IO[bytes]):
+        # noinspection PyTypeChecker
+        document = PDFDocument(PDFParser(io))
+        self.metadata = {}
+        for info in document.info:
+            for key, value in info.items():
+                value = resolve1(value)
+                if isinstance(value, bytes):
+                    self.metadata[key] = decode_text(value)
+                elif isinstance(value, str):
+                    self.metadata[key] = value
+        self._page = next(PDFPage.create_pages(document), None)
+        self.fonts = frozenset() if self._page is None else self._font_names(self._page)
+        self._first_page_text = None
+
+    @property
+    def first_page_text(self) -> str:
+        """The text of the first page in content stream order, as layout analysis is skipped."""
+        if self._first_page_text is None:
+            self._first_page_text = ""
+            if self._page is not None:
+                resource_manager = CachingResourceManager()
+                output = StringIO()
+                device = TextConverter(resource_manager, output, laparams=None)
+                PDFPageInterpreter(resource_manager, device).process_page(self._page)
+                device.close()
+                self._first_page_text = output.getvalue()
+        return self._first_page_text
+
+    def mentions(self, *markers: str) -> bool:
+        """Returns whether the metadata, or failing that the text of the first page, contains
+        any of the markers, ignoring case. The text is only extracted if the metadata does not
+        mention any of them."""
+        markers = tuple(marker.lower() for marker in markers)
+        metadata = " ".join(self.metadata.values()).lower()
+        if any(marker in metadata for marker in markers):
+            return True
+        text = self.first_page_text.lower()
+        return any(marker in text for marker in markers)
+
+    @staticmethod
+    def _font_names(page: PDFPage) -> frozenset[str]:
+        fonts = resolve1(page.resources.get("Font")) if page.resources else None
+        names: set[str] = set()
+        for spec in (fonts or {}).values():
+            spec = resolve1(spec)
+            base_font = resolve1(spec.get("BaseFont")) if isinstance(spec, dict) else None
+            if isinstance(base_font, PSLiteral):
+                name = base_font.name if isinstance(base_font.name, str) \
+                    else decode_text(base_font.name)
+                # Subsets of embedded fonts are named like ABCDEF+Arial
+                names.add(name.split("+", 1)[1] if name[6:7] == "+" else name)
+        return frozenset(names)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from tungsten.parsers.result_cache import MemoryTier, SqliteTier, TieredCache
+from tungsten.pictograms.pictograms import Pictogram
+
+
+@dataclass(frozen=True)
+class Recognition:
+    """Outcome of recognizing an image, where `pictogram` is None if it matched no pictogram."""
+    pictogram: Optional[Pictogram]
+
+
+class PictogramCache(TieredCache):
+    """Bounded least-recently-used store of pictogram recognitions, keyed by a hash of the image
+    (see :func:`hash_pdf_object`), so images seen before need neither decoding nor matching.
+
+    If a `path` is given, recognitions are also persisted in a SQLite database, which outlives
+    the process and can be shared between processes. The database holds up to
+    `max_persisted_entries` recognitions, evicting the least recently used ones. Safe to use
+    from multiple threads."""
+
+    def __init__(self, max_entries: int = 1024, path: Optional[str | os.PathLike] = None,
+                 max_persisted_entries: int = 65536):
+        super().__init__(MemoryTier(max_entries),
+                         *(() if path is None else (SqliteTier(path, max_persisted_entries),)))
+
+    def get(self, image_hash: str) -> Optional[Recognition]:
+        """Returns the recognition of the image, or None if it is not cached."""
+        return super().get(image_hash)
+
+    def put(self, image_hash: str, recognition: Recognition) -> None:
+        """Stores the recognition of the image, evicting the least recently used entries if the
+        cache is full."""
+        super().put(image_hash, recognition)
+
+    def __len__(self):
+        return len(self.tiers[0])
+
+
+_default_cache: Optional[PictogramCache] = None
+
+
+def default_pictogram_cache() -> PictogramCache:
+    """Returns the in-memory :class:`PictogramCache` shared by the injectors of a process that
+    are not given one."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PictogramCache()
+    return _default_cache
@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from tungsten.batch.runner import DEFAULT_FIELDS
+from tungsten.parsers.field_parse import SdsQueryFieldName
+from tungsten.parsers.sds_parser import ParseProfile
+from tungsten.parsers.supplier.sigma_aldrich.field_parse import (
+    SigmaAldrichFieldMapper
+)
+from tungsten.parsers.supplier.sigma_aldrich.sds_parser import (
+    SigmaAldrichSdsParser
+)
+
+
+class HttpError(Exception):
+    status: HTTPStatus
+    headers: dict[str, str]
+
+    def __init__(self, status: HTTPStatus, message: str,
+                 headers: Optional[dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class ParsingService:
+    """Local HTTP service that parses sheets with a pool of warm worker processes.
+
+    Each worker creates its parser and field mapper once, when it starts, so the pictogram
+    templates are loaded before the first request. Admission control keeps at most `workers`
+    requests parsing and `queue_size` requests waiting; further requests are rejected with
+    429 Too Many Requests instead of piling up.
+
+    Endpoints:
+
+    * ``POST /parse`` with a PDF as the body returns the parsed sheet, the mapped fields and the
+      seconds spent in each stage. The ``fields`` query parameter selects the mapped fields
+      (comma separated :class:`SdsQueryFieldName` names), and ``sheet=0`` omits the sheet, which
+      lets the parse skip everything those fields do not need. Stages that ran out of their
+      time budget (see :class:`ParseProfile`) are listed under ``degraded``.
+    * ``GET /health`` returns the worker and queue occupancy."""
+    host: str
+    port: int
+    workers: int
+    queue_size: int
+    max_body_size: int
+    warmup_path: Optional[str]
+    profile: ParseProfile
+    logger: logging.Logger
+    _executor: Optional[ProcessPoolExecutor]
+    _worker_slots: Optional[asyncio.Semaphore]
+    _parsing: int
+    _queued: int
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8000, workers: int = 2,
+                 queue_size: int = 8, max_body_size: int = 64 * 1024 * 1024,
+                 warmup_path: Optional[str] = None, profile: ParseProfile = ParseProfile.FULL):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_body_size = max_body_size
+        self.warmup_path = warmup_path
+        self.profile = profile
+        self.logger = logging.getLogger(f"tungsten:{self.__class__.__name__}")
+        self._executor = None
+        self._worker_slots = None
+        self._parsing = 0
+        self._queued = 0
+
+    async def serve(self) -> None:
+        """Starts the workers and serves requests until cancelled."""
+        self._worker_slots = asyncio.Semaphore(self.workers)
+        await self.start_workers()
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.logger.info(f"Listening on http://{self.host}:{self.port} with {self.workers} "
+                         f"workers and a queue of {self.queue_size}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._executor.shutdown(cancel_futures=True)
+
+    async def start_workers(self) -> None:
+        """Starts the worker processes and waits until all of them are warm."""
+        self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                             initargs=(self.warmup_path, self.profile))
+        loop = asyncio.get_running_loop()
+        start_time = time.perf_counter()
+        # Workers start on demand, so submitting one task per worker starts all of them
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _worker_ready)
+                               for _ in range(self.workers)))
+        self.logger.info(f"Started {self.workers} workers in "
+                         f"{time.perf_counter() - start_time:.2f} seconds")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter) -> None:
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await _read_request(reader, self.max_body_size)
+                except HttpError as e:
+                    await _write_response(writer, e.status, {"error": str(e)}, e.headers, False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    status, payload = await self._route(method, target, body)
+                    response_headers = {}
+                except HttpError as e:
+                    status, payload, response_headers = e.status, {"error": str(e)}, e.headers
+                await _write_response(writer, status, payload, response_headers, keep_alive)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, target: str, body: bytes) -> tuple[HTTPStatus, Any]:
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        match (method, url.path):
+            case ("GET", "/health"):
+                return HTTPStatus.OK, {"workers": self.workers, "parsing": self._parsing,
+                                       "queued": self._queued, "queue_size": self.queue_size}
+            case ("POST", "/parse"):
+                fields = _parse_fields(query.get("fields", [""])[-1])
+                include_sheet = query.get("sheet", ["1"])[-1] not in ("0", "false")
+                return HTTPStatus.OK, await self.parse(body, fields, include_sheet)
+            case (_, "/health" | "/parse"):
+                raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not allowed")
+            case _:
+                raise HttpError(HTTPStatus.NOT_FOUND, f"{url.path} not found")
+
+    async def parse(self, data: bytes, fields: tuple[SdsQueryFieldName, ...],
+                    include_sheet: bool = True) -> dict:
+        """Parses a PDF on a worker, waiting in the queue if all workers are busy."""
+        if not len(data):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Request body must be a PDF")
+        if self._worker_slots.locked() and self._queued >= self.queue_size:
+            raise HttpError(HTTPStatus.TOO_MANY_REQUESTS, "All workers and the queue are busy",
+                            {"Retry-After": "1"})
+        start_time = time.perf_counter()
+        self._queued += 1
+        try:
+            await self._worker_slots.acquire()
+        finally:
+            self._queued -= 1
+        queue_time = time.perf_counter() - start_time
+        self._parsing += 1
+        executor = self._executor
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                executor, _parse_request, data, fields, include_sheet)
+        except BrokenProcessPool:
+            # Requests running on the same pool fail together, only the first one restarts it
+            if self._executor is executor:
+                self.logger.error("A worker died, restarting the workers")
+                executor.shutdown(wait=False, cancel_futures=True)
+                await self.start_workers()
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "Worker died while parsing")
+        finally:
+            self._parsing -= 1
+            self._worker_slots.release()
+        if "error" in result:
+            raise HttpError(HTTPStatus.UNPROCESSABLE_ENTITY, result["error"])
+        result["timings"] = {"queue": queue_time, **result["timings"],
+                             "total": time.perf_counter() - start_time}
+        return result
+
+
+async def _read_request(reader: asyncio.StreamReader, max_body_size: int) -> \
+        Optional[tuple[str, str, dict[str, str], bytes]]:
+    """Reads an HTTP/1.1 request, returning None if the connection closed before one started."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not len(e.partial.strip()):
+            return None
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Incomplete request")
+    except asyncio.LimitOverrunError:
+        raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Request headers too large")
+    request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+    try:
+        method, target, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HttpError(HTTPStatus.LENGTH_REQUIRED, "Chunked requests are not supported")
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length < 0:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length > max_body_size:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                        f"Request body exceeds {max_body_size} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+async def _write_response(writer: asyncio.StreamWriter, status: HTTPStatus, payload: Any,
+                          headers: dict[str, str], keep_alive: bool) -> None:
+    body = json.dumps(payload).encode()
+    head = f"HTTP/1.1 {status.value} {status.phrase}\r\n" \
+           f"Content-Type: application/json\r\n" \
+           f"Content-Length: {len(body)}\r\n" \
+           f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+    for name, value in headers.items():
+        head += f"{name}: {value}\r\n"
+    writer.write(head.encode("latin-1") + b"\r\n" + body)
+    await writer.drain()
+
+
+def _parse_fields(value: str) -> tuple[SdsQueryFieldName, ...]:
+    if not value:
+        return DEFAULT_FIELDS
+    try:
+        return tuple(SdsQueryFieldName[name.strip().upper()] for name in value.split(","))
+    except KeyError as e:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"Unknown field {e.args[0]}")
+
+
+# Per-process state of workers, created once by _init_worker
+_worker_parser: Optional[SigmaAldrichSdsParser] = None
+_worker_field_mapper: Optional[SigmaAldrichFieldMapper] = None
+
+
+def _init_worker(warmup_path: Optional[str], profile: ParseProfile) -> None:
+    global _worker_parser, _worker_field_mapper
+    _worker_parser = SigmaAldrichSdsParser(profile=profile)
+    _worker_field_mapper = SigmaAldrichFieldMapper()
+    if warmup_path is not None:
+        # Runs every stage once, so the first request does not pay for cold caches
+        _worker_parser.parse_to_ghs_sds(warmup_path)
+
+
+def _worker_ready() -> bool:
+    return _worker_parser is not None
+
+
+def _parse_request(data: bytes, fields: tuple[SdsQueryFieldName, ...],
+                   include_sheet: bool) -> dict:
+    timings: dict[str, float] = {}
+    try:
+        # Without the sheet in the response, only the parts the fields are read from are parsed
+        parsed = _worker_parser.parse_to_ghs_sds(data, timings,
+                                                 None if include_sheet else fields)
+        start_time = time.perf_counter()
+        encoded = json.loads(parsed.dumps())
+        mapped = {}
+        for field in fields:
+            try:
+                mapped[field.name] = _worker_field_mapper.get_field(field, encoded)
+            except KeyError:
+                mapped[field.name] = None
+        timings["fields"] = time.perf_counter() - start_time
+    except Exception as e:
+        logging.getLogger("tungsten:ParsingService").debug(traceback.format_exc())
+        return {"error": f"{type(e).__name__}: {e}"}
+    result = {"fields": mapped, "timings": timings}
+    if "degraded" in parsed.meta:
+        result["degraded"] = parsed.meta["degraded"]
+    if include_sheet:
+        result["sheet"] = encoded
+    return result
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(
+        prog="python -m tungsten.server",
+        description="Serve the safety data sheet parser over HTTP on the local machine.")
+    arg_parser.add_argument("--host", default="127.0.0.1",
+                            help="address to listen on (default: 127.0.0.1)")
+    arg_parser.add_argument("--port", type=int, default=8000, help="port (default: 8000)")
+    arg_parser.add_argument("-j", "--workers", type=int, default=2,
+                            help="number of worker processes (default: 2)")
+    arg_parser.add_argument("--queue-size", type=int, default=8,
+                            help="requests that may wait for a worker before further requests "
+                                 "are rejected with 429 (default: 8)")
+    arg_parser.add_argument("--max-body-size", type=int, default=64 * 1024 * 1024,
+                            help="largest accepted PDF in bytes (default: 64 MiB)")
+    arg_parser.add_argument("--warmup", default=None,
+                            help="PDF each worker parses once at startup to warm its caches")
+    arg_parser.add_argument("--profile", choices=("fast", "balanced", "full"), default="balanced",
+                            help="time budgets of the parsing stages (default: balanced)")
+    arg_parser.add_argument("-v", "--verbose", action="store_true", help="log debug output")
+    args = arg_parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="[%(asctime)s][%(levelname)s][%(name)s] - %(message)s")
+    # The parsers log every file at INFO level, which drowns out the service logs
+    if not args.verbose:
+        for name in ("tungsten:SigmaAldrichSdsParser", "tungsten:SigmaAldrichTableInjector",
+                     "tungsten:SigmaAldrichPictogramInjector"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    service = ParsingService(args.host, args.port, workers=args.workers,
+                             queue_size=args.queue_size, max_body_size=args.max_body_size,
+                             warmup_path=args.warmup,
+                             profile=getattr(ParseProfile, args.profile.upper()))
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        pass
+    return 0